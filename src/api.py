@@ -1,25 +1,50 @@
 # src/api.py
+import asyncio
 import csv
+import hashlib
+import hmac
+import io
+import json
+import os
+import time
+import zlib
 from datetime import datetime, timezone
+from itertools import islice
 from pathlib import Path
-from threading import Lock
 from typing import Dict, List, Optional, Union
 
-import joblib
 from fastapi import FastAPI
-from fastapi import HTTPException
+from fastapi import Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 
-from catalogo_sintomas import CATALOGO_SINTOMAS
-from nlp_extractor import SintomaExtractor, _normalizar
+from cache_resultados import CacheLRU
+from catalogo_sintomas import (
+    CATALOGO_CARGA_MS,
+    CATALOGO_HUELLA,
+    CATALOGO_ORIGEN,
+    CATALOGO_SINTOMAS,
+    SINTOMA_ID,
+    SINTOMAS_POR_ID,
+)
+from memoria import AGRUPACIONES, InstantaneasMemoria, desglose as desglose_memoria, memoria_proceso
+from metricas import BUCKETS_LATENCIA_S, CONTENT_TYPE, MetricasHTTP, Registro, desglose, server_timing
+from microlotes import BUCKETS_TAMANO_LOTE, MicroLoteador
+from modelos import MOTORES_ML, RegistroModelos
+from nlp_extractor import MOTOR_POR_DEFECTO, SintomaExtractor, _normalizar
+from observaciones import OBS_FIELDS, POLITICAS_DESBORDE, _EscritorDiferido, crear_store, ruta_nodo
+from perfilado import ORDENES, PerfiladorMuestreo
+from puntuador_lineal import ruta_puntuador
+from reglas_combinacion import MotorReglas
+from ventanas import parse_ventanas
 
 
 # -------------------------------------------------
 # Inicializar extractor
 # -------------------------------------------------
-extractor = SintomaExtractor()
+EXTRACTOR_MOTOR = os.getenv("EXTRACTOR_MOTOR", MOTOR_POR_DEFECTO)
+extractor = SintomaExtractor(motor=EXTRACTOR_MOTOR)
 
 
 # -------------------------------------------------
@@ -310,231 +335,176 @@ for sintoma, categoria in categorias_override.items():
     if sintoma in categorias_map:
         categorias_map[sintoma] = categoria
 
+# Tablas indexadas por id de sintoma (posicion en el catalogo) para el request.
+PRIORIDAD_POR_ID: List[int] = [sintomas_prioridad[s] for s in SINTOMAS_POR_ID]
+CATEGORIA_POR_ID: List[str] = [categorias_map[s] for s in SINTOMAS_POR_ID]
+
 
 # -------------------------------------------------
 # Reglas de combinaciones (elevan urgencia)
 # -------------------------------------------------
 combinaciones_urgencia = [
-    {"sintomas": {"fiebre", "mareos"}, "nivel": 3},
-    {"sintomas": {"fiebre", "tos seca", "dificultad para respirar"}, "nivel": 3},
-    {"sintomas": {"presión en el pecho", "falta de aire"}, "nivel": 3},
-    {"sintomas": {"tos persistente", "fiebre", "mareos"}, "nivel": 3},
-    {"sintomas": {"dolor lumbar", "ardor al orinar"}, "nivel": 3},
-    {"sintomas": {"fiebre", "dolor de garganta", "tos persistente"}, "nivel": 3},
-    {"sintomas": {"ardor al orinar", "dolor lumbar", "fatiga"}, "nivel": 3},
-    {"sintomas": {"tos persistente", "presión en el pecho"}, "nivel": 3},
-    {"sintomas": {"palpitaciones", "falta de aire"}, "nivel": 3},
-    {"sintomas": {"sibilancias", "falta de aire"}, "nivel": 3},
+    {"id": "combo_01", "sintomas": {"fiebre", "mareos"}, "nivel": 3},
+    {"id": "combo_02", "sintomas": {"fiebre", "tos seca", "dificultad para respirar"}, "nivel": 3},
+    {"id": "combo_03", "sintomas": {"presión en el pecho", "falta de aire"}, "nivel": 3},
+    {"id": "combo_04", "sintomas": {"tos persistente", "fiebre", "mareos"}, "nivel": 3},
+    {"id": "combo_05", "sintomas": {"dolor lumbar", "ardor al orinar"}, "nivel": 3},
+    {"id": "combo_06", "sintomas": {"fiebre", "dolor de garganta", "tos persistente"}, "nivel": 3},
+    {"id": "combo_07", "sintomas": {"ardor al orinar", "dolor lumbar", "fatiga"}, "nivel": 3},
+    {"id": "combo_08", "sintomas": {"tos persistente", "presión en el pecho"}, "nivel": 3},
+    {"id": "combo_09", "sintomas": {"palpitaciones", "falta de aire"}, "nivel": 3},
+    {"id": "combo_10", "sintomas": {"sibilancias", "falta de aire"}, "nivel": 3},
 ]
 
+motor_reglas = MotorReglas(combinaciones_urgencia, SINTOMA_ID)
+# Todo lo que, ademas del texto y el modelo, decide el resultado de /analizar.
+HUELLA_REGLAS = hashlib.sha256(
+    json.dumps(
+        [CATALOGO_HUELLA, PRIORIDAD_POR_ID, CATEGORIA_POR_ID, combinaciones_urgencia, MIN_SINTOMAS_PARA_ML],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=sorted,
+    ).encode("utf-8")
+).hexdigest()[:12]
+
 
 # -------------------------------------------------
 # Cargar modelo ML para urgencia
 # -------------------------------------------------
 BASE_DIR = Path(__file__).resolve().parents[1]
-MODEL_PATH = BASE_DIR / "models" / "model_bundle.joblib"
+MODELS_DIR = BASE_DIR / "models"
+MODEL_PATH = MODELS_DIR / "model_bundle.joblib"
 FRONTEND_DIR = BASE_DIR / "frontend"
 OBSERVACIONES_CSV = BASE_DIR / "data" / "ficha_observacion.csv"
-OBS_FIELDS = [
-    "id",
-    "caso",
-    "sintomas_texto",
-    "nivel_sistema",
-    "nivel_referencia",
-    "recomendacion_sistema",
-    "recomendacion_referencia",
-    "adequacy_score",
-    "intime",
-    "outtime",
-    "wait_base_min",
-    "alarm",
-    "override",
-]
-
-
-class _ObservacionStore:
-    def __init__(self, path: Path):
-        self.path = path
-        self._lock = Lock()
-        self.last_id = 0
-        self.total_cases = 0
-        self.total_alarmas = 0
-        self.total_alarmas_injustificadas = 0
-        self.total_overrides = 0
-        self._ensure_schema()
-        self._bootstrap()
-
-    @staticmethod
-    def _to_int(value) -> int:
-        try:
-            return int(float(value))
-        except Exception:
-            return 0
-
-    @staticmethod
-    def _to_optional_int(value):
-        if value is None:
-            return None
-        s = str(value).strip()
-        if not s:
-            return None
-        try:
-            return int(float(s))
-        except Exception:
-            return None
-
-    @staticmethod
-    def _recomendacion_por_nivel(nivel: int) -> str:
-        if nivel == 3:
-            return "Acudir a emergencias inmediatamente."
-        if nivel == 2:
-            return "Buscar atencion medica en las proximas horas."
-        if nivel == 1:
-            return "Reposo y observacion."
-        return "No se detectaron sintomas, intente de nuevo."
-
-    @staticmethod
-    def _wait_base_min_por_nivel(nivel_referencia: int) -> float:
-        # Base presencial inventada para comparacion de tiempos.
-        # Menor urgencia suele esperar mas en triaje presencial.
-        tabla = {
-            0: 0.0,
-            1: 58.0,
-            2: 34.0,
-            3: 16.0,
-        }
-        return tabla.get(int(nivel_referencia), 34.0)
-
-    @classmethod
-    def _eventos_desde_fila(cls, row):
-        nivel_sistema = cls._to_optional_int(row.get("nivel_sistema"))
-        nivel_referencia = cls._to_int(row.get("nivel_referencia"))
-        alarm_event = int(
-            nivel_sistema is not None and nivel_sistema != nivel_referencia
-        )
-        override_event = 1 if cls._to_int(row.get("override")) > 0 else 0
-        alarm_unjustified_event = 1 if cls._to_int(row.get("alarm")) > 0 else int(
-            alarm_event and nivel_sistema is not None and nivel_sistema > nivel_referencia and nivel_referencia <= 2
-        )
-        return alarm_event, alarm_unjustified_event, override_event
-
-    def _bootstrap(self):
-        if not self.path.exists():
-            return
-        try:
-            with self.path.open(encoding="utf-8", newline="") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    self.total_cases += 1
-                    self.last_id = max(self.last_id, self._to_int(row.get("id")))
-                    alarm_event, alarm_unjustified_event, override_event = self._eventos_desde_fila(row)
-                    self.total_alarmas += alarm_event
-                    self.total_alarmas_injustificadas += alarm_unjustified_event
-                    self.total_overrides += override_event
-        except Exception as exc:
-            print(f"Advertencia: no se pudo leer historial de observaciones ({exc}).")
-
-    def _ensure_schema(self):
-        if not self.path.exists() or self.path.stat().st_size == 0:
-            return
-        try:
-            with self.path.open(encoding="utf-8", newline="") as f:
-                reader = csv.reader(f)
-                header = next(reader, [])
-        except Exception:
-            return
-
-        if header == OBS_FIELDS:
-            return
-
-        legacy = self.path.with_name(
-            f"{self.path.stem}_legacy_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}.csv"
-        )
-        try:
-            self.path.replace(legacy)
-            print(
-                f"Advertencia: esquema CSV antiguo detectado. "
-                f"Se movio a {legacy.name} y se inicia un CSV nuevo."
-            )
-            self.last_id = 0
-            self.total_cases = 0
-            self.total_alarmas = 0
-            self.total_alarmas_injustificadas = 0
-            self.total_overrides = 0
-        except Exception as exc:
-            print(f"Advertencia: no se pudo migrar CSV legado ({exc}).")
-
-    def append(
-        self,
-        *,
-        caso: str,
-        sintomas_texto: str,
-        nivel_sistema,
-        nivel_referencia: int,
-        recomendacion_sistema: str,
-        adequacy_score: float,
-        intime: int,
-        outtime: int,
-        urgencia_final: int,
-    ):
-        with self._lock:
-            self._ensure_schema()
-
-            alarm_event = int(
-                nivel_sistema is not None and int(nivel_sistema) != int(nivel_referencia)
-            )
-            alarm_unjustified_event = int(
-                alarm_event and nivel_sistema is not None and int(nivel_sistema) > int(nivel_referencia) and int(nivel_referencia) <= 2
-            )
-            override_event = int(
-                nivel_sistema is not None and int(nivel_sistema) < int(nivel_referencia) and int(urgencia_final) == int(nivel_referencia)
-            )
-
-            self.total_cases += 1
-            self.last_id += 1
-            self.total_alarmas += alarm_event
-            self.total_alarmas_injustificadas += alarm_unjustified_event
-            self.total_overrides += override_event
-
-            row = {
-                "id": self.last_id,
-                "caso": caso,
-                "sintomas_texto": sintomas_texto,
-                "nivel_sistema": "" if nivel_sistema is None else int(nivel_sistema),
-                "nivel_referencia": int(nivel_referencia),
-                "recomendacion_sistema": recomendacion_sistema,
-                "recomendacion_referencia": self._recomendacion_por_nivel(int(nivel_referencia)),
-                "adequacy_score": f"{float(adequacy_score):.2f}",
-                "intime": intime,
-                "outtime": outtime,
-                "wait_base_min": f"{self._wait_base_min_por_nivel(int(nivel_referencia)):.2f}",
-                "alarm": alarm_unjustified_event,
-                "override": override_event,
-            }
-
-            self.path.parent.mkdir(parents=True, exist_ok=True)
-            write_header = (not self.path.exists()) or self.path.stat().st_size == 0
-            with self.path.open("a", encoding="utf-8", newline="") as f:
-                writer = csv.DictWriter(f, fieldnames=OBS_FIELDS)
-                if write_header:
-                    writer.writeheader()
-                writer.writerow(row)
-            return row
-
-vectorizer = None
-clf = None
-
-if MODEL_PATH.exists():
+OBSERVACIONES_DB = Path(os.getenv("OBS_SQLITE_PATH", str(BASE_DIR / "data" / "ficha_observacion.sqlite3")))
+OBSERVACIONES_SEGMENTOS = Path(os.getenv("OBS_SEGMENTOS_DIR", str(BASE_DIR / "data" / "observaciones")))
+OBS_BACKEND = os.getenv("OBS_BACKEND", "csv")
+OBSERVACIONES_PATH = {
+    "sqlite": OBSERVACIONES_DB,
+    "segmentos": OBSERVACIONES_SEGMENTOS,
+}.get(OBS_BACKEND, OBSERVACIONES_CSV)
+# Varias replicas: cada una con su OBS_NODO escribe en data/nodos/nodo_NNN/
+# con ids snowflake; fusionar_observaciones.py arma el export global.
+OBS_NODO = os.getenv("OBS_NODO", "").strip()
+OBS_IDS = os.getenv("OBS_IDS", "snowflake" if OBS_NODO else "secuencial")
+if OBS_NODO:
+    OBSERVACIONES_PATH = ruta_nodo(OBSERVACIONES_PATH, int(OBS_NODO))
+# Motor de inferencia: "lineal" puntua con la tabla que exporta train.py
+# (model_scorer.json, mismas predicciones, sin importar sklearn ni joblib);
+# "sklearn" usa el bundle; "auto" usa el puntuador si corresponde al bundle
+# actual (bundle_sha256) y si no, sklearn.
+ML_MOTOR = os.getenv("ML_MOTOR", "auto").strip().lower()
+if ML_MOTOR not in MOTORES_ML:
+    raise ValueError(f"ML_MOTOR desconocido: {ML_MOTOR!r}. Opciones: {', '.join(MOTORES_ML)}")
+# Modelos versionados: /admin/modelos carga otro bundle en segundo plano y lo
+# activa de forma atomica (o vuelve al anterior). Con ML_VIGILAR_S > 0 ademas
+# se recarga MODEL_PATH cuando train.py lo reescribe.
+ML_VIGILAR_S = float(os.getenv("ML_VIGILAR_S", "0"))
+registro_modelos = RegistroModelos(motor=ML_MOTOR, max_versiones=int(os.getenv("ML_MAX_VERSIONES", "3")))
+
+_t0_modelo = time.perf_counter()
+if MODEL_PATH.exists() or ruta_puntuador(MODEL_PATH).exists():
     try:
-        bundle = joblib.load(MODEL_PATH)
-        vectorizer = bundle.get("vectorizer")
-        clf = bundle.get("clf")
+        registro_modelos.cargar(MODEL_PATH)
     except Exception as exc:
         print(f"Advertencia: no se pudo cargar modelo ML ({exc}). Se usaran reglas.")
 else:
     print("Advertencia: modelo ML no encontrado. Se usaran reglas de urgencia.")
+_modelo_carga_ms = (time.perf_counter() - _t0_modelo) * 1000
+if ML_VIGILAR_S > 0:
+    registro_modelos.vigilar(MODEL_PATH, ML_VIGILAR_S)
+
+# Inferencia ML en /analizar:
+# - "siempre": se predice antes de extraer, aunque la decision no la use.
+# - "bajo_demanda": solo cuando la decision la usa (>= MIN_SINTOMAS_PARA_ML);
+#   en el resto la observacion queda sin prediccion (nivel_sistema = final).
+# - "diferida": como bajo_demanda en el request, y la prediccion de comparacion
+#   del resto se calcula en lotes en segundo plano. La observacion se escribe
+#   en el request con nivel_sistema vacio (y su id sale en la respuesta); al
+#   tener la prediccion se completa esa fila. Necesita OBS_BACKEND=sqlite: los
+#   logs csv y por segmentos no se reescriben.
+POLITICAS_ML = ("siempre", "bajo_demanda", "diferida")
+ML_POLITICA = os.getenv("ML_POLITICA", "siempre").strip().lower()
+if ML_POLITICA not in POLITICAS_ML:
+    raise ValueError(f"ML_POLITICA desconocida: {ML_POLITICA!r}. Opciones: {', '.join(POLITICAS_ML)}")
+if ML_POLITICA == "diferida" and OBS_BACKEND != "sqlite":
+    raise ValueError("ML_POLITICA=diferida necesita OBS_BACKEND=sqlite (completa filas ya escritas).")
+ML_DIFERIDA_LOTE = int(os.getenv("ML_DIFERIDA_LOTE", "64"))
+ML_DIFERIDA_MS = float(os.getenv("ML_DIFERIDA_MS", "50"))
+# Con mas pendientes que esto se predice en el request (no se pierde el dato).
+ML_DIFERIDA_MAX_PENDIENTES = int(os.getenv("ML_DIFERIDA_MAX_PENDIENTES", "10000"))
+# Micro-lotes: la inferencia de requests concurrentes se junta hasta
+# ML_MICROLOTE_MS (0 = apagado) o ML_MICROLOTE_MAX textos y se hace en una
+# sola llamada. Rinde con el motor sklearn; el lineal ya puntua por texto.
+ML_MICROLOTE_MS = float(os.getenv("ML_MICROLOTE_MS", "0"))
+ML_MICROLOTE_MAX = int(os.getenv("ML_MICROLOTE_MAX", "32"))
+
+# Cache de resultados de /analizar por texto normalizado + HUELLA_REGLAS +
+# version del modelo activo: CACHE_RESULTADOS entradas por worker (0 =
+# apagado) y vencimiento opcional CACHE_RESULTADOS_TTL_S (0 = sin vencimiento).
+# Solo guarda la parte deterministica: cada request igual registra su
+# observacion. Se vacia al activar otro modelo.
+CACHE_RESULTADOS = int(os.getenv("CACHE_RESULTADOS", "2048"))
+CACHE_RESULTADOS_TTL_S = float(os.getenv("CACHE_RESULTADOS_TTL_S", "0"))
+if CACHE_RESULTADOS < 0 or CACHE_RESULTADOS_TTL_S < 0:
+    raise ValueError("CACHE_RESULTADOS y CACHE_RESULTADOS_TTL_S no pueden ser negativos.")
+cache_resultados = CacheLRU(CACHE_RESULTADOS, CACHE_RESULTADOS_TTL_S) if CACHE_RESULTADOS > 0 else None
+if cache_resultados is not None:
+    registro_modelos.al_activar(lambda modelo: cache_resultados.limpiar())
+
+# Tiempos de arranque del worker (ms), expuestos en /health.
+ARRANQUE = {
+    "catalogo_origen": CATALOGO_ORIGEN,
+    "catalogo_ms": round(CATALOGO_CARGA_MS, 2),
+    "extractor_origen": extractor.origen,
+    "extractor_ms": round(extractor.construccion_ms, 2),
+    "modelo_ms": round(_modelo_carga_ms, 2),
+}
 
-observacion_store = _ObservacionStore(OBSERVACIONES_CSV)
+_opciones_store = {
+    "modo_escritura": os.getenv("OBS_ESCRITURA", "sync"),
+    "buffer_filas": int(os.getenv("OBS_BUFFER_FILAS", "256")),
+    "buffer_ms": float(os.getenv("OBS_BUFFER_MS", "200")),
+    "fsync": os.getenv("OBS_FSYNC", "nunca"),
+    "fsync_intervalo_s": float(os.getenv("OBS_FSYNC_INTERVALO_S", "1.0")),
+    "max_suscriptores": int(os.getenv("OBS_STREAM_MAX_SUSCRIPTORES", "100")),
+    # Varios workers (uvicorn --workers N) sobre el mismo store: ids y
+    # contadores se coordinan con un archivo de estado bloqueado con flock.
+    "multiproceso": os.getenv(
+        "OBS_MULTIPROCESO", "1" if int(os.getenv("WEB_CONCURRENCY", "1") or 1) > 1 else "0"
+    ).strip() not in {"", "0"},
+    "sondeo_ms": float(os.getenv("OBS_SONDEO_MS", "250")),
+    "ids": OBS_IDS,
+    "nodo": int(OBS_NODO or 0),
+    # Ventanas deslizantes de /observaciones ("5m,1h"; vacio = sin ventanas).
+    "ventanas_s": parse_ventanas(os.getenv("OBS_VENTANAS", "5m,1h,24h")),
+    "ventanas_buckets": int(os.getenv("OBS_VENTANAS_BUCKETS", "60")),
+}
+if OBS_BACKEND == "csv":
+    # Filas entre checkpoints de contadores (0 = siempre releer el CSV completo).
+    _opciones_store["checkpoint_filas"] = int(os.getenv("OBS_CHECKPOINT_FILAS", "1000"))
+elif OBS_BACKEND == "segmentos":
+    # Retencion: 0 = sin limite.
+    _opciones_store["segmento_max_bytes"] = int(float(os.getenv("OBS_SEGMENTO_MB", "64")) * 1024 * 1024)
+    _opciones_store["retencion_dias"] = float(os.getenv("OBS_RETENCION_DIAS", "0"))
+    _opciones_store["retencion_bytes"] = int(float(os.getenv("OBS_RETENCION_MB", "0")) * 1024 * 1024)
+    _opciones_store["compactar"] = os.getenv("OBS_COMPACTAR", "1").strip() not in {"", "0"}
+observacion_store = crear_store(OBS_BACKEND, OBSERVACIONES_PATH, **_opciones_store)
+ARRANQUE["observaciones_origen"] = observacion_store.origen_contadores
+ARRANQUE["observaciones_ms"] = round(observacion_store.apertura_ms, 2)
+ARRANQUE["observaciones_filas_releidas"] = observacion_store.filas_releidas
+
+# Feed de cambios: filas en cola por suscriptor, que hacer si se llena
+# (descartar | desconectar) y cada cuanto mandar un latido si no hay novedades.
+STREAM_BUFFER_FILAS = int(os.getenv("OBS_STREAM_BUFFER", "1000"))
+STREAM_POLITICA = os.getenv("OBS_STREAM_POLITICA", "descartar")
+STREAM_LATIDO_S = float(os.getenv("OBS_STREAM_LATIDO_S", "15"))
+STREAM_RETRY_MS = 3000
+if STREAM_POLITICA not in POLITICAS_DESBORDE:
+    raise ValueError(
+        f"OBS_STREAM_POLITICA desconocida: {STREAM_POLITICA!r}. "
+        f"Opciones: {', '.join(POLITICAS_DESBORDE)}"
+    )
 
 
 # -------------------------------------------------
@@ -550,6 +520,122 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Metricas Prometheus en /metrics (por proceso: con varios workers cada uno
+# expone las suyas).
+registro_metricas = Registro()
+METRICA_REQUESTS = registro_metricas.contador(
+    "triaje_http_requests_total", "Requests HTTP por endpoint, metodo y estado.", ("endpoint", "metodo", "estado")
+)
+METRICA_ERRORES = registro_metricas.contador(
+    "triaje_errores_total", "Errores por origen (endpoint o etapa) y tipo.", ("origen", "tipo")
+)
+METRICA_LATENCIA_HTTP = registro_metricas.histograma(
+    "triaje_http_latencia_segundos", "Latencia de cada request por endpoint.", ("endpoint",)
+)
+METRICA_ETAPAS = registro_metricas.histograma(
+    "triaje_etapa_latencia_segundos",
+    "Latencia por etapa del pipeline de /analizar (extraccion incluye negacion).",
+    ("etapa",),
+)
+METRICA_ML_LOTE = registro_metricas.histograma(
+    "triaje_ml_lote_tamano", "Textos por lote de inferencia ML (micro-lotes).", buckets=BUCKETS_TAMANO_LOTE
+)
+METRICA_ML_ESPERA = registro_metricas.histograma(
+    "triaje_ml_lote_espera_segundos",
+    "Espera en cola de cada texto hasta que se despacha su micro-lote.",
+    buckets=BUCKETS_LATENCIA_S,
+)
+METRICA_CACHE = registro_metricas.contador(
+    "triaje_cache_resultados_total", "Consultas al cache de resultados de /analizar.", ("resultado",)
+)
+ETAPAS_ANALIZAR = ("normalizar", "cache", "ml", "extraccion", "negacion", "reglas", "observacion")
+# Desglose por request (header Server-Timing + campo debug_timing): "pedido"
+# solo si el cliente manda X-Debug-Timing: 1, "siempre" o "nunca".
+MODOS_TIMING = ("nunca", "pedido", "siempre")
+ANALIZAR_TIMING = os.getenv("ANALIZAR_TIMING", "pedido").strip().lower()
+if ANALIZAR_TIMING not in MODOS_TIMING:
+    raise ValueError(
+        f"ANALIZAR_TIMING desconocido: {ANALIZAR_TIMING!r}. Opciones: {', '.join(MODOS_TIMING)}"
+    )
+registro_metricas.medidor(
+    "triaje_observaciones_total", "Observaciones registradas.",
+    lambda: observacion_store.resumen()["observations_total"],
+)
+registro_metricas.medidor(
+    "triaje_observaciones_bytes", "Tamano del log de observaciones en disco.",
+    lambda: observacion_store.tamano_en_disco(),
+)
+registro_metricas.medidor(
+    "triaje_observaciones_pendientes", "Observaciones en el buffer sin escribir.",
+    lambda: observacion_store.pendientes,
+)
+registro_metricas.medidor(
+    "triaje_observaciones_suscriptores", "Suscriptores del flujo de cambios.",
+    lambda: len(observacion_store.cambios),
+)
+registro_metricas.medidor(
+    "triaje_modelo_cargado", "1 si el modelo ML esta cargado.", lambda: int(_ml_disponible())
+)
+registro_metricas.medidor(
+    "triaje_modelo_carga_segundos", "Tiempo de carga del modelo ML activo.",
+    lambda: registro_modelos.activo.carga_ms / 1000 if registro_modelos.activo is not None else 0,
+)
+registro_metricas.medidor(
+    "triaje_modelo_info", "Version y motor del modelo ML activo.",
+    lambda: {(m.version, m.motor): 1 for m in [registro_modelos.activo] if m is not None},
+    ("version", "motor"),
+)
+registro_metricas.medidor(
+    "triaje_info", "Version y configuracion del worker.",
+    lambda: {(app.version, extractor.motor, observacion_store.backend): 1},
+    ("version", "extractor_motor", "observacion_backend"),
+)
+registro_metricas.medidor(
+    "triaje_proceso_rss_bytes", "Memoria residente del worker.", lambda: memoria_proceso().get("rss_bytes", 0)
+)
+registro_metricas.medidor(
+    "triaje_cache_resultados_entradas", "Entradas en el cache de resultados de /analizar.",
+    lambda: len(cache_resultados) if cache_resultados is not None else 0,
+)
+registro_metricas.medidor(
+    "triaje_ml_diferidas_pendientes", "Observaciones esperando la prediccion ML diferida.",
+    lambda: cola_ml_diferida.pendientes if cola_ml_diferida is not None else 0,
+)
+app.add_middleware(
+    MetricasHTTP,
+    requests=METRICA_REQUESTS,
+    errores=METRICA_ERRORES,
+    latencia=METRICA_LATENCIA_HTTP,
+)
+# Endpoints /admin/*: solo existen si se configura ADMIN_TOKEN y se llaman con
+# el header X-Admin-Token.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "").strip()
+perfilador = PerfiladorMuestreo()
+instantaneas_memoria = InstantaneasMemoria()
+
+
+# Lo que cada worker tiene en memoria, en orden: lo compartido se cuenta en el
+# primer componente que lo referencia.
+def componentes_memoria():
+    return {
+        "catalogo": (CATALOGO_SINTOMAS, SINTOMA_ID, SINTOMAS_POR_ID),
+        "extractor": extractor,
+        "reglas": (motor_reglas, sintomas_prioridad, categorias_map),
+        "modelos": registro_modelos,
+        "cache_resultados": cache_resultados,
+        "observaciones": observacion_store,
+        "perfilador": perfilador,
+        "metricas": registro_metricas,
+    }
+
+
+@app.on_event("shutdown")
+def _cerrar_observaciones():
+    # Primero las predicciones ML diferidas pendientes, que completan filas del store.
+    if cola_ml_diferida is not None:
+        cola_ml_diferida.cerrar()
+    observacion_store.cerrar()
+
 
 class TriageRequest(BaseModel):
     texto_paciente: Optional[str] = None
@@ -618,6 +704,7 @@ def _registrar_ficha_observacion(
     urgencia_reglas: int,
     urgencia_final: int,
     recomendacion: str,
+    ml_pendiente: bool = False,
 ):
     intime = float(req.intime) if req.intime is not None else _ahora_min()
     outtime = _ahora_min()
@@ -625,18 +712,139 @@ def _registrar_ficha_observacion(
     caso = (req.caso or texto_original or "").strip()
     sintomas_texto = ";".join(sintomas)
     nivel_sistema = urgencia_ml if urgencia_ml is not None else urgencia_final
+    if ml_pendiente:
+        # Lo completa la cola ML diferida (observacion_store.completar).
+        nivel_sistema = None
+
+    with METRICA_ETAPAS.medir("observacion"):
+        return observacion_store.append(
+            caso=caso,
+            sintomas_texto=sintomas_texto,
+            nivel_sistema=nivel_sistema,
+            nivel_referencia=urgencia_reglas,
+            recomendacion_sistema=recomendacion,
+            adequacy_score=adequacy,
+            intime=intime,
+            outtime=outtime,
+            urgencia_final=urgencia_final,
+            urgencia_ml=urgencia_ml,
+        )
+
+
+def _ml_disponible() -> bool:
+    return registro_modelos.activo is not None
+
 
-    return observacion_store.append(
-        caso=caso,
-        sintomas_texto=sintomas_texto,
-        nivel_sistema=nivel_sistema,
-        nivel_referencia=urgencia_reglas,
-        recomendacion_sistema=recomendacion,
-        adequacy_score=adequacy,
-        intime=intime,
-        outtime=outtime,
-        urgencia_final=urgencia_final,
+def _predecir_textos(textos):
+    # Una sola lectura de `activo`: todo el lote usa la misma version aunque
+    # se active otra en el medio.
+    return registro_modelos.activo.predecir_lote(textos)
+
+
+microlotes_ml = (
+    MicroLoteador(
+        _predecir_textos,
+        max_lote=ML_MICROLOTE_MAX,
+        max_espera_s=ML_MICROLOTE_MS / 1000,
+        histograma_lote=METRICA_ML_LOTE,
+        histograma_espera=METRICA_ML_ESPERA,
+        nombre="ml-microlotes",
     )
+    if ML_MICROLOTE_MS > 0
+    else None
+)
+
+
+@app.on_event("shutdown")
+def _cerrar_ml():
+    if microlotes_ml is not None:
+        microlotes_ml.cerrar()
+    registro_modelos.cerrar()
+
+
+def _predecir_ml(texto: str):
+    if not _ml_disponible():
+        return None
+    with METRICA_ETAPAS.medir("ml"):
+        try:
+            if microlotes_ml is not None:
+                return microlotes_ml.resolver(texto)
+            return _predecir_textos([texto])[0]
+        except Exception as exc:
+            METRICA_ERRORES.inc("ml", type(exc).__name__)
+            print(f"Advertencia: fallo inferencia ML ({exc}).")
+            return None
+
+
+def _registrar_diferidas(lote):
+    # Un transform/predict por lote y un solo completar para todas las filas.
+    # Si falla el ML queda nivel_sistema = urgencia final, como en el request;
+    # si falla el store, _EscritorDiferido reintenta el lote.
+    predicciones = [None] * len(lote)
+    with METRICA_ETAPAS.medir("ml_diferida"):
+        try:
+            predicciones = _predecir_textos([texto for texto, _ in lote])
+        except Exception as exc:
+            METRICA_ERRORES.inc("ml", type(exc).__name__)
+            print(f"Advertencia: fallo inferencia ML diferida de {len(lote)} textos ({exc}).")
+    completados = [
+        dict(
+            pendiente,
+            nivel_sistema=urgencia_ml if urgencia_ml is not None else pendiente["urgencia_final"],
+            urgencia_ml=urgencia_ml,
+        )
+        for (_, pendiente), urgencia_ml in zip(lote, predicciones)
+    ]
+    try:
+        observacion_store.completar(completados)
+    except Exception as exc:
+        METRICA_ERRORES.inc("observacion", type(exc).__name__)
+        raise
+
+
+cola_ml_diferida = (
+    _EscritorDiferido(
+        _registrar_diferidas,
+        max_filas=ML_DIFERIDA_LOTE,
+        max_espera_s=ML_DIFERIDA_MS / 1000,
+        nombre="ml-diferida",
+    )
+    if ML_POLITICA == "diferida"
+    else None
+)
+
+
+def _vaciar_observaciones():
+    # Antes de exportar o agregar: primero las predicciones ML pendientes
+    # (completan filas ya escritas), despues el buffer del store.
+    if cola_ml_diferida is not None:
+        cola_ml_diferida.vaciar()
+    observacion_store.vaciar()
+
+
+def _registrar_ficha(texto: str, urgencia_ml, ml_evaluado: bool, **ficha):
+    if (
+        not ml_evaluado
+        and cola_ml_diferida is not None
+        and _ml_disponible()
+        and cola_ml_diferida.pendientes < ML_DIFERIDA_MAX_PENDIENTES
+    ):
+        # La fila queda escrita ya (sin nivel_sistema); la cola la completa.
+        row = _registrar_ficha_observacion(urgencia_ml=None, ml_pendiente=True, **ficha)
+        cola_ml_diferida.encolar(
+            (
+                texto,
+                {
+                    "id": row["id"],
+                    "nivel_referencia": ficha["urgencia_reglas"],
+                    "urgencia_final": ficha["urgencia_final"],
+                },
+            )
+        )
+        return row
+    if not ml_evaluado and ML_POLITICA == "diferida":
+        urgencia_ml = _predecir_ml(texto)
+    return _registrar_ficha_observacion(urgencia_ml=urgencia_ml, **ficha)
 
 
 def _respuesta_sin_sintomas(mensaje: str):
@@ -646,8 +854,9 @@ def _respuesta_sin_sintomas(mensaje: str):
         "prioridades": {},
         "overall_urgency": 0,
         "rule_based_urgency": 0,
+        "combination_rules_fired": [],
         "recommended_action": mensaje,
-        "ml_enabled": bool(vectorizer and clf),
+        "ml_enabled": _ml_disponible(),
         "ml_predicted_urgency": None,
         "ml_used": False,
         "urgency_source": "none",
@@ -659,20 +868,75 @@ def health():
     return {
         "status": "ok",
         "sintomas_registrados": len(sintomas_prioridad),
-        "ml_enabled": bool(vectorizer and clf),
+        "extractor_motor": extractor.motor,
+        "ml_enabled": _ml_disponible(),
         "ml_min_sintomas": MIN_SINTOMAS_PARA_ML,
-        "model_path": str(MODEL_PATH),
-        "observation_csv": str(OBSERVACIONES_CSV),
-        "observations_total": observacion_store.total_cases,
+        "ml_policy": ML_POLITICA,
+        "ml_engine": registro_modelos.activo.motor if registro_modelos.activo is not None else None,
+        "model": registro_modelos.activo.info() if registro_modelos.activo is not None else None,
+        "ml_deferred_pending": cola_ml_diferida.pendientes if cola_ml_diferida is not None else 0,
+        "ml_microbatch_ms": ML_MICROLOTE_MS if microlotes_ml is not None else 0,
+        "model_path": registro_modelos.activo.path if registro_modelos.activo is not None else str(MODEL_PATH),
+        "result_cache": cache_resultados.estado() if cache_resultados is not None else None,
+        "observation_csv": str(OBSERVACIONES_PATH),
+        "observations_total": observacion_store.resumen()["observations_total"],
+        "observation_backend": observacion_store.backend,
+        "observation_write_mode": observacion_store.modo_escritura,
+        "observation_ids": observacion_store.ids,
+        "observation_node": observacion_store.nodo,
+        "observations_pending": observacion_store.pendientes,
+        "observation_subscribers": len(observacion_store.cambios),
+        "startup_ms": ARRANQUE,
     }
 
 
-@app.post("/analizar")
-def analizar(req: TriageRequest):
-    texto_original = req.texto_paciente or ""
-    texto = _normalizar(texto_original)
+# Funcion comun (tambien la llaman validate_regression.py y memoria.py):
+# el header X-Debug-Timing solo se declara en la ruta, abajo en analizar_api.
+def analizar(
+    req: TriageRequest,
+    response: Optional[Response] = None,
+    x_debug_timing: Optional[str] = None,
+):
+    # Perfilado por muestreo (/admin/perfilado); apagado es leer un atributo.
+    if perfilador.activo:
+        return perfilador.perfilar(_analizar_con_timing, req, response, x_debug_timing)
+    return _analizar_con_timing(req, response, x_debug_timing)
+
+
+def _analizar_con_timing(req: TriageRequest, response: Optional[Response], x_debug_timing: Optional[str]):
+    if not _timing_pedido(x_debug_timing):
+        return _analizar(req)
+    # Mismos cronometros que alimentan /metrics, acumulados para este request.
+    t0 = time.perf_counter()
+    with desglose() as etapas:
+        resultado = _analizar(req)
+    total_s = time.perf_counter() - t0
+    # "extraccion" incluye la negacion; en el desglose se muestran separadas.
+    if "negacion" in etapas and "extraccion" in etapas:
+        etapas["extraccion"] -= etapas["negacion"]
+    etapas = {etapa: etapas[etapa] for etapa in ETAPAS_ANALIZAR if etapa in etapas}
+    if response is not None:
+        response.headers["Server-Timing"] = server_timing(etapas, total_s)
+    resultado["debug_timing"] = {
+        "etapas_ms": {etapa: round(s * 1000, 3) for etapa, s in etapas.items()},
+        "total_ms": round(total_s * 1000, 3),
+    }
+    return resultado
 
-    # Defaults para salida y ficha de observacion
+
+def _timing_pedido(x_debug_timing: Optional[str]) -> bool:
+    if ANALIZAR_TIMING == "siempre":
+        return True
+    if ANALIZAR_TIMING == "nunca":
+        return False
+    if not isinstance(x_debug_timing, str):
+        return False
+    return x_debug_timing.strip().lower() in {"1", "true", "si"}
+
+
+def _evaluar(texto: str):
+    # Parte deterministica de /analizar: depende solo del texto normalizado,
+    # de HUELLA_REGLAS y del modelo activo. Devuelve (resultado, ml_evaluado).
     all_sintomas: List[str] = []
     categorias: Dict[str, List[str]] = {}
     prioridades: Dict[str, int] = {}
@@ -681,66 +945,38 @@ def analizar(req: TriageRequest):
     urgencia_ml = None
     ml_used = False
     urgency_source = "none"
+    reglas_activadas: List[str] = []
     recomendacion = "No se detectaron sintomas, intente de nuevo."
 
-    if not texto:
-        ficha = _registrar_ficha_observacion(
-            req=req,
-            texto_original=texto_original,
-            sintomas=all_sintomas,
-            urgencia_ml=urgencia_ml,
-            urgencia_reglas=urgencia_reglas,
-            urgencia_final=urgencia,
-            recomendacion=recomendacion,
-        )
-        return {
-            "sintomas": [],
-            "categorias": {},
-            "prioridades": {},
-            "overall_urgency": 0,
-            "rule_based_urgency": 0,
-            "recommended_action": recomendacion,
-            "ml_enabled": bool(vectorizer and clf),
-            "ml_predicted_urgency": None,
-            "ml_used": False,
-            "urgency_source": "none",
-            "observation_id": ficha["id"],
-            "observation_csv": str(OBSERVACIONES_CSV),
-        }
-
-    # Prediccion ML siempre que el modelo este disponible (para comparacion).
-    if vectorizer is not None and clf is not None:
-        try:
-            x_vec = vectorizer.transform([texto])
-            urgencia_ml = int(clf.predict(x_vec)[0])
-        except Exception as exc:
-            print(f"Advertencia: fallo inferencia ML ({exc}).")
+    ml_evaluado = ML_POLITICA == "siempre"
+    if ml_evaluado:
+        urgencia_ml = _predecir_ml(texto)
 
-    sintomas_detectados = extractor.extraer(texto)
-    vistos = set()
-    for s in sintomas_detectados:
-        if s in sintomas_prioridad and s not in vistos:
-            vistos.add(s)
-            all_sintomas.append(s)
+    with METRICA_ETAPAS.medir("extraccion"):
+        mascara = extractor.extraer_mascara(texto, medir=METRICA_ETAPAS.medir)
+        ids_sintomas = extractor.ids_de_mascara(mascara)
+        all_sintomas = [SINTOMAS_POR_ID[i] for i in ids_sintomas]
 
     if all_sintomas:
-        for s in all_sintomas:
-            categoria = categorias_map.get(s, "General")
-            categorias.setdefault(categoria, []).append(s)
+        for i in ids_sintomas:
+            categorias.setdefault(CATEGORIA_POR_ID[i], []).append(SINTOMAS_POR_ID[i])
 
-        prioridades = {s: sintomas_prioridad.get(s, 1) for s in all_sintomas}
-        urgencia_reglas = max(prioridades.values(), default=1)
+        prioridades = {SINTOMAS_POR_ID[i]: PRIORIDAD_POR_ID[i] for i in ids_sintomas}
+        urgencia_reglas = max(PRIORIDAD_POR_ID[i] for i in ids_sintomas)
 
-        set_sintomas = set(all_sintomas)
-        for combo in combinaciones_urgencia:
-            if combo["sintomas"].issubset(set_sintomas):
-                urgencia_reglas = max(urgencia_reglas, combo["nivel"])
+        with METRICA_ETAPAS.medir("reglas"):
+            nivel_combinacion, reglas_activadas = motor_reglas.evaluar(mascara)
+        urgencia_reglas = max(urgencia_reglas, nivel_combinacion)
 
         urgencia = urgencia_reglas
         urgency_source = "reglas"
 
         # Politica: decision final usa ML solo si hay >= MIN_SINTOMAS_PARA_ML.
-        if urgencia_ml is not None and len(all_sintomas) >= MIN_SINTOMAS_PARA_ML:
+        usa_ml = len(all_sintomas) >= MIN_SINTOMAS_PARA_ML
+        if usa_ml and not ml_evaluado:
+            urgencia_ml = _predecir_ml(texto)
+            ml_evaluado = True
+        if urgencia_ml is not None and usa_ml:
             urgencia = max(urgencia_reglas, urgencia_ml)
             ml_used = True
             urgency_source = "ml+reglas" if urgencia_ml != urgencia_reglas else "reglas=ml"
@@ -752,85 +988,827 @@ def analizar(req: TriageRequest):
         else:
             recomendacion = "Reposo y observacion."
 
-    ficha = _registrar_ficha_observacion(
-        req=req,
-        texto_original=texto_original,
-        sintomas=all_sintomas,
-        urgencia_ml=urgencia_ml,
-        urgencia_reglas=urgencia_reglas,
-        urgencia_final=urgencia,
-        recomendacion=recomendacion,
-    )
-
-    return {
+    resultado = {
         "sintomas": all_sintomas,
         "categorias": categorias,
         "prioridades": prioridades,
         "overall_urgency": urgencia,
         "rule_based_urgency": urgencia_reglas,
+        "combination_rules_fired": reglas_activadas,
         "recommended_action": recomendacion,
-        "ml_enabled": bool(vectorizer and clf),
         "ml_predicted_urgency": urgencia_ml,
         "ml_used": ml_used,
         "urgency_source": urgency_source,
+    }
+    return resultado, ml_evaluado
+
+
+def _analizar(req: TriageRequest):
+    texto_original = req.texto_paciente or ""
+    with METRICA_ETAPAS.medir("normalizar"):
+        texto = _normalizar(texto_original)
+
+    if not texto:
+        recomendacion = "No se detectaron sintomas, intente de nuevo."
+        ficha = _registrar_ficha_observacion(
+            req=req,
+            texto_original=texto_original,
+            sintomas=[],
+            urgencia_ml=None,
+            urgencia_reglas=0,
+            urgencia_final=0,
+            recomendacion=recomendacion,
+        )
+        return {
+            "sintomas": [],
+            "categorias": {},
+            "prioridades": {},
+            "overall_urgency": 0,
+            "rule_based_urgency": 0,
+            "combination_rules_fired": [],
+            "recommended_action": recomendacion,
+            "ml_enabled": _ml_disponible(),
+            "ml_predicted_urgency": None,
+            "ml_used": False,
+            "urgency_source": "none",
+            "observation_id": ficha["id"],
+            "observation_csv": str(OBSERVACIONES_PATH),
+        }
+
+    evaluado = None
+    if cache_resultados is not None:
+        clave = (texto, HUELLA_REGLAS, registro_modelos.version)
+        with METRICA_ETAPAS.medir("cache"):
+            evaluado = cache_resultados.obtener(clave)
+        METRICA_CACHE.inc("acierto" if evaluado is not None else "fallo")
+    if evaluado is None:
+        evaluado = _evaluar(texto)
+        resultado, ml_evaluado = evaluado
+        # Una inferencia ML que fallo (None con modelo cargado) no se guarda.
+        fallo_ml = ml_evaluado and resultado["ml_predicted_urgency"] is None and _ml_disponible()
+        if cache_resultados is not None and not fallo_ml:
+            cache_resultados.guardar(clave, evaluado)
+    resultado, ml_evaluado = evaluado
+
+    ficha = _registrar_ficha(
+        texto,
+        resultado["ml_predicted_urgency"],
+        ml_evaluado,
+        req=req,
+        texto_original=texto_original,
+        sintomas=resultado["sintomas"],
+        urgencia_reglas=resultado["rule_based_urgency"],
+        urgencia_final=resultado["overall_urgency"],
+        recomendacion=resultado["recommended_action"],
+    )
+
+    # Dict nuevo por request: la entrada del cache no se modifica.
+    return {
+        "sintomas": resultado["sintomas"],
+        "categorias": resultado["categorias"],
+        "prioridades": resultado["prioridades"],
+        "overall_urgency": resultado["overall_urgency"],
+        "rule_based_urgency": resultado["rule_based_urgency"],
+        "combination_rules_fired": resultado["combination_rules_fired"],
+        "recommended_action": resultado["recommended_action"],
+        "ml_enabled": _ml_disponible(),
+        "ml_predicted_urgency": resultado["ml_predicted_urgency"],
+        "ml_used": resultado["ml_used"],
+        "urgency_source": resultado["urgency_source"],
         "observation_id": ficha["id"],
-        "observation_csv": str(OBSERVACIONES_CSV),
+        "observation_csv": str(OBSERVACIONES_PATH),
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(content=registro_metricas.exponer(), media_type=CONTENT_TYPE)
+
+
 @app.get("/api/health", include_in_schema=False)
 def health_api():
     return health()
 
 
+@app.post("/analizar")
 @app.post("/api/analizar", include_in_schema=False)
-def analizar_api(req: TriageRequest):
-    return analizar(req)
+def analizar_api(
+    req: TriageRequest,
+    response: Response = None,
+    x_debug_timing: Optional[str] = Header(None),
+):
+    return analizar(req, response, x_debug_timing)
 
 
-@app.get("/observaciones")
-def observaciones_estado():
+@app.get("/api/metrics", include_in_schema=False)
+def metrics_api():
+    return metrics()
+
+
+def _minutos_desde_param(value):
+    if value is None or not str(value).strip():
+        return None
+    return _parse_epoch_ms(value) / 60000
+
+
+EXPORT_BLOQUE_BYTES = 64 * 1024
+EXPORT_FORMATOS = {
+    "csv": ("text/csv", "ficha_observacion.csv"),
+    "jsonl": ("application/x-ndjson", "ficha_observacion.jsonl"),
+}
+_CAMPOS_ENTEROS = {"id", "nivel_referencia", "alarm", "override"}
+_CAMPOS_DECIMALES = {"adequacy_score", "intime", "outtime", "wait_base_min"}
+
+
+def _fila_tipada(row):
+    # Los backends de texto devuelven todo como str; en JSON Lines van tipados.
+    tipada = {}
+    for campo in OBS_FIELDS:
+        valor = row.get(campo)
+        try:
+            if campo == "nivel_sistema":
+                valor = None if valor in (None, "") else int(valor)
+            elif campo in _CAMPOS_ENTEROS:
+                valor = int(valor)
+            elif campo in _CAMPOS_DECIMALES:
+                valor = float(valor)
+        except (TypeError, ValueError):
+            pass
+        tipada[campo] = valor
+    return tipada
+
+
+def _serializar_filas(filas, formato: str):
+    buffer = io.StringIO()
+    if formato == "csv":
+        writer = csv.DictWriter(buffer, fieldnames=OBS_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+    for row in filas:
+        if formato == "csv":
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(_fila_tipada(row), ensure_ascii=False))
+            buffer.write("\n")
+        if buffer.tell() >= EXPORT_BLOQUE_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate(0)
+    resto = buffer.getvalue()
+    if resto:
+        yield resto.encode("utf-8")
+
+
+def _bloques_archivo(path: Path, inicio: int, fin: int):
+    with path.open("rb") as f:
+        f.seek(inicio)
+        restante = fin - inicio
+        while restante > 0:
+            bloque = f.read(min(EXPORT_BLOQUE_BYTES, restante))
+            if not bloque:
+                return
+            restante -= len(bloque)
+            yield bloque
+
+
+def _gzip_en_bloques(bloques):
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for bloque in bloques:
+        comprimido = compresor.compress(bloque)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+
+def _acepta_gzip(accept_encoding: Optional[str]) -> bool:
+    for parte in (accept_encoding or "").split(","):
+        nombre, _, params = parte.partition(";")
+        if nombre.strip().lower() not in {"gzip", "*"}:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            clave, _, valor = param.partition("=")
+            if clave.strip().lower() == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        return q > 0
+    return False
+
+
+def _etag_coincide(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match usa comparacion debil: se ignora el prefijo W/.
+    if not if_none_match:
+        return False
+    candidatos = {c.strip().removeprefix("W/") for c in if_none_match.split(",")}
+    return "*" in candidatos or etag.removeprefix("W/") in candidatos
+
+
+def _parse_rango(range_header: Optional[str], total: int):
+    # Un solo rango "bytes=a-b", "bytes=a-" o "bytes=-n". None si no aplica.
+    if not range_header or not range_header.strip().lower().startswith("bytes="):
+        return None
+    spec = range_header.strip()[len("bytes="):]
+    if "," in spec:
+        return None
+    inicio_txt, _, fin_txt = spec.strip().partition("-")
+    try:
+        if not inicio_txt.strip():
+            n = int(fin_txt)
+            if n <= 0:
+                return "invalido"
+            return max(0, total - n), total - 1
+        inicio = int(inicio_txt)
+        fin = int(fin_txt) if fin_txt.strip() else total - 1
+    except ValueError:
+        return None
+    if inicio >= total or fin < inicio:
+        return "invalido"
+    return inicio, min(fin, total - 1)
+
+
+def _exportar_observaciones(
+    formato: str,
+    since_id: Optional[int],
+    until_id: Optional[int],
+    desde: Optional[str],
+    hasta: Optional[str],
+    limit: Optional[int],
+    tail: Optional[int],
+    accept_encoding: Optional[str],
+    if_none_match: Optional[str],
+    range_header: Optional[str],
+):
+    if (limit is not None and limit < 0) or (tail is not None and tail < 0):
+        raise HTTPException(status_code=400, detail="limit y tail deben ser >= 0.")
+    ventana_desde = _minutos_desde_param(desde)
+    ventana_hasta = _minutos_desde_param(hasta)
+
+    _vaciar_observaciones()
+    if not observacion_store.existe():
+        raise HTTPException(status_code=404, detail="CSV de observaciones aun no creado.")
+
+    filtros = (since_id, until_id, ventana_desde, ventana_hasta, limit, tail)
+    huella = f"{formato}|{filtros}|{observacion_store.version()}"
+    etag = f'W/"{hashlib.sha1(huella.encode("utf-8")).hexdigest()[:20]}"'
+    media_type, filename = EXPORT_FORMATOS[formato]
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+    if _etag_coincide(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    # Export completo del backend CSV: el archivo ya es la representacion, se
+    # sirve directo y admite rangos (p. ej. para retomar una descarga).
+    if formato == "csv" and observacion_store.backend == "csv" and all(f is None for f in filtros):
+        total = observacion_store.bytes_escritos()
+        headers["Accept-Ranges"] = "bytes"
+        rango = _parse_rango(range_header, total)
+        if rango == "invalido":
+            headers["Content-Range"] = f"bytes */{total}"
+            return Response(status_code=416, headers=headers)
+        if rango is not None:
+            inicio, fin = rango
+            headers["Content-Range"] = f"bytes {inicio}-{fin}/{total}"
+            headers["Content-Length"] = str(fin - inicio + 1)
+            return StreamingResponse(
+                _bloques_archivo(observacion_store.path, inicio, fin + 1),
+                status_code=206,
+                media_type=media_type,
+                headers=headers,
+            )
+        bloques = _bloques_archivo(observacion_store.path, 0, total)
+    else:
+        headers["Accept-Ranges"] = "none"
+        filas = observacion_store.exportar(
+            desde_id=since_id,
+            hasta_id=until_id,
+            desde=ventana_desde,
+            hasta=ventana_hasta,
+            limite=limit,
+            ultimos=tail,
+        )
+        bloques = _serializar_filas(filas, formato)
+
+    if _acepta_gzip(accept_encoding):
+        headers["Content-Encoding"] = "gzip"
+        bloques = _gzip_en_bloques(bloques)
+    return StreamingResponse(bloques, media_type=media_type, headers=headers)
+
+
+def _tasas(resumen):
+    total = resumen["observations_total"]
     return {
-        "csv_path": str(OBSERVACIONES_CSV),
-        "exists": OBSERVACIONES_CSV.exists(),
-        "observations_total": observacion_store.total_cases,
-        "alarm_rate": (
-            observacion_store.total_alarmas / observacion_store.total_cases
-            if observacion_store.total_cases > 0
-            else 0.0
-        ),
+        "alarm_rate": resumen["alarmas"] / total if total > 0 else 0.0,
         "alarm_unjustified_ratio": (
-            observacion_store.total_alarmas_injustificadas / observacion_store.total_alarmas
-            if observacion_store.total_alarmas > 0
-            else 0.0
-        ),
-        "override_ratio": (
-            observacion_store.total_overrides / observacion_store.total_cases
-            if observacion_store.total_cases > 0
+            resumen["alarmas_injustificadas"] / resumen["alarmas"]
+            if resumen["alarmas"] > 0
             else 0.0
         ),
+        "override_ratio": resumen["overrides"] / total if total > 0 else 0.0,
     }
 
 
+@app.get("/observaciones")
+def observaciones_estado(desde: Optional[str] = None, hasta: Optional[str] = None):
+    # desde/hasta: epoch (s/ms/us) o ISO-8601; filtran por outtime.
+    ventana_desde = _minutos_desde_param(desde)
+    ventana_hasta = _minutos_desde_param(hasta)
+    _vaciar_observaciones()
+    resumen = observacion_store.resumen(desde=ventana_desde, hasta=ventana_hasta)
+    rolling = {}
+    if observacion_store.ventanas is not None:
+        # Ultimos N segundos atendidos por este proceso, sin leer el store.
+        for nombre, ventana in observacion_store.ventanas.resumen().items():
+            rolling[nombre] = {
+                "window_s": ventana["ventana_s"],
+                "resolution_s": ventana["resolucion_s"],
+                "observations_total": ventana["observations_total"],
+                "urgency_distribution": ventana["urgency_distribution"],
+                **_tasas(ventana),
+                "ml_evaluated": ventana["ml_evaluados"],
+                "ml_disagreement_rate": (
+                    ventana["ml_desacuerdos"] / ventana["ml_evaluados"] if ventana["ml_evaluados"] > 0 else 0.0
+                ),
+            }
+    return {
+        "csv_path": str(OBSERVACIONES_PATH),
+        "backend": observacion_store.backend,
+        "exists": observacion_store.existe(),
+        "window": {"desde_min": ventana_desde, "hasta_min": ventana_hasta},
+        "observations_total": resumen["observations_total"],
+        "last_id": resumen["last_id"],
+        "urgency_distribution": resumen["urgency_distribution"],
+        **_tasas(resumen),
+        "rolling": rolling,
+    }
+
+
+# Filtros: since_id < id <= until_id; desde/hasta sobre outtime (epoch o
+# ISO-8601); limit = primeras N filas, tail = ultimas N. Responde gzip si el
+# cliente lo acepta y 304 si If-None-Match coincide con el ETag.
 @app.get("/observaciones/csv")
-def observaciones_csv():
-    if not OBSERVACIONES_CSV.exists():
-        raise HTTPException(status_code=404, detail="CSV de observaciones aun no creado.")
-    return FileResponse(
-        OBSERVACIONES_CSV,
-        media_type="text/csv",
-        filename="ficha_observacion.csv",
+def observaciones_csv(
+    since_id: Optional[int] = None,
+    until_id: Optional[int] = None,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    limit: Optional[int] = None,
+    tail: Optional[int] = None,
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    range_header: Optional[str] = Header(None, alias="Range"),
+):
+    return _exportar_observaciones(
+        "csv", since_id, until_id, desde, hasta, limit, tail,
+        accept_encoding, if_none_match, range_header,
     )
 
 
+@app.get("/observaciones/jsonl")
+def observaciones_jsonl(
+    since_id: Optional[int] = None,
+    until_id: Optional[int] = None,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    limit: Optional[int] = None,
+    tail: Optional[int] = None,
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+):
+    return _exportar_observaciones(
+        "jsonl", since_id, until_id, desde, hasta, limit, tail,
+        accept_encoding, if_none_match, None,
+    )
+
+
+def _evento_stream(formato: str, evento: str, datos, event_id=None) -> str:
+    if formato == "jsonl":
+        if evento != "observacion":
+            datos = {"evento": evento, **datos}
+        return json.dumps(datos, ensure_ascii=False) + "\n"
+    linea_id = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{linea_id}event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+async def _flujo_observaciones(sub, desde_id: Optional[int], formato: str):
+    # Corre en el event loop: el hilo que escribe solo despierta al generador,
+    # asi un suscriptor no ocupa un hilo del pool mientras espera.
+    loop = asyncio.get_running_loop()
+    aviso = asyncio.Event()
+
+    def despertar():
+        try:
+            loop.call_soon_threadsafe(aviso.set)
+        except RuntimeError:
+            pass
+
+    sub.al_publicar = despertar
+    ultimo_id = desde_id
+    try:
+        if formato == "sse":
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+
+        # Reanudacion: lo ya persistido sale del store; lo que llegue mientras
+        # tanto queda en la cola de la suscripcion y se deduplica por id.
+        if desde_id is not None:
+            historico = observacion_store.exportar(desde_id=desde_id)
+            while True:
+                bloque = await asyncio.to_thread(lambda: list(islice(historico, 500)))
+                if not bloque:
+                    break
+                partes = []
+                for row in bloque:
+                    ultimo_id = int(row["id"])
+                    partes.append(_evento_stream(formato, "observacion", _fila_tipada(row), ultimo_id))
+                yield "".join(partes)
+
+        while True:
+            aviso.clear()
+            filas, hueco = sub.tomar()
+            partes = []
+            if hueco is not None and hueco[1] > (ultimo_id or 0):
+                desde_perdida = max(hueco[0], (ultimo_id or 0) + 1)
+                # Con ids snowflake el rango no dice cuantas filas son: se
+                # usa la cantidad descartada (acotada por el rango si parte
+                # del hueco ya salio del historico).
+                partes.append(
+                    _evento_stream(
+                        formato,
+                        "perdidas",
+                        {
+                            "perdidas": min(hueco[2], hueco[1] - desde_perdida + 1),
+                            "desde_id": desde_perdida,
+                            "hasta_id": hueco[1],
+                        },
+                    )
+                )
+                ultimo_id = hueco[1]
+            for row in filas:
+                row_id = int(row["id"])
+                if ultimo_id is not None and row_id <= ultimo_id:
+                    continue
+                ultimo_id = row_id
+                partes.append(_evento_stream(formato, "observacion", _fila_tipada(row), row_id))
+            if sub.desbordada:
+                partes.append(_evento_stream(formato, "desconectado", {"ultimo_id": ultimo_id}))
+            if partes:
+                yield "".join(partes)
+            if sub.desbordada or sub.cerrada:
+                return
+            if filas or hueco is not None:
+                continue
+            try:
+                await asyncio.wait_for(aviso.wait(), STREAM_LATIDO_S)
+            except asyncio.TimeoutError:
+                yield ": latido\n\n" if formato == "sse" else _evento_stream(formato, "latido", {})
+    finally:
+        sub.cerrar()
+
+
+# Feed en vivo de observaciones (SSE, o JSON Lines con formato=jsonl). Para
+# retomar: Last-Event-ID (lo manda el navegador al reconectar) o since_id.
+@app.get("/observaciones/stream")
+def observaciones_stream(
+    since_id: Optional[int] = None,
+    formato: str = "sse",
+    last_event_id: Optional[str] = Header(None),
+):
+    if formato not in {"sse", "jsonl"}:
+        raise HTTPException(status_code=400, detail="formato debe ser sse o jsonl.")
+    desde_id = since_id
+    if last_event_id and last_event_id.strip():
+        try:
+            desde_id = int(last_event_id.strip())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID invalido.")
+    try:
+        sub = observacion_store.suscribir(STREAM_BUFFER_FILAS, STREAM_POLITICA)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
+    return StreamingResponse(
+        _flujo_observaciones(sub, desde_id, formato),
+        media_type="text/event-stream" if formato == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/observaciones/stream", include_in_schema=False)
+def observaciones_stream_api(
+    since_id: Optional[int] = None,
+    formato: str = "sse",
+    last_event_id: Optional[str] = Header(None),
+):
+    return observaciones_stream(since_id=since_id, formato=formato, last_event_id=last_event_id)
+
+
 @app.get("/api/observaciones", include_in_schema=False)
-def observaciones_estado_api():
-    return observaciones_estado()
+def observaciones_estado_api(desde: Optional[str] = None, hasta: Optional[str] = None):
+    return observaciones_estado(desde=desde, hasta=hasta)
 
 
 @app.get("/api/observaciones/csv", include_in_schema=False)
-def observaciones_csv_api():
-    return observaciones_csv()
+def observaciones_csv_api(
+    since_id: Optional[int] = None,
+    until_id: Optional[int] = None,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    limit: Optional[int] = None,
+    tail: Optional[int] = None,
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    range_header: Optional[str] = Header(None, alias="Range"),
+):
+    return observaciones_csv(
+        since_id=since_id,
+        until_id=until_id,
+        desde=desde,
+        hasta=hasta,
+        limit=limit,
+        tail=tail,
+        accept_encoding=accept_encoding,
+        if_none_match=if_none_match,
+        range_header=range_header,
+    )
+
+
+@app.get("/api/observaciones/jsonl", include_in_schema=False)
+def observaciones_jsonl_api(
+    since_id: Optional[int] = None,
+    until_id: Optional[int] = None,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    limit: Optional[int] = None,
+    tail: Optional[int] = None,
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+):
+    return observaciones_jsonl(
+        since_id=since_id,
+        until_id=until_id,
+        desde=desde,
+        hasta=hasta,
+        limit=limit,
+        tail=tail,
+        accept_encoding=accept_encoding,
+        if_none_match=if_none_match,
+    )
+
+
+def _verificar_admin(x_admin_token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest((x_admin_token or "").encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="X-Admin-Token invalido.")
+
+
+@app.get("/admin/perfilado", include_in_schema=False)
+def perfilado_estado(x_admin_token: Optional[str] = Header(None)):
+    _verificar_admin(x_admin_token)
+    return perfilador.estado()
+
+
+@app.post("/admin/perfilado", include_in_schema=False)
+def perfilado_iniciar(
+    cada_n: int = 0,
+    siguientes: int = 0,
+    limpiar: bool = True,
+    x_admin_token: Optional[str] = Header(None),
+):
+    # cada_n=100 perfila 1 de cada 100 requests; siguientes=50 los 50 proximos.
+    _verificar_admin(x_admin_token)
+    try:
+        perfilador.iniciar(cada_n=cada_n, siguientes=siguientes, limpiar=limpiar)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return perfilador.estado()
+
+
+@app.delete("/admin/perfilado", include_in_schema=False)
+def perfilado_detener(x_admin_token: Optional[str] = Header(None)):
+    _verificar_admin(x_admin_token)
+    perfilador.detener()
+    return perfilador.estado()
+
+
+@app.get("/admin/perfilado/top", include_in_schema=False)
+def perfilado_top(
+    n: int = 30,
+    orden: str = "acumulado",
+    patron: Optional[str] = None,
+    x_admin_token: Optional[str] = Header(None),
+):
+    _verificar_admin(x_admin_token)
+    if orden not in ORDENES:
+        raise HTTPException(status_code=400, detail=f"orden debe ser uno de: {', '.join(ORDENES)}.")
+    return {"estado": perfilador.estado(), "funciones": perfilador.top(n=n, orden=orden, patron=patron)}
+
+
+@app.get("/admin/perfilado/pstats", include_in_schema=False)
+def perfilado_pstats(x_admin_token: Optional[str] = Header(None)):
+    # python -m pstats analizar.pstats, snakeviz, etc.
+    _verificar_admin(x_admin_token)
+    return Response(
+        content=perfilador.volcar(),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="analizar.pstats"'},
+    )
+
+
+@app.get("/api/admin/perfilado", include_in_schema=False)
+def perfilado_estado_api(x_admin_token: Optional[str] = Header(None)):
+    return perfilado_estado(x_admin_token)
+
+
+@app.post("/api/admin/perfilado", include_in_schema=False)
+def perfilado_iniciar_api(
+    cada_n: int = 0,
+    siguientes: int = 0,
+    limpiar: bool = True,
+    x_admin_token: Optional[str] = Header(None),
+):
+    return perfilado_iniciar(cada_n=cada_n, siguientes=siguientes, limpiar=limpiar, x_admin_token=x_admin_token)
+
+
+@app.delete("/api/admin/perfilado", include_in_schema=False)
+def perfilado_detener_api(x_admin_token: Optional[str] = Header(None)):
+    return perfilado_detener(x_admin_token)
+
+
+@app.get("/api/admin/perfilado/top", include_in_schema=False)
+def perfilado_top_api(
+    n: int = 30,
+    orden: str = "acumulado",
+    patron: Optional[str] = None,
+    x_admin_token: Optional[str] = Header(None),
+):
+    return perfilado_top(n=n, orden=orden, patron=patron, x_admin_token=x_admin_token)
+
+
+@app.get("/api/admin/perfilado/pstats", include_in_schema=False)
+def perfilado_pstats_api(x_admin_token: Optional[str] = Header(None)):
+    return perfilado_pstats(x_admin_token)
+
+
+@app.get("/admin/memoria", include_in_schema=False)
+def memoria_estado(atributos: int = 8, x_admin_token: Optional[str] = Header(None)):
+    # Recorre los objetos de cada componente: decenas de ms, no para scrapear.
+    _verificar_admin(x_admin_token)
+    resultado = desglose_memoria(componentes_memoria(), max_atributos=atributos)
+    resultado["tracemalloc"] = instantaneas_memoria.estado()
+    return resultado
+
+
+@app.post("/admin/memoria/tracemalloc", include_in_schema=False)
+def memoria_tracemalloc_iniciar(frames: int = 1, x_admin_token: Optional[str] = Header(None)):
+    _verificar_admin(x_admin_token)
+    instantaneas_memoria.iniciar(frames)
+    return instantaneas_memoria.estado()
+
+
+@app.delete("/admin/memoria/tracemalloc", include_in_schema=False)
+def memoria_tracemalloc_detener(x_admin_token: Optional[str] = Header(None)):
+    _verificar_admin(x_admin_token)
+    instantaneas_memoria.detener()
+    return instantaneas_memoria.estado()
+
+
+@app.post("/admin/memoria/instantaneas", include_in_schema=False)
+def memoria_instantanea(nombre: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    _verificar_admin(x_admin_token)
+    try:
+        return instantaneas_memoria.tomar(nombre)
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+
+
+@app.get("/admin/memoria/diff", include_in_schema=False)
+def memoria_diff(
+    antes: str,
+    despues: Optional[str] = None,
+    agrupar: str = "lineno",
+    n: int = 20,
+    x_admin_token: Optional[str] = Header(None),
+):
+    _verificar_admin(x_admin_token)
+    if agrupar not in AGRUPACIONES:
+        raise HTTPException(status_code=400, detail=f"agrupar debe ser uno de: {', '.join(AGRUPACIONES)}.")
+    try:
+        return instantaneas_memoria.comparar(antes, despues, agrupar=agrupar, n=n)
+    except KeyError as exc:
+        raise HTTPException(status_code=404, detail=f"Instantanea no encontrada: {exc.args[0]}")
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+
+
+@app.get("/api/admin/memoria", include_in_schema=False)
+def memoria_estado_api(atributos: int = 8, x_admin_token: Optional[str] = Header(None)):
+    return memoria_estado(atributos, x_admin_token)
+
+
+@app.post("/api/admin/memoria/tracemalloc", include_in_schema=False)
+def memoria_tracemalloc_iniciar_api(frames: int = 1, x_admin_token: Optional[str] = Header(None)):
+    return memoria_tracemalloc_iniciar(frames, x_admin_token)
+
+
+@app.delete("/api/admin/memoria/tracemalloc", include_in_schema=False)
+def memoria_tracemalloc_detener_api(x_admin_token: Optional[str] = Header(None)):
+    return memoria_tracemalloc_detener(x_admin_token)
+
+
+@app.post("/api/admin/memoria/instantaneas", include_in_schema=False)
+def memoria_instantanea_api(nombre: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    return memoria_instantanea(nombre, x_admin_token)
+
+
+@app.get("/api/admin/memoria/diff", include_in_schema=False)
+def memoria_diff_api(
+    antes: str,
+    despues: Optional[str] = None,
+    agrupar: str = "lineno",
+    n: int = 20,
+    x_admin_token: Optional[str] = Header(None),
+):
+    return memoria_diff(antes=antes, despues=despues, agrupar=agrupar, n=n, x_admin_token=x_admin_token)
+
+
+def _ruta_modelo(archivo: str) -> Path:
+    # Solo bundles dentro de models/: cargar un .joblib ejecuta codigo.
+    path = (MODELS_DIR / archivo).resolve()
+    if MODELS_DIR.resolve() not in path.parents:
+        raise HTTPException(status_code=400, detail="archivo debe estar dentro de models/.")
+    if not path.exists() and not ruta_puntuador(path).exists():
+        raise HTTPException(status_code=404, detail=f"No existe el modelo: {archivo}")
+    return path
+
+
+@app.get("/admin/modelos", include_in_schema=False)
+def modelos_estado(x_admin_token: Optional[str] = Header(None)):
+    _verificar_admin(x_admin_token)
+    return registro_modelos.estado()
+
+
+@app.post("/admin/modelos/cargar", include_in_schema=False)
+def modelos_cargar(
+    archivo: str = MODEL_PATH.name,
+    activar: bool = True,
+    x_admin_token: Optional[str] = Header(None),
+):
+    # Carga en segundo plano; el modelo activo sigue atendiendo mientras tanto.
+    _verificar_admin(x_admin_token)
+    path = _ruta_modelo(archivo)
+    try:
+        registro_modelos.cargar_en_segundo_plano(path, activar=activar)
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return registro_modelos.estado()
+
+
+@app.post("/admin/modelos/activar", include_in_schema=False)
+def modelos_activar(version: str, x_admin_token: Optional[str] = Header(None)):
+    _verificar_admin(x_admin_token)
+    try:
+        registro_modelos.activar(version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Version no cargada: {version}")
+    return registro_modelos.estado()
+
+
+@app.post("/admin/modelos/revertir", include_in_schema=False)
+def modelos_revertir(x_admin_token: Optional[str] = Header(None)):
+    _verificar_admin(x_admin_token)
+    try:
+        registro_modelos.revertir()
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return registro_modelos.estado()
+
+
+@app.get("/api/admin/modelos", include_in_schema=False)
+def modelos_estado_api(x_admin_token: Optional[str] = Header(None)):
+    return modelos_estado(x_admin_token)
+
+
+@app.post("/api/admin/modelos/cargar", include_in_schema=False)
+def modelos_cargar_api(
+    archivo: str = MODEL_PATH.name,
+    activar: bool = True,
+    x_admin_token: Optional[str] = Header(None),
+):
+    return modelos_cargar(archivo=archivo, activar=activar, x_admin_token=x_admin_token)
+
+
+@app.post("/api/admin/modelos/activar", include_in_schema=False)
+def modelos_activar_api(version: str, x_admin_token: Optional[str] = Header(None)):
+    return modelos_activar(version, x_admin_token)
+
+
+@app.post("/api/admin/modelos/revertir", include_in_schema=False)
+def modelos_revertir_api(x_admin_token: Optional[str] = Header(None)):
+    return modelos_revertir(x_admin_token)
 
 
 @app.get("/", include_in_schema=False)
@@ -0,0 +1,251 @@
+# src/benchmark.py
+import argparse
+import random
+import time
+
+from catalogo_sintomas import CATALOGO_SINTOMAS, SINTOMA_ID, SINTOMAS_POR_ID
+from nlp_extractor import MOTORES, SintomaExtractor
+from reglas_combinacion import MotorReglas
+
+
+CONECTORES = [
+    "tengo", "y", "desde ayer", "tambien", "ademas", "con", "mucho",
+    "no", "sin", "pero", "aunque", "ni", "un poco de",
+]
+
+
+def _textos_sinteticos(n: int, n_frases: int, seed: int):
+    rng = random.Random(seed)
+    variantes = [v for lista in CATALOGO_SINTOMAS.values() for v in lista]
+    textos = []
+    for _ in range(n):
+        partes = []
+        for _ in range(n_frases):
+            partes.append(rng.choice(variantes))
+            partes.append(rng.choice(CONECTORES))
+        textos.append(" ".join(partes))
+    return textos
+
+
+def _medir(fn, repeticiones: int) -> float:
+    mejor = None
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        mejor = dt if mejor is None else min(mejor, dt)
+    return mejor
+
+
+def bench_motores(args) -> int:
+    print("=== Motores de extraccion ===")
+    print(f"Variantes en catalogo: {sum(len(v) for v in CATALOGO_SINTOMAS.values())}")
+    extractores = {}
+    for motor in sorted(MOTORES):
+        t0 = time.perf_counter()
+        extractores[motor] = SintomaExtractor(motor=motor)
+        print(f"Construccion [{motor}]: {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+    for n_frases in args.frases:
+        textos = _textos_sinteticos(args.textos, n_frases, args.seed)
+        chars = sum(len(t) for t in textos) / len(textos)
+        resultados = {}
+        for motor, ext in extractores.items():
+            dt = _medir(lambda: [ext.extraer(t) for t in textos], args.repeticiones)
+            resultados[motor] = [ext.extraer(t) for t in textos]
+            print(
+                f"frases={n_frases:<3} chars~{chars:<6.0f} [{motor}] "
+                f"{dt / len(textos) * 1e6:9.1f} us/texto"
+            )
+        salidas = list(resultados.values())
+        if any(s != salidas[0] for s in salidas[1:]):
+            print("ERROR: los motores devuelven resultados distintos.")
+            return 2
+    print("Resultados identicos entre motores.")
+    return 0
+
+
+def _resolver_cuadratico(menciones):
+    # Implementacion previa (O(n^2)), usada como referencia.
+    ordenadas = sorted(
+        menciones,
+        key=lambda x: (x["len_tokens"], x["len_chars"], -x["start"]),
+        reverse=True,
+    )
+    seleccionadas = []
+    for m in ordenadas:
+        if any(not (m["end"] <= s["start"] or s["end"] <= m["start"]) for s in seleccionadas):
+            continue
+        seleccionadas.append(m)
+    seleccionadas.sort(key=lambda x: x["start"])
+    return seleccionadas
+
+
+def _menciones_sinteticas(n: int, rng: random.Random):
+    # Simula notas largas: muchas menciones cortas ("dolor", "tos") solapadas
+    # con menciones mas largas que las contienen.
+    menciones = []
+    pos = 0
+    while len(menciones) < n:
+        len_tokens = rng.choice([1, 1, 1, 2, 3, 4])
+        len_chars = len_tokens * 6 - 1
+        menciones.append(
+            {
+                "canon": f"s{len(menciones) % 171}",
+                "start": pos,
+                "end": pos + len_chars,
+                "len_chars": len_chars,
+                "len_tokens": len_tokens,
+            }
+        )
+        pos += rng.choice([0, 6, 6, 12])
+    return menciones
+
+
+def bench_solapamientos(args) -> int:
+    print("=== Resolucion de solapamientos ===")
+    extractor = SintomaExtractor()
+    rng = random.Random(args.seed)
+    for n in args.menciones:
+        menciones = _menciones_sinteticas(n, rng)
+        dt_nuevo = _medir(lambda: extractor._resolver_solapamientos(menciones), args.repeticiones)
+        linea = f"menciones={n:<7} indice: {dt_nuevo * 1000:9.2f} ms"
+        if n <= args.max_cuadratico:
+            dt_previo = _medir(lambda: _resolver_cuadratico(menciones), args.repeticiones)
+            if extractor._resolver_solapamientos(menciones) != _resolver_cuadratico(menciones):
+                print("ERROR: la seleccion difiere de la implementacion cuadratica.")
+                return 2
+            linea += f" | cuadratico: {dt_previo * 1000:9.2f} ms"
+        print(linea)
+    return 0
+
+
+def bench_lote(args) -> int:
+    print("=== Extraccion en lote ===")
+    extractor = SintomaExtractor()
+    textos = _textos_sinteticos(args.textos, args.frases, args.seed)
+    referencia = None
+    base = None
+    for procesos in args.procesos:
+        t0 = time.perf_counter()
+        resultado = extractor.extraer_lote(textos, procesos=procesos, min_paralelo=0)
+        dt = time.perf_counter() - t0
+        if referencia is None:
+            referencia, base = resultado, dt
+        elif resultado != referencia:
+            print("ERROR: el resultado en paralelo difiere del serial.")
+            return 2
+        print(
+            f"procesos={procesos:<3} {dt:8.2f} s  "
+            f"{len(textos) / dt:10.0f} textos/s  aceleracion x{base / dt:.2f}"
+        )
+    return 0
+
+
+def _reglas_sinteticas(n: int, rng: random.Random):
+    reglas = []
+    for i in range(n):
+        k = rng.choice([2, 2, 3, 3, 4])
+        reglas.append(
+            {
+                "id": f"sint_{i + 1}",
+                "sintomas": set(rng.sample(SINTOMAS_POR_ID, k)),
+                "nivel": rng.choice([2, 3]),
+            }
+        )
+    return reglas
+
+
+def _evaluar_lineal(reglas, sintomas):
+    # Evaluacion previa: issubset contra todas las reglas.
+    nivel = 0
+    activadas = []
+    for regla in reglas:
+        if regla["sintomas"].issubset(sintomas):
+            activadas.append(regla["id"])
+            nivel = max(nivel, regla["nivel"])
+    return nivel, activadas
+
+
+def bench_reglas(args) -> int:
+    print("=== Motor de reglas de combinacion ===")
+    rng = random.Random(args.seed)
+    extractor = SintomaExtractor()
+    textos = _textos_sinteticos(args.textos, args.frases, args.seed)
+    mascaras = [extractor.extraer_mascara(t) for t in textos]
+    conjuntos = [set(extractor.extraer(t)) for t in textos]
+    print(f"Sintomas promedio por texto: {sum(len(c) for c in conjuntos) / len(conjuntos):.2f}")
+
+    for n in args.reglas:
+        reglas = _reglas_sinteticas(n, rng)
+        motor = MotorReglas(reglas, SINTOMA_ID)
+        esperado = [_evaluar_lineal(reglas, c) for c in conjuntos]
+        if [motor.evaluar(m) for m in mascaras] != esperado:
+            print("ERROR: el motor indexado difiere de la evaluacion lineal.")
+            return 2
+        dt_motor = _medir(lambda: [motor.evaluar(m) for m in mascaras], args.repeticiones)
+        dt_lineal = _medir(lambda: [_evaluar_lineal(reglas, c) for c in conjuntos], args.repeticiones)
+        print(
+            f"reglas={n:<6} indice: {dt_motor / len(textos) * 1e6:8.2f} us/request | "
+            f"lineal: {dt_lineal / len(textos) * 1e6:9.2f} us/request"
+        )
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks del pipeline de triaje.")
+    parser.add_argument("--seed", type=int, default=42, help="Semilla aleatoria.")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Repeticiones por medicion (se toma la mejor).")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_motores = sub.add_parser("motores", help="Compara los motores de busqueda del extractor.")
+    p_motores.add_argument("--textos", type=int, default=200, help="Textos por tamano.")
+    p_motores.add_argument(
+        "--frases",
+        type=int,
+        nargs="+",
+        default=[1, 4, 16, 64],
+        help="Cantidad de frases de sintoma por texto.",
+    )
+    p_motores.set_defaults(func=bench_motores)
+
+    p_solap = sub.add_parser("solapamientos", help="Escalado de la resolucion de solapamientos.")
+    p_solap.add_argument(
+        "--menciones",
+        type=int,
+        nargs="+",
+        default=[100, 1000, 10000, 100000],
+        help="Cantidad de menciones crudas.",
+    )
+    p_solap.add_argument(
+        "--max-cuadratico",
+        type=int,
+        default=10000,
+        help="Tamano maximo para correr la implementacion cuadratica de referencia.",
+    )
+    p_solap.set_defaults(func=bench_solapamientos)
+
+    p_lote = sub.add_parser("lote", help="Escalado de extraer_lote con el numero de procesos.")
+    p_lote.add_argument("--textos", type=int, default=20000, help="Cantidad de textos.")
+    p_lote.add_argument("--frases", type=int, default=4, help="Frases de sintoma por texto.")
+    p_lote.add_argument("--procesos", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="Tamanos de pool a medir.")
+    p_lote.set_defaults(func=bench_lote)
+
+    p_reglas = sub.add_parser("reglas", help="Costo por request del motor de reglas segun su tamano.")
+    p_reglas.add_argument("--textos", type=int, default=500, help="Textos a evaluar.")
+    p_reglas.add_argument("--frases", type=int, default=3, help="Frases de sintoma por texto.")
+    p_reglas.add_argument(
+        "--reglas",
+        type=int,
+        nargs="+",
+        default=[10, 100, 1000, 5000],
+        help="Tamanos del conjunto de reglas sinteticas.",
+    )
+    p_reglas.set_defaults(func=bench_reglas)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
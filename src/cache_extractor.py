@@ -0,0 +1,96 @@
+# src/cache_extractor.py
+import hashlib
+import os
+import pickle
+from pathlib import Path
+
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+DEFAULT_CACHE_PATH = BASE_DIR / "models" / "extractor_cache.pkl"
+
+# Subir al cambiar la estructura de lo que se guarda en el artefacto.
+FORMATO_ARTEFACTO = 1
+
+# Ademas del contenido del catalogo, la clave incluye el codigo que lo expande
+# y construye las tablas: si cambia cualquiera, el artefacto se reconstruye.
+_FUENTES = ("catalogo_sintomas.py", "nlp_extractor.py", "cache_extractor.py")
+
+_memo = {}
+
+
+def ruta_cache():
+    # EXTRACTOR_CACHE="" (o "0") desactiva el artefacto.
+    raw = os.getenv("EXTRACTOR_CACHE")
+    if raw is None:
+        return DEFAULT_CACHE_PATH
+    raw = raw.strip()
+    if raw in {"", "0"}:
+        return None
+    return Path(raw)
+
+
+def _huella_codigo() -> str:
+    h = hashlib.sha256()
+    here = Path(__file__).resolve().parent
+    for nombre in _FUENTES:
+        try:
+            h.update((here / nombre).read_bytes())
+        except OSError:
+            h.update(nombre.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _clave(huella_catalogo: str) -> str:
+    return f"{FORMATO_ARTEFACTO}:{huella_catalogo}:{_huella_codigo()}"
+
+
+def cargar(huella_catalogo: str):
+    path = ruta_cache()
+    if path is None:
+        return None
+    clave = _clave(huella_catalogo)
+    if clave in _memo:
+        return _memo[clave]
+    if not path.exists():
+        return None
+    try:
+        with path.open("rb") as f:
+            artefacto = pickle.load(f)
+    except Exception as exc:
+        print(f"Advertencia: no se pudo leer artefacto del extractor ({exc}).")
+        return None
+    if not isinstance(artefacto, dict) or artefacto.get("clave") != clave:
+        return None
+    _memo[clave] = artefacto
+    return artefacto
+
+
+def guardar(huella_catalogo: str, **contenido):
+    path = ruta_cache()
+    if path is None:
+        return False
+    clave = _clave(huella_catalogo)
+    artefacto = dict(_memo.get(clave) or {})
+    for k, v in contenido.items():
+        if isinstance(v, dict) and isinstance(artefacto.get(k), dict):
+            artefacto[k] = {**artefacto[k], **v}
+        else:
+            artefacto[k] = v
+    artefacto["clave"] = clave
+
+    # Escritura atomica: varios workers pueden reconstruir a la vez.
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tmp.open("wb") as f:
+            pickle.dump(artefacto, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except Exception as exc:
+        print(f"Advertencia: no se pudo guardar artefacto del extractor ({exc}).")
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        return False
+    _memo[clave] = artefacto
+    return True
@@ -0,0 +1,67 @@
+# src/cache_resultados.py
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+# LRU acotado con TTL opcional (0 = sin vencimiento). Guarda valores que no
+# se modifican despues; quien lee recibe la misma referencia.
+class CacheLRU:
+    def __init__(self, max_entradas: int, ttl_s: float = 0.0):
+        self.max_entradas = max(1, int(max_entradas))
+        self.ttl_s = max(0.0, float(ttl_s))
+        self._datos = OrderedDict()
+        self._lock = Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.vencidas = 0
+        self.desalojadas = 0
+        self.invalidaciones = 0
+
+    def __len__(self):
+        return len(self._datos)
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            valor, vence = entrada
+            if vence and vence < time.monotonic():
+                del self._datos[clave]
+                self.vencidas += 1
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def guardar(self, clave, valor):
+        vence = time.monotonic() + self.ttl_s if self.ttl_s else 0.0
+        with self._lock:
+            self._datos[clave] = (valor, vence)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self.desalojadas += 1
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self.invalidaciones += 1
+
+    def estado(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._datos),
+                "max_entradas": self.max_entradas,
+                "ttl_s": self.ttl_s,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else None,
+                "vencidas": self.vencidas,
+                "desalojadas": self.desalojadas,
+                "invalidaciones": self.invalidaciones,
+            }
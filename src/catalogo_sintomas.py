@@ -1,7 +1,12 @@
 # src/catalogo_sintomas.py
+import hashlib
+import json
 import re
+import time
 import unicodedata
 
+import cache_extractor
+
 CATALOGO_SINTOMAS = {
     "dolor de cabeza": [
         "dolor de cabeza", "cefalea", "me duele la cabeza", "duele la cabeza",
@@ -820,15 +825,42 @@ def _expandir_patrones(destino, vistos, termino):
         _agregar_variante(destino, vistos, termino.replace("tengo ", "", 1).strip())
 
 
-for _sintoma, _variantes in list(CATALOGO_SINTOMAS.items()):
-    _resultado = []
-    _vistos = set()
+def expandir_catalogo(catalogo):
+    expandido = {}
+    for sintoma, variantes in catalogo.items():
+        resultado = []
+        vistos = set()
+
+        _agregar_variante(resultado, vistos, sintoma)
+
+        for item in variantes:
+            _agregar_variante(resultado, vistos, item)
+            _expandir_patrones(resultado, vistos, _normalizar_texto(item))
+
+        _expandir_patrones(resultado, vistos, _normalizar_texto(sintoma))
+        expandido[sintoma] = resultado
+    return expandido
+
+
+def huella_catalogo(catalogo) -> str:
+    contenido = json.dumps(catalogo, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
 
-    _agregar_variante(_resultado, _vistos, _sintoma)
 
-    for _item in _variantes:
-        _agregar_variante(_resultado, _vistos, _item)
-        _expandir_patrones(_resultado, _vistos, _normalizar_texto(_item))
+# La huella se calcula sobre el catalogo base (antes de expandir). Si el
+# artefacto precompilado coincide, se reutiliza su expansion.
+_t0 = time.perf_counter()
+CATALOGO_HUELLA = huella_catalogo(CATALOGO_SINTOMAS)
+_artefacto = cache_extractor.cargar(CATALOGO_HUELLA)
+if _artefacto is not None and "catalogo" in _artefacto:
+    CATALOGO_SINTOMAS.update(_artefacto["catalogo"])
+    CATALOGO_ORIGEN = "artefacto"
+else:
+    CATALOGO_SINTOMAS.update(expandir_catalogo(CATALOGO_SINTOMAS))
+    CATALOGO_ORIGEN = "expansion"
+CATALOGO_CARGA_MS = (time.perf_counter() - _t0) * 1000
 
-    _expandir_patrones(_resultado, _vistos, _normalizar_texto(_sintoma))
-    CATALOGO_SINTOMAS[_sintoma] = _resultado
+# Id entero estable por sintoma canonico: su posicion en el catalogo. Los
+# sintomas nuevos deben agregarse al final para no mover ids existentes.
+SINTOMAS_POR_ID = list(CATALOGO_SINTOMAS.keys())
+SINTOMA_ID = {sintoma: i for i, sintoma in enumerate(SINTOMAS_POR_ID)}
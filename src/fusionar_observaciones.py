@@ -0,0 +1,197 @@
+# src/fusionar_observaciones.py
+import argparse
+import json
+import multiprocessing
+import random
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from observaciones import BACKENDS, GeneradorIds, crear_store, fusionar_logs, logs_de_nodos, ruta_nodo
+
+
+NOMBRES_LOG = {
+    "csv": "ficha_observacion.csv",
+    "sqlite": "ficha_observacion.sqlite3",
+    "segmentos": "observaciones",
+}
+# Archivo que marca un --dir creado por "simular" (el unico que se borra solo).
+MARCA_SIMULACION = ".simulacion_nodos"
+
+
+def cmd_fusionar(args) -> int:
+    fuentes = [Path(p) for p in args.logs]
+    if args.raiz:
+        fuentes += logs_de_nodos(Path(args.raiz))
+    if not fuentes:
+        print("No se encontraron logs de observaciones.")
+        return 1
+
+    t0 = time.perf_counter()
+    resultado = fusionar_logs(fuentes, Path(args.salida) if args.salida else None)
+    dt = time.perf_counter() - t0
+
+    if args.json:
+        print(json.dumps(resultado, ensure_ascii=False, indent=2))
+        return 0
+    resumen = resultado["resumen"]
+    for fuente, parcial in resultado["fuentes"].items():
+        print(f"{fuente}: {parcial['observations_total']} observaciones")
+    print(
+        f"Total: {resumen['observations_total']} observaciones | alarmas {resumen['alarmas']} "
+        f"| injustificadas {resumen['alarmas_injustificadas']} | overrides {resumen['overrides']}"
+    )
+    print(f"Distribucion de urgencia: {resumen['urgency_distribution']}")
+    if resultado["ids_repetidos"]:
+        print(f"Advertencia: {resultado['ids_repetidos']} ids repetidos entre logs (ids secuenciales).")
+    if args.salida:
+        print(f"Export global: {args.salida}")
+    print(f"Fusion en {dt * 1000:.1f} ms")
+    return 0
+
+
+def _nodo_simulado(backend: str, path: str, nodo: int, filas: int, hilos: int, multiproceso: bool, seed: int):
+    store = crear_store(backend, Path(path), ids="snowflake", nodo=nodo, multiproceso=multiproceso)
+    rng = random.Random(seed)
+    niveles = [[rng.randint(1, 4) for _ in range(3)] for _ in range(filas)]
+
+    def escribir(desde: int):
+        for i in range(desde, filas, hilos):
+            sistema, referencia, final = niveles[i]
+            ahora = time.time() / 60
+            store.append(
+                caso=f"caso simulado {nodo}-{i}",
+                sintomas_texto="fiebre",
+                nivel_sistema=sistema,
+                nivel_referencia=referencia,
+                recomendacion_sistema="",
+                adequacy_score=3,
+                intime=ahora,
+                outtime=ahora,
+                urgencia_final=final,
+            )
+
+    trabajadores = [threading.Thread(target=escribir, args=(h,)) for h in range(hilos)]
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    store.cerrar()
+
+
+def cmd_simular(args) -> int:
+    # Varios procesos hacen de nodos (y opcionalmente varios workers por nodo)
+    # escribiendo a la vez; despues se fusiona y se compara contra los
+    # contadores de cada nodo.
+    if args.backend == "segmentos" and args.workers > 1:
+        print("Error: el backend 'segmentos' no admite varios workers por nodo.")
+        return 1
+    base = Path(args.dir)
+    marca = base / MARCA_SIMULACION
+    if base.exists():
+        # Solo se borra lo que dejo una simulacion anterior (o con --forzar):
+        # un --dir mal escrito no debe llevarse logs reales.
+        if any(base.iterdir()) and not marca.exists() and not args.forzar:
+            print(
+                f"Error: {base} existe y no es un directorio de simulacion (falta {MARCA_SIMULACION}). "
+                "Use otro --dir o --forzar para borrarlo."
+            )
+            return 1
+        shutil.rmtree(base)
+    base.mkdir(parents=True)
+    marca.write_text("Directorio de fusionar_observaciones.py simular; se borra en cada corrida.\n", encoding="utf-8")
+    log = base / "data" / NOMBRES_LOG[args.backend]
+
+    procesos = []
+    for nodo in range(args.nodos):
+        for worker in range(args.workers):
+            procesos.append(
+                multiprocessing.Process(
+                    target=_nodo_simulado,
+                    args=(
+                        args.backend,
+                        str(ruta_nodo(log, nodo)),
+                        nodo,
+                        args.filas,
+                        args.hilos,
+                        args.workers > 1,
+                        args.seed + nodo * 1000 + worker,
+                    ),
+                )
+            )
+    t0 = time.perf_counter()
+    for p in procesos:
+        p.start()
+    for p in procesos:
+        p.join()
+    dt_escritura = time.perf_counter() - t0
+    if any(p.exitcode != 0 for p in procesos):
+        print("Error: algun nodo simulado termino con error.")
+        return 1
+
+    esperado = {}
+    for nodo in range(args.nodos):
+        store = crear_store(args.backend, ruta_nodo(log, nodo))
+        esperado[str(ruta_nodo(log, nodo))] = store.resumen()
+        store.cerrar()
+
+    salida = base / "fusion.csv"
+    t0 = time.perf_counter()
+    resultado = fusionar_logs(list(esperado), salida)
+    dt_fusion = time.perf_counter() - t0
+
+    ids = []
+    with salida.open(encoding="utf-8") as f:
+        next(f)
+        for linea in f:
+            ids.append(int(linea.split(",", 1)[0]))
+    total = args.nodos * args.workers * args.filas
+    nodos_vistos = {GeneradorIds.partes(i)[1] for i in ids}
+    controles = {
+        "filas": len(ids) == total == resultado["resumen"]["observations_total"],
+        "orden global": all(a < b for a, b in zip(ids, ids[1:])),
+        "nodos": nodos_vistos == set(range(args.nodos)),
+        "indicadores por nodo": resultado["fuentes"] == esperado,
+        "indicadores globales": all(
+            resultado["resumen"][k] == sum(r[k] for r in esperado.values())
+            for k in ("observations_total", "alarmas", "alarmas_injustificadas", "overrides")
+        ),
+    }
+    print(
+        f"{args.nodos} nodos x {args.workers} workers x {args.filas} filas ({args.backend}): "
+        f"escritura {dt_escritura:.2f} s, fusion {dt_fusion * 1000:.1f} ms"
+    )
+    for nombre, ok in controles.items():
+        print(f"  {nombre}: {'ok' if ok else 'FALLA'}")
+    return 0 if all(controles.values()) else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Fusion de los logs de observaciones de varios nodos.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_fusionar = sub.add_parser("fusionar", help="Export global ordenado e indicadores recalculados.")
+    p_fusionar.add_argument("logs", nargs="*", help="Logs de nodos (CSV, SQLite o directorio de segmentos).")
+    p_fusionar.add_argument("--raiz", help="Directorio con subdirectorios nodo_NNN (ej. data/nodos).")
+    p_fusionar.add_argument("--salida", help="CSV de salida (.gz para comprimir). Sin salida solo se calculan indicadores.")
+    p_fusionar.add_argument("--json", action="store_true", help="Imprime el resultado como JSON.")
+    p_fusionar.set_defaults(func=cmd_fusionar)
+
+    p_simular = sub.add_parser("simular", help="Simula varios nodos en procesos locales y verifica la fusion.")
+    p_simular.add_argument("--dir", default="simulacion_nodos", help="Directorio de trabajo (se borra si es de una simulacion anterior).")
+    p_simular.add_argument("--forzar", action="store_true", help="Borra --dir aunque no sea de una simulacion anterior.")
+    p_simular.add_argument("--backend", choices=BACKENDS, default="csv", help="Backend de cada nodo.")
+    p_simular.add_argument("--nodos", type=int, default=3, help="Cantidad de nodos.")
+    p_simular.add_argument("--workers", type=int, default=1, help="Procesos por nodo (multiproceso si > 1).")
+    p_simular.add_argument("--hilos", type=int, default=4, help="Hilos escritores por proceso.")
+    p_simular.add_argument("--filas", type=int, default=2000, help="Observaciones por proceso.")
+    p_simular.add_argument("--seed", type=int, default=42, help="Semilla aleatoria.")
+    p_simular.set_defaults(func=cmd_simular)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
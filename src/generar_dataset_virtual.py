@@ -1,5 +1,6 @@
 import argparse
 import csv
+import gzip
 import io
 import json
 import random
@@ -64,9 +65,12 @@ def _http_post_json(url: str, payload: dict, timeout: int):
 
 
 def _http_get_text(url: str, timeout: int) -> str:
-    req = request.Request(url, method="GET")
+    req = request.Request(url, headers={"Accept-Encoding": "gzip"}, method="GET")
     with request.urlopen(req, timeout=timeout) as resp:
-        return resp.read().decode("utf-8")
+        body = resp.read()
+        if resp.headers.get("Content-Encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+        return body.decode("utf-8")
 
 
 def _post_analizar(api_base: str, texto: str, timeout: int):
@@ -79,8 +83,9 @@ def _post_analizar(api_base: str, texto: str, timeout: int):
     return _http_post_json(f"{api_base}/api/analizar", payload, timeout)
 
 
-def _descargar_csv(api_base: str, timeout: int) -> str:
-    return _http_get_text(f"{api_base}/api/observaciones/csv", timeout)
+def _descargar_csv(api_base: str, timeout: int, ultimos: int) -> str:
+    # El servidor filtra las ultimas filas; no se baja el historial completo.
+    return _http_get_text(f"{api_base}/api/observaciones/csv?tail={ultimos}", timeout)
 
 
 def _guardar_ultimos_n(csv_text: str, n: int, output_path: Path):
@@ -131,7 +136,7 @@ def main():
             errores += 1
             print(f"[{i + 1}/{args.n}] error enviando caso: {exc}")
 
-    csv_text = _descargar_csv(api_base, args.timeout)
+    csv_text = _descargar_csv(api_base, args.timeout, ok)
 
     total_guardados, columnas = _guardar_ultimos_n(csv_text, ok, output_path)
 
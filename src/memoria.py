@@ -0,0 +1,322 @@
+# src/memoria.py
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict, deque
+from threading import Lock, Thread
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+AGRUPACIONES = ("lineno", "filename", "traceback")
+MAX_INSTANTANEAS = 8
+
+# No se recorren: son compartidos por todo el proceso (clases, modulos,
+# codigo) o apuntan a estado ajeno al componente (hilos).
+_SIN_RECORRER = (type, ModuleType, FunctionType, BuiltinFunctionType, MethodType, Thread)
+_ATOMICOS = (str, bytes, bytearray, int, float, complex, bool, type(None))
+
+
+def memoria_proceso():
+    # RSS actual y pico del proceso en bytes (Linux: /proc; otros: solo pico).
+    datos = {}
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for linea in f:
+                clave, _, valor = linea.partition(":")
+                if clave == "VmRSS":
+                    datos["rss_bytes"] = int(valor.split()[0]) * 1024
+                elif clave == "VmHWM":
+                    datos["rss_pico_bytes"] = int(valor.split()[0]) * 1024
+    except OSError:
+        pass
+    if "rss_pico_bytes" not in datos and resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        datos["rss_pico_bytes"] = pico if sys.platform == "darwin" else pico * 1024
+    return datos
+
+
+def tamano_profundo(obj, vistos=None) -> int:
+    # sys.getsizeof recursivo (contenedores, __dict__ y __slots__). Con un
+    # `vistos` compartido cada objeto se cuenta una sola vez entre componentes.
+    vistos = set() if vistos is None else vistos
+    total = 0
+    pendientes = [obj]
+    while pendientes:
+        o = pendientes.pop()
+        if id(o) in vistos or isinstance(o, _SIN_RECORRER):
+            continue
+        vistos.add(id(o))
+        total += sys.getsizeof(o, 0)
+        if isinstance(o, _ATOMICOS):
+            continue
+        if isinstance(o, dict):
+            pendientes.extend(o.keys())
+            pendientes.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            pendientes.extend(o)
+        else:
+            atributos = getattr(o, "__dict__", None)
+            if isinstance(atributos, dict):
+                pendientes.append(atributos)
+            for clase in type(o).__mro__:
+                for slot in getattr(clase, "__slots__", ()):
+                    if slot not in {"__dict__", "__weakref__"} and hasattr(o, slot):
+                        pendientes.append(getattr(o, slot))
+    return total
+
+
+def _medir(obj, vistos, max_atributos: int):
+    atributos = getattr(obj, "__dict__", None)
+    if not isinstance(atributos, dict) or isinstance(obj, _SIN_RECORRER) or id(obj) in vistos:
+        return {"bytes": tamano_profundo(obj, vistos)}
+    vistos.update((id(obj), id(atributos)))
+    partes = {nombre: tamano_profundo(valor, vistos) for nombre, valor in atributos.items()}
+    total = sys.getsizeof(obj, 0) + sys.getsizeof(atributos, 0) + sum(partes.values())
+    mayores = sorted(((n, b) for n, b in partes.items() if b), key=lambda p: p[1], reverse=True)
+    return {"bytes": total, "atributos": dict(mayores[:max_atributos])}
+
+
+# Desglose por componente en el orden dado: lo compartido queda en el primero
+# que lo referencia (ej. el catalogo, no el extractor que lo apunta). Es una
+# estimacion por objetos Python: no ve memoria nativa fuera de getsizeof.
+def desglose(componentes, max_atributos: int = 8):
+    t0 = time.perf_counter()
+    vistos = set()
+    medidos = {nombre: _medir(obj, vistos, max_atributos) for nombre, obj in componentes.items()}
+    return {
+        "proceso": memoria_proceso(),
+        "componentes": medidos,
+        "total_componentes_bytes": sum(m["bytes"] for m in medidos.values()),
+        "medicion_ms": round((time.perf_counter() - t0) * 1000, 2),
+    }
+
+
+# Instantaneas de tracemalloc con nombre, para comparar el heap entre dos
+# momentos (crecimiento en uptimes largos). Con el trazado activo cada
+# asignacion cuesta bastante mas: se prende solo mientras se investiga
+# (o desde el arranque con PYTHONTRACEMALLOC=N).
+class InstantaneasMemoria:
+    def __init__(self, max_instantaneas: int = MAX_INSTANTANEAS):
+        self._max = max(1, int(max_instantaneas))
+        self._instantaneas = OrderedDict()
+        self._lock = Lock()
+
+    def iniciar(self, frames: int = 1):
+        frames = max(1, int(frames))
+        if tracemalloc.is_tracing():
+            if tracemalloc.get_traceback_limit() == frames:
+                return
+            tracemalloc.stop()
+        tracemalloc.start(frames)
+
+    def detener(self):
+        # Las instantaneas ya tomadas se conservan y se pueden seguir comparando.
+        tracemalloc.stop()
+
+    def estado(self):
+        activo = tracemalloc.is_tracing()
+        actual, pico = tracemalloc.get_traced_memory() if activo else (0, 0)
+        with self._lock:
+            instantaneas = [
+                {"nombre": nombre, **info} for nombre, (_, info) in self._instantaneas.items()
+            ]
+        return {
+            "activo": activo,
+            "frames": tracemalloc.get_traceback_limit() if activo else 0,
+            "trazado_bytes": actual,
+            "trazado_pico_bytes": pico,
+            "overhead_bytes": tracemalloc.get_tracemalloc_memory() if activo else 0,
+            "instantaneas": instantaneas,
+        }
+
+    def _capturar(self):
+        if not tracemalloc.is_tracing():
+            raise ValueError("tracemalloc no esta activo.")
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+                tracemalloc.Filter(False, "<unknown>"),
+            )
+        )
+
+    def tomar(self, nombre: str = None):
+        instantanea = self._capturar()
+        estadisticas = instantanea.statistics("filename")
+        info = {
+            "tomada": time.time(),
+            "bytes": sum(s.size for s in estadisticas),
+            "bloques": sum(s.count for s in estadisticas),
+        }
+        with self._lock:
+            nombre = nombre or f"i{len(self._instantaneas) + 1}-{int(info['tomada'])}"
+            self._instantaneas.pop(nombre, None)
+            self._instantaneas[nombre] = (instantanea, info)
+            while len(self._instantaneas) > self._max:
+                self._instantaneas.popitem(last=False)
+        return {"nombre": nombre, **info}
+
+    def _buscar(self, nombre: str):
+        with self._lock:
+            if nombre not in self._instantaneas:
+                raise KeyError(nombre)
+            return self._instantaneas[nombre][0]
+
+    def comparar(self, antes: str, despues: str = None, agrupar: str = "lineno", n: int = 20):
+        # Sin `despues` se compara contra el heap de este momento.
+        if agrupar not in AGRUPACIONES:
+            raise ValueError(f"agrupar desconocido: {agrupar!r}. Opciones: {', '.join(AGRUPACIONES)}")
+        vieja = self._buscar(antes)
+        nueva = self._buscar(despues) if despues else self._capturar()
+        diferencias = nueva.compare_to(vieja, agrupar)
+        return {
+            "antes": antes,
+            "despues": despues or "ahora",
+            "diferencia_bytes": sum(d.size_diff for d in diferencias),
+            "diferencia_bloques": sum(d.count_diff for d in diferencias),
+            "lugares": [
+                {
+                    "lugar": _lugar(d.traceback, agrupar),
+                    "diferencia_bytes": d.size_diff,
+                    "bytes": d.size,
+                    "diferencia_bloques": d.count_diff,
+                    "bloques": d.count,
+                }
+                for d in diferencias[: max(0, int(n))]
+            ],
+        }
+
+
+def _lugar(traceback, agrupar: str) -> str:
+    if agrupar == "filename":
+        return traceback[0].filename
+    return " <- ".join(f"{frame.filename}:{frame.lineno}" for frame in traceback)
+
+
+def _mb(n: int) -> str:
+    return f"{n / (1024 * 1024):8.2f} MB"
+
+
+def _imprimir_desglose(resultado):
+    for nombre, medido in resultado["componentes"].items():
+        print(f"{nombre:<16}{_mb(medido['bytes'])}")
+        for atributo, n in medido.get("atributos", {}).items():
+            print(f"  {atributo:<22}{_mb(n)}")
+    print(f"{'total':<16}{_mb(resultado['total_componentes_bytes'])}  (medido en {resultado['medicion_ms']} ms)")
+    proceso = resultado["proceso"]
+    if "rss_bytes" in proceso:
+        print(f"{'RSS':<16}{_mb(proceso['rss_bytes'])}")
+    if "rss_pico_bytes" in proceso:
+        print(f"{'RSS pico':<16}{_mb(proceso['rss_pico_bytes'])}")
+
+
+def _importar_api():
+    # El store de observaciones va a un SQLite temporal para no tocar el log real.
+    os.environ["OBS_BACKEND"] = "sqlite"
+    os.environ["OBS_SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="triaje_memoria_"), "obs.sqlite3")
+    import api
+
+    return api
+
+
+def cmd_desglose(args) -> int:
+    # Mide un worker tal como arranca (catalogo, extractor, modelo, store...).
+    base = memoria_proceso()
+    api = _importar_api()
+    resultado = desglose(api.componentes_memoria(), max_atributos=args.atributos)
+    resultado["proceso"]["rss_interprete_bytes"] = base.get("rss_bytes", 0)
+    if args.json:
+        print(json.dumps(resultado, ensure_ascii=False, indent=2))
+        return 0
+    _imprimir_desglose(resultado)
+    if base.get("rss_bytes"):
+        print(f"{'RSS sin app':<16}{_mb(base['rss_bytes'])}")
+    return 0
+
+
+def _textos(sintomas, n: int, seed: int):
+    rng = random.Random(seed)
+    for _ in range(n):
+        elegidos = rng.sample(sintomas, rng.randint(1, 4))
+        if rng.random() < 0.3:
+            elegidos[0] = f"no tengo {elegidos[0]}"
+        yield "tengo " + ", ".join(elegidos)
+
+
+def cmd_crecimiento(args) -> int:
+    # Corre requests de /analizar en proceso (sin la capa HTTP ni el perfilador)
+    # y compara el heap antes y despues:
+    # lo que crece con el numero de requests aparece arriba en el diff.
+    api = _importar_api()
+    sintomas = list(api.CATALOGO_SINTOMAS.keys())
+    instantaneas = InstantaneasMemoria()
+    instantaneas.iniciar(args.frames)
+    for texto in _textos(sintomas, args.calentamiento, args.seed):
+        api._analizar_con_timing(api.TriageRequest(texto_paciente=texto), None, None)
+    rss_antes = memoria_proceso().get("rss_bytes", 0)
+    instantaneas.tomar("antes")
+
+    t0 = time.perf_counter()
+    for texto in _textos(sintomas, args.requests, args.seed + 1):
+        api._analizar_con_timing(api.TriageRequest(texto_paciente=texto), None, None)
+    dt = time.perf_counter() - t0
+    instantaneas.tomar("despues")
+    rss_despues = memoria_proceso().get("rss_bytes", 0)
+    diff = instantaneas.comparar("antes", "despues", agrupar=args.agrupar, n=args.top)
+    instantaneas.detener()
+    # Como al apagar el worker: primero la cola ML diferida, despues el store.
+    api._cerrar_observaciones()
+
+    if args.json:
+        diff["rss_antes_bytes"] = rss_antes
+        diff["rss_despues_bytes"] = rss_despues
+        print(json.dumps(diff, ensure_ascii=False, indent=2))
+        return 0
+    print(f"{args.requests} requests en {dt:.2f} s (con tracemalloc, {args.frames} frames)")
+    print(
+        f"Heap trazado: {diff['diferencia_bytes'] / 1024:+.1f} KB en {diff['diferencia_bloques']:+d} bloques "
+        f"({diff['diferencia_bytes'] / max(1, args.requests):+.1f} B/request)"
+    )
+    if rss_antes and rss_despues:
+        print(f"RSS: {_mb(rss_antes)} -> {_mb(rss_despues)}")
+    for lugar in diff["lugares"]:
+        print(f"{lugar['diferencia_bytes'] / 1024:+10.1f} KB {lugar['diferencia_bloques']:+7d}  {lugar['lugar']}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Uso de memoria por componente y crecimiento del heap.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_desglose = sub.add_parser("desglose", help="Memoria por componente de un worker recien arrancado.")
+    p_desglose.add_argument("--atributos", type=int, default=8, help="Atributos mas grandes por componente.")
+    p_desglose.add_argument("--json", action="store_true", help="Imprime el resultado como JSON.")
+    p_desglose.set_defaults(func=cmd_desglose)
+
+    p_crec = sub.add_parser("crecimiento", help="Diff de tracemalloc alrededor de N requests de /analizar.")
+    p_crec.add_argument("--requests", type=int, default=2000, help="Requests medidos.")
+    p_crec.add_argument("--calentamiento", type=int, default=200, help="Requests previos a la primera instantanea.")
+    p_crec.add_argument("--frames", type=int, default=1, help="Frames de traceback por asignacion.")
+    p_crec.add_argument("--agrupar", choices=AGRUPACIONES, default="lineno", help="Agrupacion del diff.")
+    p_crec.add_argument("--top", type=int, default=15, help="Lugares a mostrar.")
+    p_crec.add_argument("--seed", type=int, default=42, help="Semilla aleatoria.")
+    p_crec.add_argument("--json", action="store_true", help="Imprime el resultado como JSON.")
+    p_crec.set_defaults(func=cmd_crecimiento)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,247 @@
+# src/metricas.py
+import bisect
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+
+# Limites (segundos) de los histogramas de latencia: de 50 us a 5 s.
+BUCKETS_LATENCIA_S = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Desglose del request en curso: {etapa: segundos} mientras dure desglose().
+_desglose = ContextVar("desglose_etapas", default=None)
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _numero(valor) -> str:
+    if valor == math.inf:
+        return "+Inf"
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+
+def _etiquetas(nombres, valores, extra="") -> str:
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+# Metricas en formato de texto de Prometheus, sin dependencias. Cada metrica
+# guarda sus series en un dict por tupla de etiquetas; registrar es un lock sin
+# contencion mas una suma (y un bisect en los histogramas), unos pocos us.
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._series = {}
+        self._lock = Lock()
+
+    def inc(self, *valores, n: float = 1):
+        with self._lock:
+            self._series[valores] = self._series.get(valores, 0) + n
+
+    def valor(self, *valores) -> float:
+        return self._series.get(valores, 0)
+
+    def lineas(self):
+        with self._lock:
+            series = list(self._series.items())
+        for valores, n in sorted(series):
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {_numero(n)}"
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas=(), buckets=BUCKETS_LATENCIA_S):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        # valores -> [cuentas por bucket (no acumuladas, +Inf al final), suma]
+        self._series = {}
+        self._lock = Lock()
+
+    def observar(self, segundos: float, *valores):
+        pos = bisect.bisect_left(self.buckets, segundos)
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][pos] += 1
+            serie[1] += segundos
+
+    def medir(self, *valores):
+        # with histograma.medir("etapa"): ...
+        return _Cronometro(self, valores)
+
+    def lineas(self):
+        with self._lock:
+            series = [(valores, list(cuentas), suma) for valores, (cuentas, suma) in self._series.items()]
+        for valores, cuentas, suma in sorted(series):
+            acumulado = 0
+            for limite, n in zip(self.buckets + (math.inf,), cuentas):
+                acumulado += n
+                le = f'le="{_numero(float(limite))}"'
+                yield f"{self.nombre}_bucket{_etiquetas(self.etiquetas, valores, le)} {acumulado}"
+            yield f"{self.nombre}_sum{_etiquetas(self.etiquetas, valores)} {_numero(suma)}"
+            yield f"{self.nombre}_count{_etiquetas(self.etiquetas, valores)} {acumulado}"
+
+
+class _Cronometro:
+    __slots__ = ("_histograma", "_valores", "_t0")
+
+    def __init__(self, histograma, valores):
+        self._histograma = histograma
+        self._valores = valores
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        segundos = time.perf_counter() - self._t0
+        self._histograma.observar(segundos, *self._valores)
+        etapas = _desglose.get()
+        if etapas is not None:
+            clave = "/".join(self._valores)
+            etapas[clave] = etapas.get(clave, 0.0) + segundos
+        return False
+
+
+# Los cronometros que corren dentro del bloque (mismo hilo/contexto) ademas de
+# alimentar sus histogramas anotan su duracion en el dict que se entrega.
+@contextmanager
+def desglose():
+    etapas = {}
+    token = _desglose.set(etapas)
+    try:
+        yield etapas
+    finally:
+        _desglose.reset(token)
+
+
+def server_timing(etapas, total_s=None) -> str:
+    # Valor del header Server-Timing (duraciones en ms).
+    partes = [f"{nombre};dur={segundos * 1000:.3f}" for nombre, segundos in etapas.items()]
+    if total_s is not None:
+        partes.append(f"total;dur={total_s * 1000:.3f}")
+    return ", ".join(partes)
+
+
+# Valor leido al momento del scrape: la funcion devuelve un numero, o un dict
+# {tupla de etiquetas: numero} si la metrica tiene etiquetas.
+class Medidor:
+    tipo = "gauge"
+
+    def __init__(self, nombre: str, ayuda: str, funcion, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._funcion = funcion
+
+    def lineas(self):
+        try:
+            valor = self._funcion()
+        except Exception as exc:
+            print(f"Advertencia: no se pudo leer la metrica {self.nombre} ({exc}).")
+            return
+        series = valor.items() if isinstance(valor, dict) else [((), valor)]
+        for valores, n in sorted(series):
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {_numero(float(n))}"
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = []
+
+    def _agregar(self, metrica):
+        if any(m.nombre == metrica.nombre for m in self._metricas):
+            raise ValueError(f"Metrica duplicada: {metrica.nombre}")
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nombre: str, ayuda: str, etiquetas=()):
+        return self._agregar(Contador(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas=(), buckets=BUCKETS_LATENCIA_S):
+        return self._agregar(Histograma(nombre, ayuda, etiquetas, buckets))
+
+    def medidor(self, nombre: str, ayuda: str, funcion, etiquetas=()):
+        return self._agregar(Medidor(nombre, ayuda, funcion, etiquetas))
+
+    def exponer(self) -> str:
+        lineas = []
+        for metrica in self._metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(metrica.lineas())
+        return "\n".join(lineas) + "\n"
+
+
+# Middleware ASGI: requests, errores y latencia por endpoint. La etiqueta es
+# el nombre de la funcion que atendio (el router la deja en scope), no la URL,
+# para no crear una serie por cada path distinto; sin ruta queda "sin_ruta".
+class MetricasHTTP:
+    def __init__(self, app, requests, errores, latencia):
+        self.app = app
+        self._requests = requests
+        self._errores = errores
+        self._latencia = latencia
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        estado = [500]
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado[0] = mensaje["status"]
+            await send(mensaje)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        except Exception:
+            self._errores.inc(self._endpoint(scope), "excepcion")
+            raise
+        finally:
+            endpoint = self._endpoint(scope)
+            self._latencia.observar(time.perf_counter() - t0, endpoint)
+            self._requests.inc(endpoint, scope.get("method", ""), str(estado[0]))
+        if estado[0] >= 500:
+            self._errores.inc(endpoint, "http_5xx")
+
+    @staticmethod
+    def _endpoint(scope) -> str:
+        endpoint = scope.get("endpoint")
+        return getattr(endpoint, "__name__", None) or "sin_ruta"
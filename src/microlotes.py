@@ -0,0 +1,94 @@
+# src/microlotes.py
+import time
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition, Thread
+
+
+BUCKETS_TAMANO_LOTE = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+# Junta llamadas concurrentes en lotes: el primer item abre el lote, que se
+# despacha al llegar a max_lote o al pasar max_espera_s. Cada llamador recibe
+# un Future con su resultado. funcion_lote(items) devuelve una lista de
+# resultados en el mismo orden; si falla, todos los del lote reciben la
+# excepcion. Opcionalmente observa el tamano de cada lote y la espera en cola
+# de cada item en histogramas de metricas.py.
+class MicroLoteador:
+    def __init__(
+        self,
+        funcion_lote,
+        max_lote: int = 32,
+        max_espera_s: float = 0.002,
+        histograma_lote=None,
+        histograma_espera=None,
+        nombre: str = "microlotes",
+    ):
+        self._funcion_lote = funcion_lote
+        self.max_lote = max(1, int(max_lote))
+        self.max_espera_s = max(0.0, float(max_espera_s))
+        self._histograma_lote = histograma_lote
+        self._histograma_espera = histograma_espera
+        self._cola = deque()
+        self._cond = Condition()
+        self._cerrado = False
+        self.lotes = 0
+        self.items = 0
+        self._hilo = Thread(target=self._bucle, name=nombre, daemon=True)
+        self._hilo.start()
+
+    @property
+    def pendientes(self) -> int:
+        return len(self._cola)
+
+    def enviar(self, item) -> Future:
+        futuro = Future()
+        with self._cond:
+            if self._cerrado:
+                raise RuntimeError("El micro-loteador ya fue cerrado.")
+            self._cola.append((item, futuro, time.perf_counter()))
+            if len(self._cola) == 1 or len(self._cola) >= self.max_lote:
+                self._cond.notify_all()
+        return futuro
+
+    def resolver(self, item, timeout: float = 10.0):
+        return self.enviar(item).result(timeout)
+
+    def _bucle(self):
+        while True:
+            with self._cond:
+                while not self._cola and not self._cerrado:
+                    self._cond.wait()
+                if not self._cola:
+                    return
+                limite = self._cola[0][2] + self.max_espera_s
+                while len(self._cola) < self.max_lote and not self._cerrado:
+                    restante = limite - time.perf_counter()
+                    if restante <= 0:
+                        break
+                    self._cond.wait(restante)
+                lote = [self._cola.popleft() for _ in range(min(self.max_lote, len(self._cola)))]
+
+            inicio = time.perf_counter()
+            if self._histograma_lote is not None:
+                self._histograma_lote.observar(len(lote))
+            if self._histograma_espera is not None:
+                for _, _, encolado in lote:
+                    self._histograma_espera.observar(inicio - encolado)
+            try:
+                resultados = self._funcion_lote([item for item, _, _ in lote])
+            except Exception as exc:
+                for _, futuro, _ in lote:
+                    futuro.set_exception(exc)
+            else:
+                for (_, futuro, _), resultado in zip(lote, resultados):
+                    futuro.set_result(resultado)
+            self.lotes += 1
+            self.items += len(lote)
+
+    def cerrar(self, timeout: float = 10.0):
+        # Lo ya encolado se despacha antes de terminar.
+        with self._cond:
+            self._cerrado = True
+            self._cond.notify_all()
+        self._hilo.join(timeout)
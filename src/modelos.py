@@ -0,0 +1,239 @@
+# src/modelos.py
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Event, Lock, Thread
+
+from puntuador_lineal import PuntuadorLineal, ruta_puntuador, sha256_archivo
+
+
+MOTORES_ML = ("auto", "lineal", "sklearn")
+MAX_VERSIONES = 3
+MAX_HISTORIAL = 20
+
+
+# Un bundle ya cargado e inmutable. La version es el prefijo del sha256 del
+# archivo del bundle: el mismo archivo da siempre la misma version.
+class ModeloCargado:
+    def __init__(self, version: str, motor: str, path, meta, carga_ms: float, puntuador=None, vectorizer=None, clf=None):
+        self.version = version
+        self.motor = motor
+        self.path = str(path)
+        self.meta = meta or {}
+        self.carga_ms = carga_ms
+        self.cargado_en = datetime.now(timezone.utc).isoformat()
+        self.activado_en = None
+        self.puntuador = puntuador
+        self.vectorizer = vectorizer
+        self.clf = clf
+
+    def predecir_lote(self, textos):
+        if self.puntuador is not None:
+            return self.puntuador.predecir_lote(textos)
+        return [int(p) for p in self.clf.predict(self.vectorizer.transform(textos))]
+
+    def info(self):
+        return {
+            "version": self.version,
+            "motor": self.motor,
+            "path": self.path,
+            "trained_at_utc": self.meta.get("trained_at_utc"),
+            "dataset_sha256": self.meta.get("dataset_sha256"),
+            "sklearn_version": self.meta.get("sklearn_version"),
+            "cargado_en": self.cargado_en,
+            "carga_ms": round(self.carga_ms, 2),
+            "activado_en": self.activado_en,
+        }
+
+
+def cargar_modelo(path, motor: str = "auto") -> ModeloCargado:
+    # "lineal" puntua con el artefacto de train.py (sin importar sklearn ni
+    # joblib); "sklearn" usa el bundle; "auto" usa el puntuador si corresponde
+    # al bundle (bundle_sha256) y si no, sklearn. "lineal" tambien exige que
+    # corresponda, salvo que el bundle no este (despliegue solo con el
+    # puntuador): un puntuador viejo junto a un bundle nuevo no se publica.
+    if motor not in MOTORES_ML:
+        raise ValueError(f"Motor ML desconocido: {motor!r}. Opciones: {', '.join(MOTORES_ML)}")
+    t0 = time.perf_counter()
+    path = Path(path)
+    scorer_path = ruta_puntuador(path)
+    sha = sha256_archivo(path) if path.exists() else None
+
+    if motor != "sklearn" and scorer_path.exists():
+        try:
+            puntuador = PuntuadorLineal.cargar(scorer_path)
+        except Exception as exc:
+            print(f"Advertencia: no se pudo cargar el puntuador lineal ({exc}). Se usara sklearn.")
+            puntuador = None
+        if puntuador is not None and (puntuador.meta.get("bundle_sha256") == sha or (motor == "lineal" and sha is None)):
+            version = (puntuador.meta.get("bundle_sha256") or "sin_version")[:12]
+            carga_ms = (time.perf_counter() - t0) * 1000
+            return ModeloCargado(version, "lineal", scorer_path, puntuador.meta, carga_ms, puntuador=puntuador)
+        if puntuador is not None:
+            print("Advertencia: el puntuador lineal no corresponde al bundle actual. Se usara sklearn.")
+    elif motor == "lineal":
+        print(f"Advertencia: no existe {scorer_path.name} (python train.py lo genera). Se usara sklearn.")
+
+    if sha is None:
+        raise FileNotFoundError(f"No existe el modelo: {path}")
+    import joblib
+
+    bundle = joblib.load(path)
+    vectorizer = bundle.get("vectorizer")
+    clf = bundle.get("clf")
+    if vectorizer is None or clf is None:
+        raise ValueError(f"El bundle {path.name} no tiene vectorizer y clf.")
+    carga_ms = (time.perf_counter() - t0) * 1000
+    return ModeloCargado(sha[:12], "sklearn", path, bundle.get("meta"), carga_ms, vectorizer=vectorizer, clf=clf)
+
+
+# Versiones cargadas y la activa. Cargar arma el modelo completo fuera del
+# lock y recien despues lo publica en `activo` con una sola asignacion: cada
+# request toma esa referencia una vez y nunca ve un modelo a medio cargar.
+# Se conservan las ultimas MAX_VERSIONES (nunca se descarta la activa) para
+# poder volver atras sin releer disco.
+class RegistroModelos:
+    def __init__(self, motor: str = "auto", max_versiones: int = MAX_VERSIONES):
+        if motor not in MOTORES_ML:
+            raise ValueError(f"Motor ML desconocido: {motor!r}. Opciones: {', '.join(MOTORES_ML)}")
+        self.motor = motor
+        self.max_versiones = max(1, int(max_versiones))
+        self.activo = None
+        self._versiones = {}
+        self._historial = []
+        self._lock = Lock()
+        self.cargando = None
+        self.ultimo_error = None
+        self._vigilancia = None
+        self._fin_vigilancia = Event()
+        self._al_activar = []
+
+    @property
+    def version(self):
+        activo = self.activo
+        return activo.version if activo is not None else None
+
+    def al_activar(self, funcion):
+        # funcion(modelo) corre dentro del lock cada vez que cambia el activo:
+        # debe ser rapida (p. ej. invalidar caches que dependen del modelo).
+        self._al_activar.append(funcion)
+
+    def cargar(self, path, activar: bool = True) -> ModeloCargado:
+        modelo = cargar_modelo(path, self.motor)
+        with self._lock:
+            self._versiones.pop(modelo.version, None)
+            self._versiones[modelo.version] = modelo
+            if activar:
+                self._activar(modelo)
+            self._podar()
+        return modelo
+
+    def _activar(self, modelo: ModeloCargado):
+        modelo.activado_en = datetime.now(timezone.utc).isoformat()
+        self.activo = modelo
+        if not self._historial or self._historial[-1] != modelo.version:
+            self._historial.append(modelo.version)
+            del self._historial[:-MAX_HISTORIAL]
+        for funcion in self._al_activar:
+            try:
+                funcion(modelo)
+            except Exception as exc:
+                print(f"Advertencia: fallo un aviso de activacion de modelo ({exc}).")
+
+    def _podar(self):
+        for version in list(self._versiones):
+            if len(self._versiones) <= self.max_versiones:
+                break
+            if self.activo is None or version != self.activo.version:
+                del self._versiones[version]
+
+    def activar(self, version: str) -> ModeloCargado:
+        with self._lock:
+            modelo = self._versiones.get(version)
+            if modelo is None:
+                raise KeyError(version)
+            self._activar(modelo)
+            return modelo
+
+    def revertir(self) -> ModeloCargado:
+        # Vuelve a la version activa anterior que siga cargada.
+        with self._lock:
+            actual = self.version
+            for version in reversed(self._historial[:-1]):
+                if version != actual and version in self._versiones:
+                    self._activar(self._versiones[version])
+                    return self.activo
+        raise ValueError("No hay una version anterior cargada a la cual volver.")
+
+    def cargar_en_segundo_plano(self, path, activar: bool = True):
+        with self._lock:
+            if self.cargando is not None:
+                raise ValueError(f"Ya hay una carga en curso: {self.cargando}")
+            self.cargando = str(path)
+        Thread(target=self._cargar_fondo, args=(path, activar), name="modelos-carga", daemon=True).start()
+
+    def _cargar_fondo(self, path, activar: bool):
+        try:
+            modelo = self.cargar(path, activar=activar)
+            self.ultimo_error = None
+            print(f"Modelo {modelo.version} ({modelo.motor}) cargado desde {path}{' y activado' if activar else ''}.")
+        except Exception as exc:
+            self.ultimo_error = f"{path}: {exc}"
+            print(f"Advertencia: no se pudo cargar el modelo {path} ({exc}). Sigue el modelo anterior.")
+        finally:
+            self.cargando = None
+
+    @staticmethod
+    def _firma(path):
+        # Cambia al reescribir el bundle o su puntuador.
+        firma = []
+        for p in (Path(path), ruta_puntuador(path)):
+            try:
+                st = os.stat(p)
+                firma.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                firma.append(None)
+        return tuple(firma)
+
+    def vigilar(self, path, intervalo_s: float):
+        # Recarga y activa el bundle cuando cambia en disco. Espera a ver la
+        # misma firma en dos sondeos seguidos para no leer un archivo a medio
+        # copiar.
+        def bucle():
+            vista = self._firma(path)
+            candidata = None
+            while not self._fin_vigilancia.wait(intervalo_s):
+                firma = self._firma(path)
+                if firma == vista or firma[0] is None:
+                    candidata = None
+                    continue
+                if firma != candidata:
+                    candidata = firma
+                    continue
+                try:
+                    self.cargar_en_segundo_plano(path)
+                except ValueError:
+                    # Hay otra carga en curso: se reintenta en el proximo sondeo.
+                    continue
+                vista, candidata = firma, None
+
+        self._vigilancia = Thread(target=bucle, name="modelos-vigilancia", daemon=True)
+        self._vigilancia.start()
+
+    def estado(self):
+        with self._lock:
+            return {
+                "motor": self.motor,
+                "activo": self.activo.info() if self.activo is not None else None,
+                "versiones": [modelo.info() for modelo in self._versiones.values()],
+                "historial": list(self._historial),
+                "cargando": self.cargando,
+                "ultimo_error": self.ultimo_error,
+                "vigilando": self._vigilancia is not None and self._vigilancia.is_alive(),
+            }
+
+    def cerrar(self):
+        self._fin_vigilancia.set()
+        if self._vigilancia is not None:
+            self._vigilancia.join(5)
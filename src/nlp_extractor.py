@@ -1,7 +1,13 @@
 # src/nlp_extractor.py
+import os
 import re
+import time
 import unicodedata
-from catalogo_sintomas import CATALOGO_SINTOMAS
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cache_extractor
+from catalogo_sintomas import CATALOGO_HUELLA, CATALOGO_SINTOMAS
 
 
 def _normalizar(texto: str) -> str:
@@ -15,37 +21,285 @@ def _normalizar(texto: str) -> str:
     return t
 
 
-class SintomaExtractor:
-    _NEGACION_PATRONES = (
-        r"\bno\b(?:\s+\w+){0,3}\s*$",
-        r"\bsin\b(?:\s+\w+){0,3}\s*$",
-        r"\bniega\b(?:\s+\w+){0,3}\s*$",
-        r"\bniego\b(?:\s+\w+){0,3}\s*$",
-        r"\bdescarta\b(?:\s+\w+){0,3}\s*$",
-        r"\bdescarto\b(?:\s+\w+){0,3}\s*$",
-        r"\bausencia\s+de\b(?:\s+\w+){0,3}\s*$",
-        r"\blibre\s+de\b(?:\s+\w+){0,3}\s*$",
+def _tokenizar(txt_norm: str):
+    tokens = txt_norm.split(" ")
+    inicios = []
+    pos = 0
+    for tok in tokens:
+        inicios.append(pos)
+        pos += len(tok) + 1
+    return tokens, inicios
+
+
+# Motor original: un patron \b...\b por variante, un recorrido del texto por variante.
+class _MotorRegex:
+    nombre = "regex"
+    # Los patrones compilados no se benefician de persistirse: pickle los recompila.
+    cacheable = False
+
+    def __init__(self, variantes, estado=None):
+        self._patrones = [
+            re.compile(r"\b" + re.escape(item["vn"]) + r"\b") for item in variantes
+        ]
+
+    def buscar(self, txt_norm, tokens, inicios):
+        token_en = {pos: i for i, pos in enumerate(inicios)}
+        for idx, pat in enumerate(self._patrones):
+            for m in pat.finditer(txt_norm):
+                yield idx, m.start(), m.end(), token_en[m.start()]
+
+
+# Automata Aho-Corasick sobre tokens: una sola pasada por el texto.
+# El texto normalizado solo contiene [a-z0-9] separados por un espacio, asi que
+# comparar tokens completos equivale a los limites \b del motor regex.
+class _MotorAhoCorasick:
+    nombre = "aho"
+    cacheable = True
+
+    def __init__(self, variantes, estado=None):
+        if estado is not None:
+            self._goto, self._fallo, self._salida = estado
+            return
+
+        self._goto = [{}]
+        self._fallo = [0]
+        self._salida = [[]]
+
+        for idx, item in enumerate(variantes):
+            nodo = 0
+            for tok in item["vn"].split(" "):
+                sig = self._goto[nodo].get(tok)
+                if sig is None:
+                    sig = len(self._goto)
+                    self._goto[nodo][tok] = sig
+                    self._goto.append({})
+                    self._fallo.append(0)
+                    self._salida.append([])
+                nodo = sig
+            self._salida[nodo].append((idx, item["len_tokens"]))
+
+        cola = deque(self._goto[0].values())
+        while cola:
+            nodo = cola.popleft()
+            for tok, sig in self._goto[nodo].items():
+                cola.append(sig)
+                f = self._fallo[nodo]
+                while f and tok not in self._goto[f]:
+                    f = self._fallo[f]
+                self._fallo[sig] = self._goto[f].get(tok, 0)
+                self._salida[sig].extend(self._salida[self._fallo[sig]])
+
+    # Solo tipos basicos: el artefacto se lee antes de que este modulo termine
+    # de importarse, asi que no puede contener instancias de sus clases.
+    def estado(self):
+        return self._goto, self._fallo, self._salida
+
+    def buscar(self, txt_norm, tokens, inicios):
+        goto = self._goto
+        fallo = self._fallo
+        salida = self._salida
+        encontrados = []
+        nodo = 0
+        for i, tok in enumerate(tokens):
+            while nodo and tok not in goto[nodo]:
+                nodo = fallo[nodo]
+            nodo = goto[nodo].get(tok, 0)
+            for idx, n_tokens in salida[nodo]:
+                encontrados.append((idx, i - n_tokens + 1, i))
+
+        # Mismo orden y misma semantica que finditer: por variante, de
+        # izquierda a derecha y sin solapar coincidencias de la misma variante.
+        encontrados.sort()
+        ultimo_idx = -1
+        ultimo_fin = -1
+        for idx, t_ini, t_fin in encontrados:
+            if idx == ultimo_idx and t_ini <= ultimo_fin:
+                continue
+            ultimo_idx = idx
+            ultimo_fin = t_fin
+            yield idx, inicios[t_ini], inicios[t_fin] + len(tokens[t_fin]), t_ini
+
+
+# Marca en una sola pasada izquierda->derecha que tokens quedan dentro del
+# alcance de una negacion. Reglas (iguales a las de los regex originales):
+# - disparador ("no", "sin", "ausencia de"...) seguido de 0-3 tokens;
+# - "pero", "aunque", "sin embargo"... cortan la negacion previa;
+# - "no solo/solamente/unicamente" + 0-2 tokens anula la negacion;
+# - "no ... ni <sintoma>" niega lo que sigue a "ni";
+# - solo cuenta el contexto de los 60 caracteres previos (tokens completos).
+class _AnalizadorNegacion:
+    DISPARADORES = (
+        ("no",),
+        ("sin",),
+        ("niega",),
+        ("niego",),
+        ("descarta",),
+        ("descarto",),
+        ("ausencia", "de"),
+        ("libre", "de"),
     )
-    _NEGACION_EXCEPCIONES = (
-        r"\bno\s+solo(?:\s+\w+){0,2}\s*$",
-        r"\bno\s+solamente(?:\s+\w+){0,2}\s*$",
-        r"\bno\s+unicamente(?:\s+\w+){0,2}\s*$",
+    EXCEPCIONES = (
+        ("no", "solo"),
+        ("no", "solamente"),
+        ("no", "unicamente"),
     )
-    _RESETEAR_NEGACION = re.compile(
-        r"\b(pero|aunque|sin embargo|excepto|salvo)\b"
+    RESETEOS = (
+        ("pero",),
+        ("aunque",),
+        ("sin", "embargo"),
+        ("excepto",),
+        ("salvo",),
     )
+    VENTANA_TOKENS = 3
+    VENTANA_TOKENS_EXCEPCION = 2
+    VENTANA_CHARS = 60
+    CONECTOR_NI = "ni"
+    NEGADORES_NI = frozenset({"no", "sin"})
+
+    def __init__(self):
+        # Frases indexadas por su ultimo token: al consumir un token solo se
+        # revisan las frases que pueden terminar en el.
+        self._por_ultimo = {}
+        for tipo, frases in (
+            ("disparador", self.DISPARADORES),
+            ("excepcion", self.EXCEPCIONES),
+            ("reseteo", self.RESETEOS),
+        ):
+            for frase in frases:
+                self._por_ultimo.setdefault(frase[-1], []).append((frase, tipo))
+
+    def marcar(self, tokens, inicios):
+        negados = [False] * len(tokens)
+        reseteo_fin = -1
+        disparador = None
+        excepcion = None
+        ultimo_negador_ni = -1
 
-    def __init__(self, catalogo=None):
+        for i, tok in enumerate(tokens):
+            ventana = inicios[i] - self.VENTANA_CHARS
+
+            # La excepcion ("no solo ...") tiene prioridad sobre cualquier disparador.
+            en_excepcion = (
+                excepcion is not None
+                and excepcion[0] > reseteo_fin
+                and inicios[excepcion[0]] >= ventana
+                and i - excepcion[1] - 1 <= self.VENTANA_TOKENS_EXCEPCION
+            )
+            if not en_excepcion:
+                if (
+                    disparador is not None
+                    and disparador[0] > reseteo_fin
+                    and inicios[disparador[0]] >= ventana
+                    and i - disparador[1] - 1 <= self.VENTANA_TOKENS
+                ):
+                    negados[i] = True
+                elif (
+                    i > 0
+                    and tokens[i - 1] == self.CONECTOR_NI
+                    and i - 1 > reseteo_fin
+                    and ultimo_negador_ni > reseteo_fin
+                    and inicios[ultimo_negador_ni] >= ventana
+                ):
+                    negados[i] = True
+
+            if tok in self.NEGADORES_NI:
+                ultimo_negador_ni = i
+            for frase, tipo in self._por_ultimo.get(tok, ()):
+                ini = i - len(frase) + 1
+                if ini < 0 or tuple(tokens[ini : i + 1]) != frase:
+                    continue
+                if tipo == "reseteo":
+                    reseteo_fin = i
+                elif tipo == "disparador":
+                    disparador = (ini, i)
+                else:
+                    excepcion = (ini, i)
+
+        return negados
+
+
+# Tramos [start, end) ya seleccionados, como mapa de ocupacion por caracter.
+# Consultar y marcar una mencion cuesta O(largo del tramo) sin importar
+# cuantas menciones ya se eligieron; el orden por inicio se arma una sola vez
+# al final, O(k log k). (Listas ordenadas con insert eran O(k) por mencion.)
+class _IndiceOcupado:
+    def __init__(self):
+        self._ocupado = bytearray()
+        self._elegidas = []
+
+    def ocupar_si_libre(self, start, end, valor):
+        if end > len(self._ocupado):
+            self._ocupado.extend(bytes(end - len(self._ocupado)))
+        if self._ocupado.find(1, start, end) != -1:
+            return False
+        self._ocupado[start:end] = b"\x01" * (end - start)
+        self._elegidas.append((start, valor))
+        return True
+
+    def valores(self):
+        return [valor for _, valor in sorted(self._elegidas, key=lambda x: x[0])]
+
+
+MOTORES = {
+    _MotorRegex.nombre: _MotorRegex,
+    _MotorAhoCorasick.nombre: _MotorAhoCorasick,
+}
+MOTOR_POR_DEFECTO = _MotorAhoCorasick.nombre
+
+
+class SintomaExtractor:
+    # Por debajo de este tamano el costo de levantar procesos no compensa.
+    LOTE_MIN_PARALELO = 256
+    BLOQUES_POR_PROCESO = 4
+
+    def __init__(self, catalogo=None, motor=MOTOR_POR_DEFECTO, usar_cache=True):
+        if motor not in MOTORES:
+            raise ValueError(
+                f"Motor de extraccion desconocido: {motor!r}. "
+                f"Opciones: {', '.join(sorted(MOTORES))}"
+            )
+        t0 = time.perf_counter()
+        usar_artefacto = catalogo is None and usar_cache
         self.catalogo = catalogo if catalogo is not None else CATALOGO_SINTOMAS
+        # El id de cada sintoma canonico es su posicion en el catalogo.
         self._orden = list(self.catalogo.keys())
-        self._negacion_regex = [re.compile(p) for p in self._NEGACION_PATRONES]
-        self._negacion_excepcion_regex = [
-            re.compile(p) for p in self._NEGACION_EXCEPCIONES
-        ]
+        self._id_por_canon = {canon: i for i, canon in enumerate(self._orden)}
+        self._negacion = _AnalizadorNegacion()
+        self.motor = motor
+        self.origen = "construido"
 
+        artefacto = cache_extractor.cargar(CATALOGO_HUELLA) if usar_artefacto else None
+        variantes = (artefacto or {}).get("variantes")
+        estado = ((artefacto or {}).get("motores") or {}).get(motor)
+        actualizar = False
+        if variantes is None:
+            variantes = self._construir_variantes(self.catalogo, self._id_por_canon)
+            actualizar = True
+            estado = None
+        if estado is None:
+            motor_obj = MOTORES[motor](variantes)
+            actualizar = actualizar or motor_obj.cacheable
+        else:
+            motor_obj = MOTORES[motor](variantes, estado=estado)
+            self.origen = "artefacto"
+
+        if usar_artefacto and actualizar:
+            cache_extractor.guardar(
+                CATALOGO_HUELLA,
+                catalogo=dict(self.catalogo),
+                variantes=variantes,
+                motores={motor: motor_obj.estado()} if motor_obj.cacheable else {},
+            )
+
+        self._variantes = variantes
+        self._motor = motor_obj
+        self.construccion_ms = (time.perf_counter() - t0) * 1000
+
+    @staticmethod
+    def _construir_variantes(catalogo, id_por_canon):
         variantes = []
         vistos = set()
-        for canon, lista in self.catalogo.items():
+        for canon, lista in catalogo.items():
             all_variantes = [canon] + list(lista)
             for v in all_variantes:
                 vn = _normalizar(v)
@@ -55,77 +309,49 @@ class SintomaExtractor:
                 if key in vistos:
                     continue
                 vistos.add(key)
-                pat = re.compile(r"\b" + re.escape(vn) + r"\b")
                 variantes.append(
                     {
                         "canon": canon,
+                        "id": id_por_canon[canon],
                         "vn": vn,
-                        "pat": pat,
                         "len_chars": len(vn),
                         "len_tokens": len(vn.split()),
                     }
                 )
         variantes.sort(key=lambda x: (x["len_tokens"], x["len_chars"]), reverse=True)
-        self._variantes = variantes
-
-    def _esta_negado(self, texto_norm, start):
-        contexto = texto_norm[max(0, start - 60) : start].strip()
-        if not contexto:
-            return False
-
-        # Si hay un conector ("pero", "aunque"...), solo evaluamos
-        # el fragmento mas cercano al sintoma para no arrastrar negaciones previas.
-        ult_reset = None
-        for m in self._RESETEAR_NEGACION.finditer(contexto):
-            ult_reset = m
-        if ult_reset is not None:
-            contexto = contexto[ult_reset.end() :].strip()
-            if not contexto:
-                return False
-
-        for patron_exc in self._negacion_excepcion_regex:
-            if patron_exc.search(contexto):
-                return False
-
-        for patron in self._negacion_regex:
-            if patron.search(contexto):
-                return True
+        return variantes
 
-        # Maneja casos como: "no ... ni <sintoma>"
-        if re.search(r"\bni\s*$", contexto) and re.search(r"\b(no|sin)\b", contexto):
-            return True
-
-        return False
-
-    def _detectar_menciones(self, texto):
+    def _detectar_menciones(self, texto, medir=None):
+        # medir(etapa) -> context manager opcional para cronometrar la negacion.
         txt_norm = _normalizar(texto)
         if not txt_norm:
             return txt_norm, []
 
+        tokens, inicios = _tokenizar(txt_norm)
+        if medir is None:
+            negados = self._negacion.marcar(tokens, inicios)
+        else:
+            with medir("negacion"):
+                negados = self._negacion.marcar(tokens, inicios)
+
         menciones = []
-        for item in self._variantes:
-            canon = item["canon"]
-            vn = item["vn"]
-            pat = item["pat"]
-            for m in pat.finditer(txt_norm):
-                if self._esta_negado(txt_norm, m.start()):
-                    continue
-                menciones.append(
-                    {
-                        "canon": canon,
-                        "vn": vn,
-                        "start": m.start(),
-                        "end": m.end(),
-                        "len_chars": item["len_chars"],
-                        "len_tokens": item["len_tokens"],
-                    }
-                )
+        for idx, start, end, t_ini in self._motor.buscar(txt_norm, tokens, inicios):
+            if negados[t_ini]:
+                continue
+            item = self._variantes[idx]
+            menciones.append(
+                {
+                    "canon": item["canon"],
+                    "id": item["id"],
+                    "vn": item["vn"],
+                    "start": start,
+                    "end": end,
+                    "len_chars": item["len_chars"],
+                    "len_tokens": item["len_tokens"],
+                }
+            )
         return txt_norm, menciones
 
-    @staticmethod
-    def _se_solapan(a, b):
-        return not (a["end"] <= b["start"] or b["end"] <= a["start"])
-
     def _resolver_solapamientos(self, menciones):
         if not menciones:
             return []
@@ -137,30 +363,119 @@ class SintomaExtractor:
             reverse=True,
         )
 
-        seleccionadas = []
+        ocupado = _IndiceOcupado()
         for m in ordenadas:
-            if any(self._se_solapan(m, s) for s in seleccionadas):
-                continue
-            seleccionadas.append(m)
+            ocupado.ocupar_si_libre(m["start"], m["end"], m)
+        return ocupado.valores()
 
-        seleccionadas.sort(key=lambda x: x["start"])
-        return seleccionadas
+    @property
+    def sintomas_por_id(self):
+        return self._orden
 
-    def _ordenar_detectados(self, detectados):
-        resultado = [c for c in self._orden if c in detectados]
-        resto = [c for c in detectados if c not in self._orden]
-        resultado.extend(sorted(resto))
-        return resultado
+    def id_de(self, canon):
+        return self._id_por_canon[canon]
 
-    def extraer(self, texto):
-        _, menciones = self._detectar_menciones(texto)
+    def mascara_de(self, sintomas):
+        mascara = 0
+        for canon in sintomas:
+            mascara |= 1 << self._id_por_canon[canon]
+        return mascara
+
+    @staticmethod
+    def ids_de_mascara(mascara):
+        ids = []
+        while mascara:
+            bajo = mascara & -mascara
+            ids.append(bajo.bit_length() - 1)
+            mascara ^= bajo
+        return ids
+
+    def extraer_mascara(self, texto, medir=None):
+        _, menciones = self._detectar_menciones(texto, medir)
         if not menciones:
-            return []
+            return 0
+        mascara = 0
+        for m in self._resolver_solapamientos(menciones):
+            mascara |= 1 << m["id"]
+        return mascara
+
+    def extraer_ids(self, texto):
+        return self.ids_de_mascara(self.extraer_mascara(texto))
 
-        menciones = self._resolver_solapamientos(menciones)
-        detectados = {m["canon"] for m in menciones}
-        return self._ordenar_detectados(detectados)
+    def extraer(self, texto):
+        orden = self._orden
+        return [orden[i] for i in self.extraer_ids(texto)]
 
     def extraer_bool(self, texto):
-        detectados = set(self.extraer(texto))
-        return {canon: canon in detectados for canon in self._orden}
+        mascara = self.extraer_mascara(texto)
+        return {canon: bool(mascara >> i & 1) for i, canon in enumerate(self._orden)}
+
+    def extraer_vector(self, texto):
+        try:
+            import numpy as np
+        except ImportError as exc:
+            raise RuntimeError("extraer_vector requiere numpy instalado.") from exc
+
+        vector = np.zeros(len(self._orden), dtype=bool)
+        vector[self.extraer_ids(texto)] = True
+        return vector
+
+    SALIDAS_LOTE = ("nombres", "ids", "mascara")
+
+    def extraer_lote(
+        self,
+        textos,
+        procesos=None,
+        tam_bloque=None,
+        min_paralelo=None,
+        salida="nombres",
+    ):
+        if salida not in self.SALIDAS_LOTE:
+            raise ValueError(
+                f"Salida desconocida: {salida!r}. Opciones: {', '.join(self.SALIDAS_LOTE)}"
+            )
+        textos = list(textos)
+        if procesos is None:
+            procesos = os.cpu_count() or 1
+        if min_paralelo is None:
+            min_paralelo = self.LOTE_MIN_PARALELO
+        procesos = max(1, min(int(procesos), len(textos)))
+        if procesos == 1 or len(textos) < min_paralelo:
+            return _extraer_textos(self, textos, salida)
+
+        if tam_bloque is None:
+            tam_bloque = -(-len(textos) // (procesos * self.BLOQUES_POR_PROCESO))
+        bloques = [textos[i : i + tam_bloque] for i in range(0, len(textos), tam_bloque)]
+
+        # Con el catalogo por defecto cada worker lo carga desde el artefacto.
+        catalogo = None if self.catalogo is CATALOGO_SINTOMAS else self.catalogo
+        with ProcessPoolExecutor(
+            max_workers=procesos,
+            initializer=_inicializar_worker,
+            initargs=(catalogo, self.motor),
+        ) as pool:
+            resultado = []
+            for parcial in pool.map(_extraer_bloque, bloques, [salida] * len(bloques)):
+                resultado.extend(parcial)
+        return resultado
+
+
+# Extractor propio de cada proceso del pool de extraer_lote.
+_extractor_worker = None
+
+
+def _inicializar_worker(catalogo, motor):
+    global _extractor_worker
+    _extractor_worker = SintomaExtractor(catalogo=catalogo, motor=motor)
+
+
+def _extraer_textos(extractor, textos, salida):
+    if salida == "mascara":
+        return [extractor.extraer_mascara(t) for t in textos]
+    if salida == "ids":
+        return [extractor.extraer_ids(t) for t in textos]
+    return [extractor.extraer(t) for t in textos]
+
+
+def _extraer_bloque(textos, salida):
+    return _extraer_textos(_extractor_worker, textos, salida)
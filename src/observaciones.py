@@ -0,0 +1,2118 @@
+# src/observaciones.py
+import atexit
+import bisect
+import csv
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import os
+import shutil
+import sqlite3
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Condition, Event, Lock, RLock, Thread
+
+from ventanas import VentanasDeslizantes
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin modo multiproceso.
+    fcntl = None
+
+
+OBS_FIELDS = [
+    "id",
+    "caso",
+    "sintomas_texto",
+    "nivel_sistema",
+    "nivel_referencia",
+    "recomendacion_sistema",
+    "recomendacion_referencia",
+    "adequacy_score",
+    "intime",
+    "outtime",
+    "wait_base_min",
+    "alarm",
+    "override",
+]
+BACKENDS = ("csv", "sqlite", "segmentos")
+MODOS_ESCRITURA = ("sync", "buffer")
+POLITICAS_FSYNC = ("nunca", "lote", "intervalo")
+POLITICAS_DESBORDE = ("descartar", "desconectar")
+GENERADORES_ID = ("secuencial", "snowflake")
+
+# Ids snowflake: milisegundos desde IDS_EPOCA_MS | nodo | secuencia, en 53 bits
+# para que sigan siendo exactos como numero de JSON/JavaScript.
+IDS_EPOCA_MS = 1704067200000  # 2024-01-01 UTC
+IDS_BITS_NODO = 7
+IDS_BITS_SECUENCIA = 5
+IDS_MAX_NODO = (1 << IDS_BITS_NODO) - 1
+
+# Subir al cambiar el contenido del checkpoint de contadores del CSV.
+CHECKPOINT_FORMATO = 2
+# Bytes previos al offset que se firman para detectar un CSV reemplazado o truncado.
+_CHECKPOINT_FIRMA_BYTES = 4096
+# Cada cuantas filas se anota (id, offset) en el indice disperso del CSV.
+_INDICE_CADA_FILAS = 1024
+# Subir al cambiar la estructura del manifest.json del backend por segmentos.
+SEGMENTOS_FORMATO = 1
+# Lo mismo que escribe csv.DictWriter.writeheader().
+_CABECERA_CSV = ",".join(OBS_FIELDS) + "\r\n"
+
+
+# Cola de filas pendientes con un hilo que las escribe en lotes: cuando se
+# juntan max_filas o pasan max_espera_s desde la primera fila encolada.
+class _EscritorDiferido:
+    def __init__(
+        self, escribir_lote, max_filas: int = 256, max_espera_s: float = 0.2, nombre: str = "observaciones-escritor"
+    ):
+        self._escribir_lote = escribir_lote
+        self._max_filas = max(1, int(max_filas))
+        self._max_espera_s = max(0.0, float(max_espera_s))
+        self._cola = deque()
+        self._cond = Condition()
+        self._cerrado = False
+        self._forzar = False
+        self._encoladas = 0
+        self._procesadas = 0
+        self.perdidas = 0
+        self._hilo = Thread(target=self._bucle, name=nombre, daemon=True)
+        self._hilo.start()
+
+    @property
+    def pendientes(self) -> int:
+        return len(self._cola)
+
+    def encolar(self, row) -> int:
+        # Devuelve el numero de orden de la fila, para esperar() su escritura.
+        with self._cond:
+            if self._cerrado:
+                raise RuntimeError("El escritor de observaciones ya fue cerrado.")
+            self._cola.append(row)
+            self._encoladas += 1
+            if len(self._cola) == 1 or len(self._cola) >= self._max_filas:
+                self._cond.notify_all()
+            return self._encoladas
+
+    def esperar(self, numero: int, timeout: float = 30.0) -> bool:
+        limite = time.monotonic() + timeout
+        with self._cond:
+            while self._procesadas < numero and self._hilo.is_alive():
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return False
+                self._cond.wait(restante)
+            return self._procesadas >= numero
+
+    def _bucle(self):
+        while True:
+            with self._cond:
+                while not self._cola and not self._cerrado:
+                    self._cond.wait()
+                limite = time.monotonic() + self._max_espera_s
+                while (
+                    len(self._cola) < self._max_filas
+                    and not self._cerrado
+                    and not self._forzar
+                ):
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._cond.wait(restante)
+                self._forzar = False
+                lote = list(self._cola)
+                self._cola.clear()
+                cerrado = self._cerrado
+                if not lote and cerrado:
+                    return
+
+            try:
+                self._escribir_lote(lote)
+            except Exception as exc:
+                print(f"Advertencia: no se pudieron escribir {len(lote)} observaciones ({exc}).")
+                with self._cond:
+                    if cerrado:
+                        # Al cerrar no hay a quien devolverle las filas.
+                        self.perdidas += len(lote)
+                        self._procesadas += len(lote)
+                        self._cond.notify_all()
+                        return
+                    self._cola.extendleft(reversed(lote))
+                time.sleep(self._max_espera_s or 0.05)
+                continue
+
+            with self._cond:
+                self._procesadas += len(lote)
+                self._cond.notify_all()
+
+    def vaciar(self, timeout: float = 10.0) -> bool:
+        # Bloquea hasta que todo lo encolado hasta ahora este escrito.
+        limite = time.monotonic() + timeout
+        with self._cond:
+            objetivo = self._encoladas
+            self._forzar = True
+            self._cond.notify_all()
+            while self._procesadas < objetivo and self._hilo.is_alive():
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return False
+                self._cond.wait(restante)
+            return self._procesadas >= objetivo
+
+    def cerrar(self, timeout: float = 10.0):
+        with self._cond:
+            self._cerrado = True
+            self._cond.notify_all()
+        self._hilo.join(timeout)
+
+
+# Suscripcion al feed de cambios: cola acotada de filas ya persistidas. Si el
+# consumidor no la vacia a tiempo, "descartar" tira las mas antiguas y anota
+# el rango de ids perdido; "desconectar" la marca desbordada para que el
+# cliente se reconecte y retome desde su ultimo id.
+class SuscripcionObservaciones:
+    def __init__(self, difusor, max_pendientes: int, politica: str):
+        if politica not in POLITICAS_DESBORDE:
+            raise ValueError(
+                f"Politica de desborde desconocida: {politica!r}. "
+                f"Opciones: {', '.join(POLITICAS_DESBORDE)}"
+            )
+        self._difusor = difusor
+        self._max_pendientes = max(1, int(max_pendientes))
+        self._politica = politica
+        self._cola = deque()
+        self._cond = Condition()
+        self._hueco = None
+        self.perdidas = 0
+        self.desbordada = False
+        self.cerrada = False
+        # Se llama (desde el hilo que escribe) cada vez que hay novedades.
+        self.al_publicar = None
+
+    def _entregar(self, rows):
+        with self._cond:
+            if self.cerrada or self.desbordada:
+                return
+            self._cola.extend(rows)
+            exceso = len(self._cola) - self._max_pendientes
+            if exceso > 0:
+                if self._politica == "desconectar":
+                    self.desbordada = True
+                    self._cola.clear()
+                else:
+                    for _ in range(exceso):
+                        row_id = int(self._cola.popleft()["id"])
+                        if self._hueco is None:
+                            self._hueco = (row_id, row_id, 1)
+                        else:
+                            self._hueco = (self._hueco[0], row_id, self._hueco[2] + 1)
+                    self.perdidas += exceso
+            self._cond.notify_all()
+        self._avisar()
+
+    def _avisar(self):
+        if self.al_publicar is not None:
+            self.al_publicar()
+
+    def tomar(self):
+        # Devuelve (filas pendientes, (desde_id, hasta_id, cantidad) descartados o None).
+        with self._cond:
+            filas = list(self._cola)
+            self._cola.clear()
+            hueco, self._hueco = self._hueco, None
+            return filas, hueco
+
+    def esperar(self, timeout: float) -> bool:
+        with self._cond:
+            if not self._cola and not self.desbordada and not self.cerrada:
+                self._cond.wait(timeout)
+            return bool(self._cola) or self.desbordada or self.cerrada
+
+    def cerrar(self):
+        self._difusor.desuscribir(self)
+        with self._cond:
+            self.cerrada = True
+            self._cond.notify_all()
+        self._avisar()
+
+
+class _DifusorCambios:
+    def __init__(self, max_suscriptores: int = 100):
+        self.max_suscriptores = max(1, int(max_suscriptores))
+        self._lock = Lock()
+        self._suscripciones = []
+
+    def __len__(self):
+        return len(self._suscripciones)
+
+    def suscribir(self, max_pendientes: int, politica: str):
+        with self._lock:
+            if len(self._suscripciones) >= self.max_suscriptores:
+                raise RuntimeError(
+                    f"Limite de suscriptores alcanzado ({self.max_suscriptores})."
+                )
+            sub = SuscripcionObservaciones(self, max_pendientes, politica)
+            self._suscripciones = self._suscripciones + [sub]
+            return sub
+
+    def desuscribir(self, sub):
+        with self._lock:
+            self._suscripciones = [s for s in self._suscripciones if s is not sub]
+
+    def publicar(self, rows):
+        # La lista se reemplaza (no se muta) al suscribir: leerla no necesita lock.
+        for sub in self._suscripciones:
+            sub._entregar(rows)
+
+    def cerrar(self):
+        for sub in list(self._suscripciones):
+            sub.cerrar()
+
+
+# Ids ordenados por tiempo y unicos por nodo, para varias replicas que escriben
+# cada una su propio log. Dentro de un nodo son estrictamente crecientes aunque
+# el reloj retroceda o se agote la secuencia de un milisegundo (se sigue sobre
+# el ultimo milisegundo usado).
+class GeneradorIds:
+    def __init__(self, nodo: int):
+        if not 0 <= int(nodo) <= IDS_MAX_NODO:
+            raise ValueError(f"Nodo fuera de rango: {nodo!r} (0..{IDS_MAX_NODO}).")
+        self.nodo = int(nodo)
+        self._ms = -1
+        self._secuencia = 0
+
+    @staticmethod
+    def partes(id_obs: int):
+        # (milisegundo epoch, nodo, secuencia)
+        secuencia = id_obs & ((1 << IDS_BITS_SECUENCIA) - 1)
+        nodo = (id_obs >> IDS_BITS_SECUENCIA) & IDS_MAX_NODO
+        ms = id_obs >> (IDS_BITS_SECUENCIA + IDS_BITS_NODO)
+        return ms + IDS_EPOCA_MS, nodo, secuencia
+
+    def avanzar(self, ultimo_id: int):
+        # El proximo id sera mayor que ultimo_id (al abrir un log existente o
+        # cuando otro proceso del mismo nodo ya escribio).
+        ms, nodo, secuencia = self.partes(ultimo_id)
+        ms -= IDS_EPOCA_MS
+        if nodo != self.nodo:
+            secuencia = (1 << IDS_BITS_SECUENCIA) - 1
+        if (ms, secuencia) > (self._ms, self._secuencia):
+            self._ms, self._secuencia = ms, secuencia
+
+    def siguiente(self) -> int:
+        ms = max(int(time.time() * 1000) - IDS_EPOCA_MS, self._ms)
+        if ms == self._ms:
+            self._secuencia += 1
+            if self._secuencia >> IDS_BITS_SECUENCIA:
+                ms += 1
+                self._secuencia = 0
+        else:
+            self._secuencia = 0
+        self._ms = ms
+        return (ms << (IDS_BITS_NODO + IDS_BITS_SECUENCIA)) | (self.nodo << IDS_BITS_SECUENCIA) | self._secuencia
+
+
+# Estado compartido entre procesos del mismo host (uvicorn --workers N): un
+# archivo chico con last_id y los contadores, protegido con flock. Quien
+# escribe lo toma en exclusivo durante todo el append (reservar id + escribir
+# la fila), asi el orden de ids coincide con el orden en disco aunque escriban
+# varios workers. flock no excluye hilos del mismo proceso: de eso se encarga
+# _hilos.
+class _EstadoCompartido:
+    def __init__(self, path: Path):
+        if fcntl is None:
+            raise RuntimeError("El modo multiproceso requiere fcntl (POSIX).")
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._hilos = RLock()
+
+    @contextmanager
+    def _tomar(self, modo):
+        with self._hilos:
+            fcntl.flock(self._fd, modo)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def exclusivo(self):
+        return self._tomar(fcntl.LOCK_EX)
+
+    def compartido(self):
+        return self._tomar(fcntl.LOCK_SH)
+
+    def leer(self):
+        # None si no hay estado o quedo a medio escribir (se reconstruye).
+        data = os.pread(self._fd, 1 << 16, 0)
+        if not data:
+            return None
+        try:
+            resumen = json.loads(data.decode("utf-8"))
+            resumen["urgency_distribution"] = {
+                int(nivel): int(n) for nivel, n in resumen["urgency_distribution"].items()
+            }
+            return resumen
+        except Exception:
+            return None
+
+    def escribir(self, resumen):
+        data = json.dumps(resumen).encode("utf-8")
+        os.pwrite(self._fd, data, 0)
+        os.ftruncate(self._fd, len(data))
+
+    def cerrar(self):
+        os.close(self._fd)
+
+
+def _resumen_vacio():
+    return {
+        "observations_total": 0,
+        "alarmas": 0,
+        "alarmas_injustificadas": 0,
+        "overrides": 0,
+        "last_id": 0,
+        "urgency_distribution": {},
+    }
+
+
+def _acumular(resumen, row_id, nivel_referencia, alarm_event, alarm_unjustified_event, override_event):
+    resumen["observations_total"] += 1
+    resumen["alarmas"] += alarm_event
+    resumen["alarmas_injustificadas"] += alarm_unjustified_event
+    resumen["overrides"] += override_event
+    resumen["last_id"] = max(resumen["last_id"], row_id)
+    dist = resumen["urgency_distribution"]
+    dist[nivel_referencia] = dist.get(nivel_referencia, 0) + 1
+
+
+def _sumar_resumen(total, resumen):
+    for clave in ("observations_total", "alarmas", "alarmas_injustificadas", "overrides"):
+        total[clave] += resumen[clave]
+    total["last_id"] = max(total["last_id"], resumen["last_id"])
+    dist = total["urgency_distribution"]
+    for nivel, n in resumen["urgency_distribution"].items():
+        dist[nivel] = dist.get(nivel, 0) + n
+
+
+# Base comun de los backends: asigna ids y mantiene contadores en memoria bajo
+# un lock; cada backend decide como persistir las filas y como agregarlas.
+class _ObservacionStoreBase:
+    backend = ""
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        modo_escritura: str = "sync",
+        buffer_filas: int = 256,
+        buffer_ms: float = 200.0,
+        fsync: str = "nunca",
+        fsync_intervalo_s: float = 1.0,
+        max_suscriptores: int = 100,
+        multiproceso: bool = False,
+        sondeo_ms: float = 250.0,
+        ids: str = "secuencial",
+        nodo: int = 0,
+        ventanas_s=(),
+        ventanas_buckets: int = 60,
+    ):
+        if ids not in GENERADORES_ID:
+            raise ValueError(
+                f"Generador de ids desconocido: {ids!r}. Opciones: {', '.join(GENERADORES_ID)}"
+            )
+        if modo_escritura not in MODOS_ESCRITURA:
+            raise ValueError(
+                f"Modo de escritura desconocido: {modo_escritura!r}. "
+                f"Opciones: {', '.join(MODOS_ESCRITURA)}"
+            )
+        if fsync not in POLITICAS_FSYNC:
+            raise ValueError(
+                f"Politica fsync desconocida: {fsync!r}. Opciones: {', '.join(POLITICAS_FSYNC)}"
+            )
+        self.path = path
+        self._lock = RLock()
+        self._archivo_lock = Lock()
+        self.last_id = 0
+        self.total_cases = 0
+        self.total_alarmas = 0
+        self.total_alarmas_injustificadas = 0
+        self.total_overrides = 0
+        self.casos_por_nivel = Counter()
+        self.modo_escritura = modo_escritura
+        self.fsync = fsync
+        self._fsync_intervalo_s = float(fsync_intervalo_s)
+        self._ultimo_fsync = 0.0
+        self.cambios = _DifusorCambios(max_suscriptores)
+        # Metricas de los ultimos N segundos en este proceso (ventanas.py).
+        self.ventanas = VentanasDeslizantes(ventanas_s, ventanas_buckets) if ventanas_s else None
+        # Como se reconstruyeron los contadores al abrir y cuanto tomo.
+        self.origen_contadores = "vacio"
+        self.filas_releidas = 0
+
+        self._generador = GeneradorIds(nodo) if ids == "snowflake" else None
+        self.ids = ids
+        self.nodo = int(nodo)
+        self.multiproceso = bool(multiproceso)
+        self._compartido = None
+        self._sondeo_s = max(0.01, float(sondeo_ms) / 1000)
+        self._sondeo = None
+        self._fin_sondeo = Event()
+
+        t0 = time.perf_counter()
+        if self.multiproceso:
+            self._compartido = _EstadoCompartido(path.with_name(f"{path.name}.estado"))
+            # Abrir bajo el lock: otro worker puede estar escribiendo.
+            with self._compartido.exclusivo():
+                self._abrir()
+                self._adoptar_estado()
+        else:
+            self._abrir()
+        self.apertura_ms = (time.perf_counter() - t0) * 1000
+
+        self._escritor = None
+        if modo_escritura == "buffer":
+            # Con varios procesos el id se asigna al escribir y append espera
+            # su lote; no se retiene el lote: se agrupa lo que llega mientras
+            # se escribe el anterior.
+            self._escritor = _EscritorDiferido(
+                self._persistir,
+                max_filas=buffer_filas,
+                max_espera_s=0 if self.multiproceso else buffer_ms / 1000,
+            )
+            atexit.register(self.cerrar)
+
+    def _abrir(self):
+        raise NotImplementedError
+
+    def _persistir(self, rows):
+        # Las filas se publican recien despues de quedar escritas, y en orden
+        # de id (append y el escritor diferido escriben de a un lote a la vez).
+        # Con varios procesos las publica el sondeo, que ve las de todos.
+        if self._compartido is not None:
+            self._persistir_compartido(rows)
+            return
+        self._escribir_filas(rows)
+        self.cambios.publicar(rows)
+
+    def _persistir_compartido(self, rows):
+        with self._compartido.exclusivo():
+            estado = self._compartido.leer() or self._resumen_memoria()
+            previo = dict(estado, urgency_distribution=dict(estado["urgency_distribution"]))
+            for row in rows:
+                row["id"] = self._siguiente_id(estado["last_id"])
+                alarm_event, alarm_unjustified_event, override_event = self._eventos_desde_fila(row)
+                _acumular(
+                    estado,
+                    row["id"],
+                    int(row["nivel_referencia"]),
+                    alarm_event,
+                    alarm_unjustified_event,
+                    override_event,
+                )
+            # El estado se guarda antes que las filas: si el proceso muere en
+            # el medio queda un id sin usar, nunca un id repetido.
+            self._compartido.escribir(estado)
+            try:
+                self._escribir_filas(rows)
+            except Exception:
+                self._compartido.escribir(previo)
+                raise
+        with self._lock:
+            self._cargar_resumen(estado)
+
+    def _siguiente_id(self, ultimo_id: int) -> int:
+        if self._generador is None:
+            return ultimo_id + 1
+        self._generador.avanzar(ultimo_id)
+        return self._generador.siguiente()
+
+    def _resumen_memoria(self):
+        return {
+            "observations_total": self.total_cases,
+            "alarmas": self.total_alarmas,
+            "alarmas_injustificadas": self.total_alarmas_injustificadas,
+            "overrides": self.total_overrides,
+            "last_id": self.last_id,
+            "urgency_distribution": dict(sorted(self.casos_por_nivel.items())),
+        }
+
+    def _cargar_resumen(self, resumen):
+        self.last_id = resumen["last_id"]
+        self.total_cases = resumen["observations_total"]
+        self.total_alarmas = resumen["alarmas"]
+        self.total_alarmas_injustificadas = resumen["alarmas_injustificadas"]
+        self.total_overrides = resumen["overrides"]
+        self.casos_por_nivel = Counter(resumen["urgency_distribution"])
+
+    def _adoptar_estado(self):
+        # Bajo el lock exclusivo, recien abierto el backend.
+        estado = self._compartido.leer()
+        if estado is None or estado["last_id"] < self.last_id:
+            # Primer worker, o estado perdido/atrasado respecto de los datos.
+            self._compartido.escribir(self._resumen_memoria())
+        else:
+            self._cargar_resumen(estado)
+
+    def _refrescar(self):
+        # Trae los contadores que dejaron los demas procesos.
+        if self._compartido is None:
+            return
+        with self._compartido.compartido():
+            estado = self._compartido.leer()
+        if estado is not None:
+            with self._lock:
+                self._cargar_resumen(estado)
+
+    def _escribir_filas(self, rows):
+        raise NotImplementedError
+
+    def _completar_filas(self, cambios):
+        # cambios: (id, nivel_sistema, alarm, override). Solo sqlite actualiza
+        # filas; los logs csv y por segmentos son solo de agregado.
+        raise NotImplementedError(f"El backend '{self.backend}' no admite completar observaciones.")
+
+    def existe(self) -> bool:
+        raise NotImplementedError
+
+    def iterar_filas(self, desde_id=None, hasta_id=None, desde=None, hasta=None):
+        # Filas en orden de id con desde_id < id <= hasta_id y outtime en [desde, hasta].
+        raise NotImplementedError
+
+    def version(self) -> str:
+        # Cambia cada vez que cambia el contenido persistido.
+        raise NotImplementedError
+
+    def _resumen_ventana(self, desde, hasta):
+        raise NotImplementedError
+
+    @staticmethod
+    def _to_int(value) -> int:
+        try:
+            return int(float(value))
+        except Exception:
+            return 0
+
+    @staticmethod
+    def _to_float(value):
+        try:
+            return float(value)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _to_optional_int(value):
+        if value is None:
+            return None
+        s = str(value).strip()
+        if not s:
+            return None
+        try:
+            return int(float(s))
+        except Exception:
+            return None
+
+    @staticmethod
+    def _recomendacion_por_nivel(nivel: int) -> str:
+        if nivel == 3:
+            return "Acudir a emergencias inmediatamente."
+        if nivel == 2:
+            return "Buscar atencion medica en las proximas horas."
+        if nivel == 1:
+            return "Reposo y observacion."
+        return "No se detectaron sintomas, intente de nuevo."
+
+    @staticmethod
+    def _wait_base_min_por_nivel(nivel_referencia: int) -> float:
+        # Base presencial inventada para comparacion de tiempos.
+        # Menor urgencia suele esperar mas en triaje presencial.
+        tabla = {
+            0: 0.0,
+            1: 58.0,
+            2: 34.0,
+            3: 16.0,
+        }
+        return tabla.get(int(nivel_referencia), 34.0)
+
+    @classmethod
+    def _eventos_desde_fila(cls, row):
+        nivel_sistema = cls._to_optional_int(row.get("nivel_sistema"))
+        nivel_referencia = cls._to_int(row.get("nivel_referencia"))
+        alarm_event = int(
+            nivel_sistema is not None and nivel_sistema != nivel_referencia
+        )
+        override_event = 1 if cls._to_int(row.get("override")) > 0 else 0
+        alarm_unjustified_event = 1 if cls._to_int(row.get("alarm")) > 0 else int(
+            alarm_event and nivel_sistema is not None and nivel_sistema > nivel_referencia and nivel_referencia <= 2
+        )
+        return alarm_event, alarm_unjustified_event, override_event
+
+    @classmethod
+    def _en_ventana(cls, row, desde, hasta) -> bool:
+        if desde is None and hasta is None:
+            return True
+        outtime = cls._to_float(row.get("outtime"))
+        if outtime is None:
+            return False
+        return (desde is None or outtime >= desde) and (hasta is None or outtime <= hasta)
+
+    def _toca_fsync(self) -> bool:
+        if self.fsync == "lote":
+            return True
+        if self.fsync == "intervalo":
+            ahora = time.monotonic()
+            if ahora - self._ultimo_fsync >= self._fsync_intervalo_s:
+                self._ultimo_fsync = ahora
+                return True
+        return False
+
+    def append(
+        self,
+        *,
+        caso: str,
+        sintomas_texto: str,
+        nivel_sistema,
+        nivel_referencia: int,
+        recomendacion_sistema: str,
+        adequacy_score: float,
+        intime: int,
+        outtime: int,
+        urgencia_final: int,
+        urgencia_ml=None,
+    ):
+        # urgencia_ml (None si el modelo no predijo) no se guarda en la fila;
+        # solo alimenta el desacuerdo ML vs reglas de las ventanas.
+        with self._lock:
+            alarm_event, alarm_unjustified_event, override_event = self._eventos(
+                nivel_sistema, nivel_referencia, urgencia_final
+            )
+
+            # Con varios procesos el id y los contadores salen del estado
+            # compartido al escribir (_persistir_compartido).
+            if self._compartido is None:
+                self.total_cases += 1
+                self.last_id = self._siguiente_id(self.last_id)
+                self.total_alarmas += alarm_event
+                self.total_alarmas_injustificadas += alarm_unjustified_event
+                self.total_overrides += override_event
+                self.casos_por_nivel[int(nivel_referencia)] += 1
+
+            row = {
+                "id": self.last_id if self._compartido is None else None,
+                "caso": caso,
+                "sintomas_texto": sintomas_texto,
+                "nivel_sistema": "" if nivel_sistema is None else int(nivel_sistema),
+                "nivel_referencia": int(nivel_referencia),
+                "recomendacion_sistema": recomendacion_sistema,
+                "recomendacion_referencia": self._recomendacion_por_nivel(int(nivel_referencia)),
+                "adequacy_score": f"{float(adequacy_score):.2f}",
+                "intime": intime,
+                "outtime": outtime,
+                "wait_base_min": f"{self._wait_base_min_por_nivel(int(nivel_referencia)):.2f}",
+                "alarm": alarm_unjustified_event,
+                "override": override_event,
+            }
+
+            if self._escritor is None:
+                self._persistir([row])
+            else:
+                numero = self._escritor.encolar(row)
+            if self.ventanas is not None:
+                self.ventanas.registrar(
+                    nivel_referencia, alarm_event, alarm_unjustified_event, override_event, urgencia_ml
+                )
+            if self._escritor is None or self._compartido is None:
+                return row
+        if not self._escritor.esperar(numero):
+            raise RuntimeError("No se pudo confirmar la escritura de la observacion.")
+        return row
+
+    @staticmethod
+    def _eventos(nivel_sistema, nivel_referencia: int, urgencia_final: int):
+        alarm_event = int(
+            nivel_sistema is not None and int(nivel_sistema) != int(nivel_referencia)
+        )
+        alarm_unjustified_event = int(
+            alarm_event and nivel_sistema is not None and int(nivel_sistema) > int(nivel_referencia) and int(nivel_referencia) <= 2
+        )
+        override_event = int(
+            nivel_sistema is not None and int(nivel_sistema) < int(nivel_referencia) and int(urgencia_final) == int(nivel_referencia)
+        )
+        return alarm_event, alarm_unjustified_event, override_event
+
+    def completar(self, completados):
+        # Pone nivel_sistema a filas ya escritas sin el (prediccion ML que se
+        # calcula despues del request). completados: dicts con id,
+        # nivel_sistema, nivel_referencia, urgencia_final y urgencia_ml. Esas
+        # filas no sumaron alarmas ni overrides al escribirse: se suman aca.
+        if not completados:
+            return
+        self.vaciar()
+        cambios = []
+        delta = _resumen_vacio()
+        for item in completados:
+            alarm_event, alarm_unjustified_event, override_event = self._eventos(
+                item["nivel_sistema"], item["nivel_referencia"], item["urgencia_final"]
+            )
+            cambios.append((int(item["id"]), int(item["nivel_sistema"]), alarm_unjustified_event, override_event))
+            delta["alarmas"] += alarm_event
+            delta["alarmas_injustificadas"] += alarm_unjustified_event
+            delta["overrides"] += override_event
+
+        if self._compartido is not None:
+            with self._compartido.exclusivo():
+                estado = self._compartido.leer() or self._resumen_memoria()
+                previo = dict(estado, urgency_distribution=dict(estado["urgency_distribution"]))
+                _sumar_resumen(estado, delta)
+                self._compartido.escribir(estado)
+                try:
+                    self._completar_filas(cambios)
+                except Exception:
+                    self._compartido.escribir(previo)
+                    raise
+            with self._lock:
+                self._cargar_resumen(estado)
+        else:
+            with self._lock:
+                self._completar_filas(cambios)
+                self.total_alarmas += delta["alarmas"]
+                self.total_alarmas_injustificadas += delta["alarmas_injustificadas"]
+                self.total_overrides += delta["overrides"]
+
+        if self.ventanas is not None:
+            for item in completados:
+                alarm_event, alarm_unjustified_event, override_event = self._eventos(
+                    item["nivel_sistema"], item["nivel_referencia"], item["urgencia_final"]
+                )
+                self.ventanas.registrar(
+                    item["nivel_referencia"],
+                    alarm_event,
+                    alarm_unjustified_event,
+                    override_event,
+                    item.get("urgencia_ml"),
+                    nueva=False,
+                )
+
+    def resumen(self, desde=None, hasta=None):
+        # desde/hasta filtran por outtime (minutos epoch, igual que en las filas).
+        if desde is None and hasta is None:
+            self._refrescar()
+            with self._lock:
+                return self._resumen_memoria()
+        self.vaciar()
+        return self._resumen_ventana(desde, hasta)
+
+    def exportar(self, *, desde_id=None, hasta_id=None, desde=None, hasta=None, limite=None, ultimos=None):
+        # Como iterar_filas, con limite (primeras N) y ultimos (ultimas N).
+        self.vaciar()
+        self._refrescar()
+        filtros = {"hasta_id": hasta_id, "desde": desde, "hasta": hasta}
+        if ultimos is not None:
+            filas = self._ultimas(ultimos, desde_id, filtros)
+        else:
+            filas = self.iterar_filas(desde_id=desde_id, **filtros)
+        for i, row in enumerate(filas):
+            if limite is not None and i >= limite:
+                return
+            yield row
+
+    def _ultimas(self, n, desde_id, filtros):
+        if n <= 0:
+            return []
+        base = desde_id or 0
+        # Los ids son consecutivos: sin filtro de tiempo basta con leer desde
+        # last_id - n. Si hay huecos y faltan filas se lee el rango completo.
+        if self._generador is None and filtros["desde"] is None and filtros["hasta"] is None:
+            with self._lock:
+                tope = self.last_id
+            if filtros["hasta_id"] is not None:
+                tope = min(tope, filtros["hasta_id"])
+            pista = max(base, tope - n)
+            if pista > base:
+                cola = deque(self.iterar_filas(desde_id=pista, **filtros), maxlen=n)
+                if len(cola) == n:
+                    return cola
+        return deque(self.iterar_filas(desde_id=desde_id, **filtros), maxlen=n)
+
+    def tamano_en_disco(self) -> int:
+        # Bytes del log: el archivo, o la suma de los archivos del directorio.
+        if self.path.is_dir():
+            return sum(e.stat().st_size for e in os.scandir(self.path) if e.is_file())
+        return self.path.stat().st_size if self.path.exists() else 0
+
+    @property
+    def pendientes(self) -> int:
+        return self._escritor.pendientes if self._escritor is not None else 0
+
+    def vaciar(self, timeout: float = 10.0) -> bool:
+        if self._escritor is None:
+            return True
+        return self._escritor.vaciar(timeout)
+
+    def suscribir(self, max_pendientes: int = 1000, politica: str = "descartar"):
+        sub = self.cambios.suscribir(max_pendientes, politica)
+        if self._compartido is not None:
+            with self._lock:
+                if self._sondeo is None:
+                    self._sondeo = Thread(target=self._bucle_sondeo, name="observaciones-sondeo", daemon=True)
+                    self._sondeo.start()
+        return sub
+
+    def _bucle_sondeo(self):
+        # Con varios procesos cada worker ve las filas nuevas de todos leyendo
+        # el store desde el ultimo id publicado (costo proporcional a lo nuevo).
+        self._refrescar()
+        publicado = self.last_id
+        while not self._fin_sondeo.wait(self._sondeo_s):
+            try:
+                self._refrescar()
+                if not len(self.cambios):
+                    # Sin suscriptores no se lee nada: el proximo arranca de aca.
+                    publicado = self.last_id
+                    continue
+                if self.last_id <= publicado:
+                    continue
+                filas = list(self.iterar_filas(desde_id=publicado, hasta_id=self.last_id))
+            except Exception as exc:
+                print(f"Advertencia: no se pudieron leer observaciones nuevas ({exc}).")
+                continue
+            if filas:
+                self.cambios.publicar(filas)
+                publicado = self._to_int(filas[-1].get("id"))
+
+    def cerrar(self):
+        if self._escritor is not None:
+            self._escritor.cerrar()
+        self._fin_sondeo.set()
+        if self._sondeo is not None:
+            self._sondeo.join(timeout=2)
+        self.cambios.cerrar()
+
+
+# Ademas del CSV guarda un checkpoint (<csv>.ckpt) con los contadores y el
+# offset en bytes que cubren; al arrancar solo se releen las filas agregadas
+# despues de ese offset. Si el checkpoint falta o no cuadra con el archivo se
+# vuelve a leer el CSV completo.
+class ObservacionStoreCSV(_ObservacionStoreBase):
+    backend = "csv"
+
+    def __init__(self, path: Path, *, checkpoint_filas: int = 1000, **opciones):
+        # checkpoint_filas=0 desactiva el checkpoint.
+        self._checkpoint_filas = max(0, int(checkpoint_filas))
+        self.checkpoint_path = path.with_name(f"{path.name}.ckpt")
+        super().__init__(path, **opciones)
+
+    def _abrir(self):
+        # El esquema se valida una sola vez al arrancar, no en cada append.
+        self._ensure_schema()
+        self._bootstrap()
+
+    def _bootstrap(self):
+        # _persistido: contadores de lo que ya esta en disco hasta _offset.
+        # _indice_ids/_indice_offsets: indice disperso id -> byte de inicio de
+        # fila, para que una exportacion desde un id no lea todo el archivo.
+        self._persistido = _resumen_vacio()
+        self._offset = 0
+        self._filas_sin_checkpoint = 0
+        self._indice_ids = []
+        self._indice_offsets = []
+        self._filas_sin_indice = 0
+        if not self.path.exists():
+            return
+
+        checkpoint = self._leer_checkpoint()
+        if checkpoint is not None:
+            resumen, offset, indice = checkpoint
+            self._indice_ids = [i for i, _ in indice]
+            self._indice_offsets = [o for _, o in indice]
+            self._filas_sin_indice = _INDICE_CADA_FILAS
+            try:
+                resumen, offset, releidas = self._releer(resumen, offset)
+                self.origen_contadores = "checkpoint"
+            except Exception as exc:
+                print(f"Advertencia: checkpoint de observaciones descartado ({exc}).")
+                checkpoint = None
+        if checkpoint is None:
+            self._indice_ids = []
+            self._indice_offsets = []
+            self._filas_sin_indice = 0
+            try:
+                resumen, offset, releidas = self._releer(_resumen_vacio(), 0)
+                self.origen_contadores = "completo"
+            except Exception as exc:
+                print(f"Advertencia: no se pudo leer historial de observaciones ({exc}).")
+                return
+
+        self._persistido = resumen
+        self._offset = offset
+        self._filas_sin_checkpoint = releidas
+        self.filas_releidas = releidas
+        self._cargar_resumen(resumen)
+        if self._checkpoint_filas and releidas >= self._checkpoint_filas:
+            self._guardar_checkpoint()
+
+    @staticmethod
+    def _leer_filas(raw, offset: int, fin: int):
+        # Como csv.DictReader, pero devuelve tambien el byte donde empieza cada
+        # fila. csv.reader no lee lineas por adelantado, asi que la posicion
+        # antes de pedir una fila es su inicio.
+        pos = offset
+
+        def lineas():
+            nonlocal pos
+            for linea in raw:
+                pos += len(linea)
+                yield linea.decode("utf-8")
+                if pos >= fin:
+                    return
+
+        raw.seek(offset)
+        reader = csv.reader(lineas())
+        if offset == 0:
+            next(reader, None)
+        n_campos = len(OBS_FIELDS)
+        while True:
+            inicio = pos
+            if inicio >= fin:
+                return
+            valores = next(reader, None)
+            if valores is None:
+                return
+            if not valores:
+                continue
+            row = dict(zip(OBS_FIELDS, valores))
+            if len(valores) < n_campos:
+                for campo in OBS_FIELDS[len(valores):]:
+                    row[campo] = None
+            yield inicio, row
+
+    def _indexar(self, row_id: int, inicio: int, filas: int = 1):
+        if not self._indice_ids or self._filas_sin_indice >= _INDICE_CADA_FILAS:
+            self._indice_ids.append(row_id)
+            self._indice_offsets.append(inicio)
+            self._filas_sin_indice = 0
+        self._filas_sin_indice += filas
+
+    def _releer(self, resumen, offset):
+        # Acumula sobre resumen las filas desde offset hasta el final del archivo.
+        ultimo_checkpoint = resumen["last_id"]
+        releidas = 0
+        with self.path.open("rb") as raw:
+            fin = os.fstat(raw.fileno()).st_size
+            for inicio, row in self._leer_filas(raw, offset, fin):
+                row_id = self._to_int(row.get("id"))
+                if releidas == 0 and offset > 0 and row_id <= ultimo_checkpoint:
+                    raise ValueError(f"la fila {row_id} ya estaba contada")
+                self._indexar(row_id, inicio)
+                alarm_event, alarm_unjustified_event, override_event = self._eventos_desde_fila(row)
+                _acumular(
+                    resumen,
+                    row_id,
+                    self._to_int(row.get("nivel_referencia")),
+                    alarm_event,
+                    alarm_unjustified_event,
+                    override_event,
+                )
+                releidas += 1
+        return resumen, fin, releidas
+
+    def _ponerse_al_dia(self):
+        # Con varios procesos: indexa y cuenta lo que agregaron los demas
+        # desde _offset. Llamar con _archivo_lock y el lock compartido tomados.
+        if not self.path.exists() or self.path.stat().st_size <= self._offset:
+            return
+        self._persistido, self._offset, releidas = self._releer(self._persistido, self._offset)
+        self._filas_sin_checkpoint += releidas
+
+    def _firma(self, offset: int) -> str:
+        inicio = max(0, offset - _CHECKPOINT_FIRMA_BYTES)
+        with self.path.open("rb") as f:
+            f.seek(inicio)
+            return hashlib.sha256(f.read(offset - inicio)).hexdigest()
+
+    def _leer_checkpoint(self):
+        if self._checkpoint_filas == 0 or not self.checkpoint_path.exists():
+            return None
+        try:
+            with self.checkpoint_path.open(encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("formato") != CHECKPOINT_FORMATO:
+                return None
+            offset = int(data["offset"])
+            if offset > self.path.stat().st_size:
+                print("Advertencia: checkpoint de observaciones mas largo que el CSV; se relee completo.")
+                return None
+            if data.get("firma") != self._firma(offset):
+                print("Advertencia: checkpoint de observaciones no coincide con el CSV; se relee completo.")
+                return None
+            resumen = _resumen_vacio()
+            for clave in ("observations_total", "alarmas", "alarmas_injustificadas", "overrides", "last_id"):
+                resumen[clave] = int(data["resumen"][clave])
+            resumen["urgency_distribution"] = {
+                int(nivel): int(n) for nivel, n in data["resumen"]["urgency_distribution"].items()
+            }
+            indice = [(int(i), int(o)) for i, o in data.get("indice", [])]
+            if any(o >= offset for _, o in indice):
+                return None
+            return resumen, offset, indice
+        except Exception as exc:
+            print(f"Advertencia: no se pudo leer checkpoint de observaciones ({exc}).")
+            return None
+
+    def _guardar_checkpoint(self):
+        # Llamar con _archivo_lock tomado: el offset debe corresponder a lo escrito.
+        data = {
+            "formato": CHECKPOINT_FORMATO,
+            "offset": self._offset,
+            "firma": self._firma(self._offset),
+            "resumen": self._persistido,
+            "indice": [
+                [i, o] for i, o in zip(self._indice_ids, self._indice_offsets) if o < self._offset
+            ],
+        }
+        tmp = self.checkpoint_path.with_name(f"{self.checkpoint_path.name}.{os.getpid()}.tmp")
+        try:
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.checkpoint_path)
+            self._filas_sin_checkpoint = 0
+        except Exception as exc:
+            print(f"Advertencia: no se pudo guardar checkpoint de observaciones ({exc}).")
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+
+    def _ensure_schema(self):
+        if not self.path.exists() or self.path.stat().st_size == 0:
+            return
+        try:
+            with self.path.open(encoding="utf-8", newline="") as f:
+                reader = csv.reader(f)
+                header = next(reader, [])
+        except Exception:
+            return
+
+        if header == OBS_FIELDS:
+            return
+
+        legacy = self.path.with_name(
+            f"{self.path.stem}_legacy_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}.csv"
+        )
+        try:
+            self.path.replace(legacy)
+            print(
+                f"Advertencia: esquema CSV antiguo detectado. "
+                f"Se movio a {legacy.name} y se inicia un CSV nuevo."
+            )
+            self.last_id = 0
+            self.total_cases = 0
+            self.total_alarmas = 0
+            self.total_alarmas_injustificadas = 0
+            self.total_overrides = 0
+            self.casos_por_nivel.clear()
+            if self.checkpoint_path.exists():
+                self.checkpoint_path.unlink()
+        except Exception as exc:
+            print(f"Advertencia: no se pudo migrar CSV legado ({exc}).")
+
+    def _escribir_filas(self, rows):
+        with self._archivo_lock:
+            if self._compartido is not None:
+                self._ponerse_al_dia()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=OBS_FIELDS)
+                if os.fstat(f.fileno()).st_size == 0:
+                    writer.writeheader()
+                    f.flush()
+                inicio = os.fstat(f.fileno()).st_size
+                writer.writerows(rows)
+                f.flush()
+                if self._toca_fsync():
+                    os.fsync(f.fileno())
+                self._offset = os.fstat(f.fileno()).st_size
+            # Se indexa por lote: el inicio del lote es el de su primera fila.
+            self._indexar(self._to_int(rows[0].get("id")), inicio, len(rows))
+
+            if self._checkpoint_filas:
+                for row in rows:
+                    alarm_event, alarm_unjustified_event, override_event = self._eventos_desde_fila(row)
+                    _acumular(
+                        self._persistido,
+                        self._to_int(row.get("id")),
+                        self._to_int(row.get("nivel_referencia")),
+                        alarm_event,
+                        alarm_unjustified_event,
+                        override_event,
+                    )
+                self._filas_sin_checkpoint += len(rows)
+                if self._filas_sin_checkpoint >= self._checkpoint_filas:
+                    self._guardar_checkpoint()
+
+    def cerrar(self):
+        super().cerrar()
+        with self._archivo_lock:
+            if self._checkpoint_filas and self._filas_sin_checkpoint and self.path.exists():
+                self._guardar_checkpoint()
+
+    def existe(self) -> bool:
+        return self.path.exists()
+
+    def _offset_al_dia(self) -> int:
+        # Llamar con _archivo_lock tomado.
+        if self._compartido is not None:
+            with self._compartido.compartido():
+                self._ponerse_al_dia()
+        return self._offset
+
+    def version(self) -> str:
+        self._refrescar()
+        with self._archivo_lock:
+            return f"csv-{self._offset_al_dia()}-{self.last_id}"
+
+    def bytes_escritos(self) -> int:
+        # Tamano del CSV hasta la ultima fila completa escrita.
+        with self._archivo_lock:
+            return self._offset_al_dia()
+
+    def iterar_filas(self, desde_id=None, hasta_id=None, desde=None, hasta=None):
+        if not self.path.exists():
+            return
+        with self._archivo_lock:
+            # Solo lo escrito hasta ahora: nunca una fila a medio escribir.
+            fin = self._offset_al_dia()
+            offset = 0
+            if desde_id is not None:
+                pos = bisect.bisect_right(self._indice_ids, desde_id + 1) - 1
+                if pos >= 0:
+                    offset = self._indice_offsets[pos]
+        with self.path.open("rb") as raw:
+            for _, row in self._leer_filas(raw, offset, fin):
+                row_id = self._to_int(row.get("id"))
+                if desde_id is not None and row_id <= desde_id:
+                    continue
+                if hasta_id is not None and row_id > hasta_id:
+                    return
+                if self._en_ventana(row, desde, hasta):
+                    yield row
+
+    def _resumen_ventana(self, desde, hasta):
+        resumen = _resumen_vacio()
+        for row in self.iterar_filas(desde=desde, hasta=hasta):
+            alarm_event, alarm_unjustified_event, override_event = self._eventos_desde_fila(row)
+            _acumular(
+                resumen,
+                self._to_int(row.get("id")),
+                self._to_int(row.get("nivel_referencia")),
+                alarm_event,
+                alarm_unjustified_event,
+                override_event,
+            )
+        resumen["urgency_distribution"] = dict(sorted(resumen["urgency_distribution"].items()))
+        return resumen
+
+
+# Backend SQLite en modo WAL: los lectores (export, agregados por ventana) no
+# bloquean al escritor. Los indices cubren id, tiempo (outtime) y niveles.
+class ObservacionStoreSQLite(_ObservacionStoreBase):
+    backend = "sqlite"
+
+    _ESQUEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS observaciones (
+            id INTEGER PRIMARY KEY,
+            caso TEXT,
+            sintomas_texto TEXT,
+            nivel_sistema INTEGER,
+            nivel_referencia INTEGER NOT NULL,
+            recomendacion_sistema TEXT,
+            recomendacion_referencia TEXT,
+            adequacy_score TEXT,
+            intime REAL,
+            outtime REAL,
+            wait_base_min TEXT,
+            alarm INTEGER NOT NULL,
+            override INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_obs_outtime
+        ON observaciones (outtime, nivel_referencia, nivel_sistema, alarm, override)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_obs_niveles
+        ON observaciones (nivel_referencia, nivel_sistema)
+        """,
+        # Una fila por observacion completada despues de escrita (completar):
+        # lo que sumo a los agregados, para el resumen incremental.
+        """
+        CREATE TABLE IF NOT EXISTS completados (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id INTEGER NOT NULL,
+            alarma INTEGER NOT NULL,
+            injustificada INTEGER NOT NULL,
+            override INTEGER NOT NULL
+        )
+        """,
+    )
+    _AGREGADOS = """
+        SELECT
+            COUNT(*),
+            COALESCE(SUM(nivel_sistema IS NOT NULL AND nivel_sistema != nivel_referencia), 0),
+            COALESCE(SUM(alarm > 0), 0),
+            COALESCE(SUM(override > 0), 0),
+            COALESCE(MAX(id), 0)
+        FROM observaciones
+    """
+
+    # La durabilidad la maneja SQLite: fsync="lote" usa synchronous=FULL (fsync
+    # en cada commit); el resto usa NORMAL, que en WAL sincroniza en checkpoints.
+    def _conectar(self):
+        conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={'FULL' if self.fsync == 'lote' else 'NORMAL'}")
+        return conn
+
+    def _abrir(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = self._conectar()
+        with self._conn:
+            for sentencia in self._ESQUEMA:
+                self._conn.execute(sentencia)
+        self._resumen_lock = Lock()
+        self._resumen_sql = _resumen_vacio()
+        self._completados_seq = 0
+        self._cargar_resumen(self._actualizar_resumen_sql())
+        self.origen_contadores = "sql"
+
+    def _escribir_filas(self, rows):
+        valores = [
+            tuple(None if (k == "nivel_sistema" and row[k] == "") else row[k] for k in OBS_FIELDS)
+            for row in rows
+        ]
+        columnas = ", ".join(OBS_FIELDS)
+        marcas = ", ".join("?" for _ in OBS_FIELDS)
+        with self._archivo_lock, self._conn:
+            self._conn.executemany(
+                f"INSERT INTO observaciones ({columnas}) VALUES ({marcas})", valores
+            )
+
+    def _completar_filas(self, cambios):
+        # Solo filas que siguen sin nivel_sistema: completar dos veces no
+        # suma dos veces.
+        with self._archivo_lock, self._conn:
+            for row_id, nivel_sistema, alarm, override in cambios:
+                cursor = self._conn.execute(
+                    "UPDATE observaciones SET nivel_sistema = ?, alarm = ?, override = ? "
+                    "WHERE id = ? AND nivel_sistema IS NULL",
+                    (nivel_sistema, alarm, override, row_id),
+                )
+                if cursor.rowcount:
+                    self._conn.execute(
+                        "INSERT INTO completados (id, alarma, injustificada, override) "
+                        "SELECT id, nivel_sistema != nivel_referencia, alarm > 0, override > 0 "
+                        "FROM observaciones WHERE id = ?",
+                        (row_id,),
+                    )
+
+    def existe(self) -> bool:
+        return self.path.exists()
+
+    def _consultar_resumen(self, desde, hasta, desde_id=None, conn=None):
+        condiciones = []
+        params = []
+        if desde_id is not None:
+            condiciones.append("id > ?")
+            params.append(int(desde_id))
+        if desde is not None:
+            condiciones.append("outtime >= ?")
+            params.append(float(desde))
+        if hasta is not None:
+            condiciones.append("outtime <= ?")
+            params.append(float(hasta))
+        where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+
+        propia = conn is None
+        if propia:
+            conn = self._conectar()
+        try:
+            total, alarmas, injustificadas, overrides, last_id = conn.execute(
+                self._AGREGADOS + where, params
+            ).fetchone()
+            distribucion = conn.execute(
+                "SELECT nivel_referencia, COUNT(*) FROM observaciones"
+                + where
+                + " GROUP BY nivel_referencia ORDER BY nivel_referencia",
+                params,
+            ).fetchall()
+        finally:
+            if propia:
+                conn.close()
+        return {
+            "observations_total": total,
+            "alarmas": alarmas,
+            "alarmas_injustificadas": injustificadas,
+            "overrides": overrides,
+            "last_id": last_id,
+            "urgency_distribution": {int(n): c for n, c in distribucion},
+        }
+
+    def _resumen_ventana(self, desde, hasta):
+        return self._consultar_resumen(desde, hasta)
+
+    def _actualizar_resumen_sql(self):
+        # Las filas se insertan en orden de id y despues solo cambian al
+        # completarse, cosa que queda anotada en `completados`. En una misma
+        # lectura se suman las filas con id > el ultimo visto (ya con su valor
+        # final) y lo completado desde la ultima vez en filas ya contadas.
+        with self._resumen_lock:
+            visto = self._resumen_sql["last_id"]
+            conn = self._conectar()
+            try:
+                conn.execute("BEGIN")
+                nuevas = self._consultar_resumen(None, None, desde_id=visto, conn=conn)
+                alarmas, injustificadas, overrides = conn.execute(
+                    "SELECT COALESCE(SUM(alarma), 0), COALESCE(SUM(injustificada), 0), COALESCE(SUM(override), 0) "
+                    "FROM completados WHERE seq > ? AND id <= ?",
+                    (self._completados_seq, visto),
+                ).fetchone()
+                self._completados_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM completados").fetchone()[0]
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+            _sumar_resumen(self._resumen_sql, nuevas)
+            self._resumen_sql["alarmas"] += alarmas
+            self._resumen_sql["alarmas_injustificadas"] += injustificadas
+            self._resumen_sql["overrides"] += overrides
+            return dict(
+                self._resumen_sql,
+                urgency_distribution=dict(sorted(self._resumen_sql["urgency_distribution"].items())),
+            )
+
+    def resumen(self, desde=None, hasta=None):
+        # Sin ventana los indicadores tambien salen de la base (la fuente de
+        # verdad, con cualquier numero de workers), no de los contadores en
+        # memoria; cada llamada solo lee lo nuevo (_actualizar_resumen_sql).
+        if desde is not None or hasta is not None:
+            return super().resumen(desde, hasta)
+        self.vaciar()
+        return self._actualizar_resumen_sql()
+
+    def version(self) -> str:
+        self._refrescar()
+        with self._archivo_lock:
+            completados = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM completados").fetchone()[0]
+        with self._lock:
+            return f"sqlite-{self.last_id}-{self.total_cases}-{completados}"
+
+    def iterar_filas(self, desde_id=None, hasta_id=None, desde=None, hasta=None):
+        condiciones = []
+        params = []
+        for columna, operador, valor in (
+            ("id", ">", desde_id),
+            ("id", "<=", hasta_id),
+            ("outtime", ">=", desde),
+            ("outtime", "<=", hasta),
+        ):
+            if valor is not None:
+                condiciones.append(f"{columna} {operador} ?")
+                params.append(valor)
+        where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        conn = self._conectar()
+        try:
+            cursor = conn.execute(
+                f"SELECT {', '.join(OBS_FIELDS)} FROM observaciones{where} ORDER BY id", params
+            )
+            for valores in cursor:
+                row = dict(zip(OBS_FIELDS, valores))
+                if row["nivel_sistema"] is None:
+                    row["nivel_sistema"] = ""
+                yield row
+        finally:
+            conn.close()
+
+    def cerrar(self):
+        super().cerrar()
+        with self._archivo_lock:
+            self._conn.close()
+
+
+# Backend por segmentos: un directorio con un CSV por dia (o hasta
+# segmento_max_bytes), comprimido con gzip al sellarse, y un manifest.json con
+# el rango de ids, de outtime y los contadores de cada segmento. Al arrancar
+# solo se relee el segmento activo, y los agregados por ventana solo abren los
+# segmentos que cruzan el borde de la ventana.
+# Retencion: retencion_dias / retencion_bytes borran los segmentos sellados
+# mas antiguos; sus contadores pasan a "depurado" para que los totales y
+# last_id no retrocedan. Compactacion: segmentos sellados chicos y contiguos se
+# fusionan en uno para no acumular miles de archivos en nodos de poco trafico.
+# Sellado, retencion y compactacion corren en un hilo aparte: el append de un
+# request solo escribe en el segmento activo (y, al rotar, abre otro).
+class ObservacionStoreSegmentos(_ObservacionStoreBase):
+    backend = "segmentos"
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        segmento_max_bytes: int = 64 * 1024 * 1024,
+        retencion_dias: float = 0,
+        retencion_bytes: int = 0,
+        compactar: bool = True,
+        **opciones,
+    ):
+        # retencion_dias=0 / retencion_bytes=0 desactivan cada limite.
+        if opciones.get("multiproceso"):
+            # Rotacion, sellado y compactacion reescriben el manifiesto desde
+            # un solo proceso; con varios workers usar csv o sqlite.
+            raise ValueError("El backend 'segmentos' no admite varios procesos escritores.")
+        self._segmento_max_bytes = max(1, int(segmento_max_bytes))
+        self._retencion_dias = max(0.0, float(retencion_dias))
+        self._retencion_bytes = max(0, int(retencion_bytes))
+        self._compactar = bool(compactar)
+        self.manifiesto_path = path / "manifest.json"
+        self._pedido_mantenimiento = Event()
+        self._fin_mantenimiento = Event()
+        super().__init__(path, **opciones)
+        self._hilo_mantenimiento = Thread(
+            target=self._bucle_mantenimiento, name="obs-segmentos", daemon=True
+        )
+        self._hilo_mantenimiento.start()
+
+    # ---------- manifiesto ----------
+
+    @staticmethod
+    def _segmento_vacio(archivo: str, dia: str):
+        return {
+            "archivo": archivo,
+            "dia": dia,
+            "sellado": False,
+            "bytes": 0,
+            "bytes_csv": 0,
+            "id_min": None,
+            "id_max": None,
+            "outtime_min": None,
+            "outtime_max": None,
+            "sin_outtime": 0,
+            "resumen": _resumen_vacio(),
+        }
+
+    @staticmethod
+    def _resumen_desde_json(data):
+        resumen = dict(data)
+        resumen["urgency_distribution"] = {
+            int(nivel): int(n) for nivel, n in data["urgency_distribution"].items()
+        }
+        return resumen
+
+    def _leer_manifiesto(self):
+        if not self.manifiesto_path.exists():
+            return None
+        try:
+            with self.manifiesto_path.open(encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("formato") != SEGMENTOS_FORMATO:
+                print("Advertencia: formato de manifest de observaciones desconocido; se reconstruye.")
+                return None
+            data["depurado"] = self._resumen_desde_json(data["depurado"])
+            for seg in data["segmentos"]:
+                seg["resumen"] = self._resumen_desde_json(seg["resumen"])
+            return data
+        except Exception as exc:
+            print(f"Advertencia: no se pudo leer manifest de observaciones ({exc}); se reconstruye.")
+            return None
+
+    def _reconstruir_manifiesto(self):
+        # Sin manifest: se recorre el directorio. Lo depurado antes se pierde.
+        archivos = {}
+        for p in self.path.glob("seg_*.csv*"):
+            if p.name.endswith(".tmp"):
+                continue
+            base = p.name[: -len(".gz")] if p.name.endswith(".gz") else p.name
+            # Si quedaron el .csv y el .csv.gz, el .gz ya estaba completo.
+            if base not in archivos or p.name.endswith(".gz"):
+                archivos[base] = p.name
+        if archivos:
+            print(
+                f"Advertencia: manifest de observaciones ausente; se reconstruye "
+                f"desde {len(archivos)} segmentos."
+            )
+        segmentos = []
+        siguiente = 1
+        for base in sorted(archivos):
+            nombre = archivos[base]
+            _, seq, dia = base[: -len(".csv")].split("_")
+            siguiente = max(siguiente, int(seq) + 1)
+            seg = self._segmento_vacio(nombre, dia)
+            seg["sellado"] = nombre.endswith(".gz")
+            self._recalcular(seg)
+            if seg["sellado"] and (self.path / base).exists():
+                (self.path / base).unlink()
+            segmentos.append(seg)
+        # Los compactados tienen numero mas nuevo que su contenido: se ordena por id.
+        segmentos.sort(key=lambda seg: (seg["id_min"] is None, seg["id_min"] or 0))
+        return {
+            "formato": SEGMENTOS_FORMATO,
+            "siguiente": siguiente,
+            "depurado": _resumen_vacio(),
+            "segmentos": segmentos,
+        }
+
+    def _guardar_manifiesto(self):
+        data = {
+            "formato": SEGMENTOS_FORMATO,
+            "siguiente": self._siguiente,
+            "depurado": self._depurado,
+            "segmentos": self._segmentos,
+        }
+        tmp = self.manifiesto_path.with_name(f"{self.manifiesto_path.name}.{os.getpid()}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp, self.manifiesto_path)
+
+    # ---------- lectura de segmentos ----------
+
+    def _abrir_segmento(self, seg):
+        path = self.path / seg["archivo"]
+        if seg["archivo"].endswith(".gz"):
+            return gzip.open(path, "rt", encoding="utf-8", newline="")
+        return path.open(encoding="utf-8", newline="")
+
+    def _contar_fila(self, seg, row):
+        row_id = self._to_int(row.get("id"))
+        alarm_event, alarm_unjustified_event, override_event = self._eventos_desde_fila(row)
+        _acumular(
+            seg["resumen"],
+            row_id,
+            self._to_int(row.get("nivel_referencia")),
+            alarm_event,
+            alarm_unjustified_event,
+            override_event,
+        )
+        if seg["id_min"] is None or row_id < seg["id_min"]:
+            seg["id_min"] = row_id
+        if seg["id_max"] is None or row_id > seg["id_max"]:
+            seg["id_max"] = row_id
+        outtime = self._to_float(row.get("outtime"))
+        if outtime is None:
+            seg["sin_outtime"] += 1
+            return
+        if seg["outtime_min"] is None or outtime < seg["outtime_min"]:
+            seg["outtime_min"] = outtime
+        if seg["outtime_max"] is None or outtime > seg["outtime_max"]:
+            seg["outtime_max"] = outtime
+
+    def _recalcular(self, seg):
+        # Rehace las estadisticas de un segmento leyendolo completo.
+        nuevo = self._segmento_vacio(seg["archivo"], seg["dia"])
+        nuevo["sellado"] = seg["sellado"]
+        path = self.path / seg["archivo"]
+        if path.exists():
+            with self._abrir_segmento(seg) as f:
+                for row in csv.DictReader(f):
+                    self._contar_fila(nuevo, row)
+            nuevo["bytes"] = path.stat().st_size
+            nuevo["bytes_csv"] = nuevo["bytes"] if not seg["sellado"] else seg.get("bytes_csv") or 0
+        seg.clear()
+        seg.update(nuevo)
+
+    @staticmethod
+    def _segmento_en_rango(seg, ultimo_id, hasta_id, desde, hasta) -> bool:
+        if seg["id_max"] is None or seg["id_max"] <= ultimo_id:
+            return False
+        if hasta_id is not None and seg["id_min"] > hasta_id:
+            return False
+        if desde is None and hasta is None:
+            return True
+        if seg["outtime_min"] is None:
+            return False
+        return (desde is None or seg["outtime_max"] >= desde) and (
+            hasta is None or seg["outtime_min"] <= hasta
+        )
+
+    def iterar_filas(self, desde_id=None, hasta_id=None, desde=None, hasta=None):
+        # Solo se abren los segmentos cuyo rango de ids y de outtime cruza el
+        # pedido. Si una compactacion borra el segmento que se estaba por
+        # leer, se vuelve a mirar el manifiesto desde el ultimo id entregado.
+        ultimo_id = desde_id or 0
+        while True:
+            with self._archivo_lock:
+                seg = next(
+                    (
+                        dict(s)
+                        for s in self._segmentos
+                        if self._segmento_en_rango(s, ultimo_id, hasta_id, desde, hasta)
+                    ),
+                    None,
+                )
+            if seg is None:
+                return
+            try:
+                with self._abrir_segmento(seg) as f:
+                    for row in csv.DictReader(f):
+                        row_id = self._to_int(row.get("id"))
+                        if row_id <= ultimo_id:
+                            continue
+                        if hasta_id is not None and row_id > hasta_id:
+                            return
+                        ultimo_id = row_id
+                        if self._en_ventana(row, desde, hasta):
+                            yield row
+            except FileNotFoundError:
+                continue
+            # Un segmento activo puede crecer mientras se lee; basta con que
+            # ultimo_id avance para no repetir filas en la siguiente vuelta.
+            if seg["id_max"] > ultimo_id:
+                return
+
+    # ---------- escritura ----------
+
+    @staticmethod
+    def _dia(row) -> str:
+        try:
+            ts = float(row.get("outtime")) * 60
+        except Exception:
+            ts = time.time()
+        return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y%m%d")
+
+    def _abrir(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        manifiesto = self._leer_manifiesto() or self._reconstruir_manifiesto()
+        self._siguiente = manifiesto["siguiente"]
+        self._depurado = manifiesto["depurado"]
+        self._segmentos = manifiesto["segmentos"]
+
+        # Un corte pudo dejar sin sellar (o a medio sellar) segmentos viejos.
+        abiertos = []
+        for seg in self._segmentos:
+            if seg["sellado"]:
+                sobrante = self.path / seg["archivo"][: -len(".gz")]
+                if sobrante.exists():
+                    sobrante.unlink()
+            else:
+                self._recalcular(seg)
+                abiertos.append(seg)
+        self._activo = abiertos[-1] if abiertos else None
+        # Al arrancar se sella y compacta aca mismo, antes de recibir requests.
+        self._mantenimiento()
+        self._guardar_manifiesto()
+
+        total = _resumen_vacio()
+        for resumen in [self._depurado] + [seg["resumen"] for seg in self._segmentos]:
+            _sumar_resumen(total, resumen)
+        self._cargar_resumen(total)
+        self.origen_contadores = "manifiesto"
+        self.filas_releidas = self._activo["resumen"]["observations_total"] if self._activo else 0
+
+    def _rotar(self, dia: str):
+        # Con _archivo_lock tomado. El segmento anterior queda sin sellar
+        # hasta que lo toma el hilo de mantenimiento.
+        seg = self._segmento_vacio(f"seg_{self._siguiente:06d}_{dia}.csv", dia)
+        self._siguiente += 1
+        self._segmentos.append(seg)
+        self._activo = seg
+        self._guardar_manifiesto()
+        self._pedido_mantenimiento.set()
+
+    def _sellar(self, seg):
+        # seg ya no es el activo: nadie mas escribe en el; solo se toma el lock
+        # para publicar el cambio en el manifiesto.
+        origen = self.path / seg["archivo"]
+        if seg["resumen"]["observations_total"] == 0:
+            with self._archivo_lock:
+                self._segmentos.remove(seg)
+                self._guardar_manifiesto()
+            if origen.exists():
+                origen.unlink()
+            return
+        destino = origen.with_name(f"{origen.name}.gz")
+        tmp = destino.with_name(f"{destino.name}.tmp")
+        with origen.open("rb") as f_in, gzip.open(tmp, "wb", compresslevel=6) as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.replace(tmp, destino)
+        with self._archivo_lock:
+            seg["archivo"] = destino.name
+            seg["sellado"] = True
+            seg["bytes_csv"] = origen.stat().st_size
+            seg["bytes"] = destino.stat().st_size
+            self._guardar_manifiesto()
+        origen.unlink()
+
+    @staticmethod
+    def _lineas_csv(rows):
+        # Cada fila ya formateada, para medir su tamano antes de escribirla.
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=OBS_FIELDS)
+        lineas = []
+        for row in rows:
+            writer.writerow(row)
+            lineas.append(buf.getvalue())
+            buf.seek(0)
+            buf.truncate()
+        return lineas
+
+    def _escribir_en_activo(self, rows, lineas):
+        seg = self._activo
+        path = self.path / seg["archivo"]
+        with path.open("a", encoding="utf-8", newline="") as f:
+            if seg["bytes"] == 0:
+                f.write(_CABECERA_CSV)
+            f.write("".join(lineas))
+            f.flush()
+            if self._toca_fsync():
+                os.fsync(f.fileno())
+            seg["bytes"] = seg["bytes_csv"] = os.fstat(f.fileno()).st_size
+        for row in rows:
+            self._contar_fila(seg, row)
+
+    def _escribir_filas(self, rows):
+        lineas = self._lineas_csv(rows)
+        with self._archivo_lock:
+            tanda = []
+            tanda_lineas = []
+            tanda_bytes = 0
+            for row, linea in zip(rows, lineas):
+                n = len(linea.encode("utf-8"))
+                dia = self._dia(row)
+                activo = self._activo
+                # Se mide fila por fila: un lote grande (modo buffer) no pasa
+                # de segmento_max_bytes. Una fila sola siempre entra en un
+                # segmento vacio.
+                lleno = False
+                if activo is not None:
+                    ocupado = activo["bytes"] + tanda_bytes
+                    lleno = ocupado > 0 and (ocupado + n > self._segmento_max_bytes)
+                # Filas atrasadas (dia anterior) se quedan en el segmento activo.
+                if activo is None or dia > activo["dia"] or lleno:
+                    if tanda:
+                        self._escribir_en_activo(tanda, tanda_lineas)
+                        tanda, tanda_lineas, tanda_bytes = [], [], 0
+                    self._rotar(dia if activo is None else max(dia, activo["dia"]))
+                if self._activo["bytes"] == 0 and not tanda:
+                    tanda_bytes += len(_CABECERA_CSV.encode("utf-8"))
+                tanda.append(row)
+                tanda_lineas.append(linea)
+                tanda_bytes += n
+            if tanda:
+                self._escribir_en_activo(tanda, tanda_lineas)
+
+    # ---------- retencion y compactacion ----------
+
+    def _depurar(self, seg):
+        with self._archivo_lock:
+            _sumar_resumen(self._depurado, seg["resumen"])
+            self._segmentos.remove(seg)
+            self._guardar_manifiesto()
+        path = self.path / seg["archivo"]
+        if path.exists():
+            path.unlink()
+
+    def _bucle_mantenimiento(self):
+        while True:
+            self._pedido_mantenimiento.wait()
+            if self._fin_mantenimiento.is_set():
+                return
+            self._pedido_mantenimiento.clear()
+            try:
+                self._mantenimiento()
+            except Exception as exc:
+                print(f"Advertencia: fallo el mantenimiento de segmentos de observaciones ({exc}).")
+
+    def _mantenimiento(self):
+        # Solo desde el hilo de mantenimiento (o desde _abrir, antes de
+        # lanzarlo): es el unico que sella, depura o fusiona, asi que los
+        # segmentos sellados no cambian bajo sus pies mientras los lee.
+        while True:
+            with self._archivo_lock:
+                pendiente = next(
+                    (seg for seg in self._segmentos if not seg["sellado"] and seg is not self._activo),
+                    None,
+                )
+            if pendiente is None or self._fin_mantenimiento.is_set():
+                break
+            self._sellar(pendiente)
+
+        with self._archivo_lock:
+            sellados = [seg for seg in self._segmentos if seg["sellado"]]
+            ocupado = sum(seg["bytes"] for seg in self._segmentos)
+        if self._retencion_dias > 0:
+            limite = time.time() / 60 - self._retencion_dias * 1440
+            for seg in list(sellados):
+                if seg["outtime_max"] is not None and seg["outtime_max"] < limite:
+                    ocupado -= seg["bytes"]
+                    self._depurar(seg)
+                    sellados.remove(seg)
+        if self._retencion_bytes > 0:
+            while sellados and ocupado > self._retencion_bytes:
+                seg = sellados.pop(0)
+                ocupado -= seg["bytes"]
+                self._depurar(seg)
+        if self._compactar:
+            self._compactar_sellados()
+
+    def _compactar_sellados(self):
+        # Fusiona corridas de segmentos sellados contiguos de menos de 1/4 del
+        # tamano maximo, mientras la fusion no pase el maximo.
+        chico = self._segmento_max_bytes // 4
+        grupos = []
+        grupo = []
+        acumulado = 0
+        with self._archivo_lock:
+            segmentos = list(self._segmentos)
+        for seg in segmentos:
+            es_chico = seg["sellado"] and seg["bytes_csv"] < chico
+            if es_chico and acumulado + seg["bytes_csv"] <= self._segmento_max_bytes:
+                grupo.append(seg)
+                acumulado += seg["bytes_csv"]
+                continue
+            if len(grupo) > 1:
+                grupos.append(grupo)
+            grupo, acumulado = ([seg], seg["bytes_csv"]) if es_chico else ([], 0)
+        if len(grupo) > 1:
+            grupos.append(grupo)
+        for grupo in grupos:
+            if self._fin_mantenimiento.is_set():
+                return
+            self._fusionar(grupo)
+
+    def _fusionar(self, grupo):
+        # La fusion se escribe sin el lock; solo el reemplazo en el manifiesto
+        # lo toma.
+        with self._archivo_lock:
+            fusion = self._segmento_vacio(
+                f"seg_{self._siguiente:06d}_{grupo[0]['dia']}.csv.gz", grupo[0]["dia"]
+            )
+            self._siguiente += 1
+        fusion["sellado"] = True
+        destino = self.path / fusion["archivo"]
+        tmp = destino.with_name(f"{destino.name}.tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8", newline="", compresslevel=6) as f_out:
+            writer = csv.DictWriter(f_out, fieldnames=OBS_FIELDS)
+            writer.writeheader()
+            for seg in grupo:
+                with self._abrir_segmento(seg) as f_in:
+                    for row in csv.DictReader(f_in):
+                        writer.writerow(row)
+                        self._contar_fila(fusion, row)
+            fusion["bytes_csv"] = sum(seg["bytes_csv"] for seg in grupo)
+        os.replace(tmp, destino)
+        fusion["bytes"] = destino.stat().st_size
+
+        with self._archivo_lock:
+            pos = self._segmentos.index(grupo[0])
+            for seg in grupo:
+                self._segmentos.remove(seg)
+            self._segmentos.insert(pos, fusion)
+            self._guardar_manifiesto()
+        for seg in grupo:
+            (self.path / seg["archivo"]).unlink()
+
+    # ---------- interfaz del store ----------
+
+    def cerrar(self):
+        super().cerrar()
+        # Lo que quede sin sellar se sella al volver a abrir.
+        self._fin_mantenimiento.set()
+        self._pedido_mantenimiento.set()
+        self._hilo_mantenimiento.join(timeout=10)
+
+    def existe(self) -> bool:
+        with self._archivo_lock:
+            return any(seg["resumen"]["observations_total"] for seg in self._segmentos)
+
+    def version(self) -> str:
+        with self._lock:
+            return f"segmentos-{self.last_id}-{self._depurado['observations_total']}"
+
+    def _resumen_ventana(self, desde, hasta):
+        resumen = _resumen_vacio()
+        with self._archivo_lock:
+            segmentos = [dict(seg) for seg in self._segmentos]
+        for seg in segmentos:
+            if seg["outtime_min"] is None:
+                continue
+            if (desde is not None and seg["outtime_max"] < desde) or (
+                hasta is not None and seg["outtime_min"] > hasta
+            ):
+                continue
+            # Segmento entero dentro de la ventana: alcanza con el manifiesto.
+            if (
+                seg["sellado"]
+                and seg["sin_outtime"] == 0
+                and (desde is None or seg["outtime_min"] >= desde)
+                and (hasta is None or seg["outtime_max"] <= hasta)
+            ):
+                _sumar_resumen(resumen, seg["resumen"])
+                continue
+            try:
+                with self._abrir_segmento(seg) as f:
+                    filas = list(csv.DictReader(f))
+            except FileNotFoundError:
+                # Compactado entre la copia y la lectura: se usa el vigente.
+                return self._resumen_ventana(desde, hasta)
+            for row in filas:
+                if not self._en_ventana(row, desde, hasta):
+                    continue
+                alarm_event, alarm_unjustified_event, override_event = self._eventos_desde_fila(row)
+                _acumular(
+                    resumen,
+                    self._to_int(row.get("id")),
+                    self._to_int(row.get("nivel_referencia")),
+                    alarm_event,
+                    alarm_unjustified_event,
+                    override_event,
+                )
+        resumen["urgency_distribution"] = dict(sorted(resumen["urgency_distribution"].items()))
+        return resumen
+
+
+STORES = {
+    ObservacionStoreCSV.backend: ObservacionStoreCSV,
+    ObservacionStoreSQLite.backend: ObservacionStoreSQLite,
+    ObservacionStoreSegmentos.backend: ObservacionStoreSegmentos,
+}
+
+
+def crear_store(backend: str, path: Path, **opciones):
+    if backend not in STORES:
+        raise ValueError(
+            f"Backend de observaciones desconocido: {backend!r}. "
+            f"Opciones: {', '.join(BACKENDS)}"
+        )
+    return STORES[backend](path, **opciones)
+
+
+# ---------- logs por nodo ----------
+
+# Con varias replicas cada nodo escribe su propio log:
+# data/ficha_observacion.csv -> data/nodos/nodo_003/ficha_observacion.csv
+def ruta_nodo(path: Path, nodo: int) -> Path:
+    return path.parent / "nodos" / f"nodo_{int(nodo):03d}" / path.name
+
+
+def detectar_backend(path: Path) -> str:
+    if path.is_dir():
+        return "segmentos"
+    if path.suffix in (".sqlite3", ".sqlite", ".db"):
+        return "sqlite"
+    return "csv"
+
+
+def logs_de_nodos(raiz: Path):
+    # Los logs de observaciones bajo raiz/nodo_*/, de cualquier backend.
+    logs = []
+    for dir_nodo in sorted(raiz.glob("nodo_*")):
+        for hijo in sorted(dir_nodo.iterdir()):
+            if hijo.is_dir():
+                if (hijo / "manifest.json").exists():
+                    logs.append(hijo)
+            elif hijo.suffix == ".csv" and "_legacy_" not in hijo.name:
+                logs.append(hijo)
+            elif hijo.suffix in (".sqlite3", ".sqlite", ".db"):
+                logs.append(hijo)
+    return logs
+
+
+def iterar_log(path: Path, backend: str = None):
+    # Lee un log en orden de id sin abrir el store: no toma locks, no guarda
+    # checkpoints ni sella/compacta segmentos de un nodo que puede seguir vivo.
+    backend = backend or detectar_backend(path)
+    if backend == "csv":
+        if not path.exists() or path.stat().st_size == 0:
+            return
+        with path.open("rb") as raw:
+            header = raw.readline().decode("utf-8").strip().split(",")
+            if header != OBS_FIELDS:
+                raise ValueError(f"{path}: encabezado distinto de OBS_FIELDS.")
+            fin = os.fstat(raw.fileno()).st_size
+            for _, row in ObservacionStoreCSV._leer_filas(raw, 0, fin):
+                yield row
+    elif backend == "sqlite":
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            cursor = conn.execute(f"SELECT {', '.join(OBS_FIELDS)} FROM observaciones ORDER BY id")
+            for valores in cursor:
+                row = dict(zip(OBS_FIELDS, valores))
+                if row["nivel_sistema"] is None:
+                    row["nivel_sistema"] = ""
+                yield row
+        finally:
+            conn.close()
+    elif backend == "segmentos":
+        with (path / "manifest.json").open(encoding="utf-8") as f:
+            segmentos = json.load(f)["segmentos"]
+        # El activo puede figurar vacio en el manifiesto: va al final.
+        segmentos.sort(key=lambda seg: (seg["id_min"] is None, seg["id_min"] or 0))
+        for seg in segmentos:
+            archivo = path / seg["archivo"]
+            if seg["archivo"].endswith(".gz"):
+                f = gzip.open(archivo, "rt", encoding="utf-8", newline="")
+            else:
+                f = archivo.open(encoding="utf-8", newline="")
+            with f:
+                yield from csv.DictReader(f)
+    else:
+        raise ValueError(
+            f"Backend de observaciones desconocido: {backend!r}. "
+            f"Opciones: {', '.join(BACKENDS)}"
+        )
+
+
+def fusionar_logs(fuentes, salida: Path = None):
+    # Un solo recorrido: heapq.merge de los logs (cada uno ya ordenado por id)
+    # escribe el export global y recalcula los indicadores a la vez. Con ids
+    # snowflake el orden por id es el orden temporal entre nodos.
+    fuentes = [Path(f) for f in fuentes]
+    total = _resumen_vacio()
+    por_fuente = {str(f): _resumen_vacio() for f in fuentes}
+    repetidos = 0
+
+    def etiquetadas(fuente):
+        for row in iterar_log(fuente):
+            yield ObservacionStoreCSV._to_int(row.get("id")), str(fuente), row
+
+    writer = None
+    tmp = None
+    f = None
+    if salida is not None:
+        salida = Path(salida)
+        salida.parent.mkdir(parents=True, exist_ok=True)
+        tmp = salida.with_name(f"{salida.name}.{os.getpid()}.tmp")
+        if salida.suffix == ".gz":
+            f = gzip.open(tmp, "wt", encoding="utf-8", newline="")
+        else:
+            f = tmp.open("w", encoding="utf-8", newline="")
+        writer = csv.DictWriter(f, fieldnames=OBS_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+    try:
+        anterior = None
+        for row_id, fuente, row in heapq.merge(*(etiquetadas(x) for x in fuentes), key=lambda t: t[0]):
+            # Logs viejos con ids secuenciales repiten ids entre nodos: se
+            # conservan todas las filas, solo se informa.
+            if row_id == anterior:
+                repetidos += 1
+            anterior = row_id
+            eventos = ObservacionStoreCSV._eventos_desde_fila(row)
+            nivel = ObservacionStoreCSV._to_int(row.get("nivel_referencia"))
+            _acumular(total, row_id, nivel, *eventos)
+            _acumular(por_fuente[fuente], row_id, nivel, *eventos)
+            if writer is not None:
+                writer.writerow(row)
+        if f is not None:
+            f.close()
+            os.replace(tmp, salida)
+    except BaseException:
+        if f is not None:
+            f.close()
+            tmp.unlink(missing_ok=True)
+        raise
+
+    for resumen in [total, *por_fuente.values()]:
+        resumen["urgency_distribution"] = dict(sorted(resumen["urgency_distribution"].items()))
+    return {"resumen": total, "fuentes": por_fuente, "ids_repetidos": repetidos}
@@ -0,0 +1,149 @@
+# src/perfilado.py
+import cProfile
+import marshal
+import pstats
+import time
+from threading import Lock
+
+
+ORDENES = ("acumulado", "propio", "llamadas")
+
+
+# Perfilado con cProfile de requests reales, por muestreo: uno de cada N
+# (cada_n) y/o los K siguientes (siguientes; al agotarse, si no hay cada_n, se
+# apaga solo). Las muestras se suman en un pstats.Stats en memoria.
+# Apagado cuesta leer `activo`. Se perfila un request a la vez: cProfile no
+# admite dos perfiles activos (3.12+), asi que si toca muestra mientras otra
+# esta en curso se cuenta como omitida.
+class PerfiladorMuestreo:
+    def __init__(self):
+        self.activo = False
+        self._lock = Lock()
+        self._en_curso = Lock()
+        self._cada_n = 0
+        self._restantes = 0
+        self._vistos = 0
+        self._stats = None
+        self.muestras = 0
+        self.omitidas = 0
+        self.segundos_perfilados = 0.0
+        self.desde = None
+
+    def iniciar(self, cada_n: int = 0, siguientes: int = 0, limpiar: bool = True):
+        cada_n = max(0, int(cada_n))
+        siguientes = max(0, int(siguientes))
+        if not cada_n and not siguientes:
+            raise ValueError("Indique cada_n y/o siguientes mayores que 0.")
+        with self._lock:
+            if limpiar:
+                self._stats = None
+                self.muestras = 0
+                self.omitidas = 0
+                self.segundos_perfilados = 0.0
+                self.desde = time.time()
+            self._cada_n = cada_n
+            self._restantes = siguientes
+            self._vistos = 0
+            self.activo = True
+
+    def detener(self):
+        with self._lock:
+            self.activo = False
+            self._restantes = 0
+
+    def estado(self):
+        with self._lock:
+            return {
+                "activo": self.activo,
+                "cada_n": self._cada_n,
+                "siguientes_restantes": self._restantes,
+                "requests_vistos": self._vistos,
+                "muestras": self.muestras,
+                "omitidas": self.omitidas,
+                "segundos_perfilados": round(self.segundos_perfilados, 6),
+                "funciones": len(self._stats.stats) if self._stats is not None else 0,
+                "desde": self.desde,
+            }
+
+    def _tomar_turno(self) -> bool:
+        with self._lock:
+            if not self.activo:
+                return False
+            self._vistos += 1
+            toca = self._restantes > 0 or (self._cada_n and self._vistos % self._cada_n == 0)
+            if not toca:
+                return False
+            if not self._en_curso.acquire(blocking=False):
+                self.omitidas += 1
+                return False
+            if self._restantes > 0:
+                self._restantes -= 1
+                if not self._restantes and not self._cada_n:
+                    self.activo = False
+            return True
+
+    def perfilar(self, funcion, *args, **kwargs):
+        if not self._tomar_turno():
+            return funcion(*args, **kwargs)
+        perfil = cProfile.Profile()
+        try:
+            try:
+                perfil.enable()
+            except (RuntimeError, ValueError) as exc:
+                # Otro perfilador/depurador activo en el proceso.
+                print(f"Advertencia: no se pudo perfilar el request ({exc}).")
+                with self._lock:
+                    self.omitidas += 1
+                return funcion(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                perfil.disable()
+                self._acumular(perfil, time.perf_counter() - t0)
+        finally:
+            self._en_curso.release()
+
+    def _acumular(self, perfil, segundos: float):
+        try:
+            stats = pstats.Stats(perfil)
+        except TypeError:
+            # Perfil vacio (pstats no construye Stats sin funciones).
+            return
+        with self._lock:
+            if self._stats is None:
+                self._stats = stats
+            else:
+                self._stats.add(stats)
+            self.muestras += 1
+            self.segundos_perfilados += segundos
+
+    def top(self, n: int = 30, orden: str = "acumulado", patron: str = None):
+        if orden not in ORDENES:
+            raise ValueError(f"Orden desconocido: {orden!r}. Opciones: {', '.join(ORDENES)}")
+        with self._lock:
+            datos = dict(self._stats.stats) if self._stats is not None else {}
+            muestras = self.muestras
+        filas = []
+        for (archivo, linea, funcion), (primitivas, llamadas, propio, acumulado, _) in datos.items():
+            nombre = f"{archivo}:{linea}({funcion})"
+            if patron and patron not in nombre:
+                continue
+            filas.append(
+                {
+                    "funcion": nombre,
+                    "llamadas": llamadas,
+                    "llamadas_primitivas": primitivas,
+                    "propio_s": round(propio, 6),
+                    "acumulado_s": round(acumulado, 6),
+                    "acumulado_por_muestra_us": round(acumulado / muestras * 1e6, 2) if muestras else 0.0,
+                }
+            )
+        clave = {"acumulado": "acumulado_s", "propio": "propio_s", "llamadas": "llamadas"}[orden]
+        filas.sort(key=lambda fila: fila[clave], reverse=True)
+        return filas[: max(0, int(n))]
+
+    def volcar(self) -> bytes:
+        # Mismo formato que pstats.Stats.dump_stats: se abre con pstats.Stats(archivo).
+        with self._lock:
+            return marshal.dumps(self._stats.stats if self._stats is not None else {})
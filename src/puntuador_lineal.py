@@ -0,0 +1,163 @@
+# src/puntuador_lineal.py
+import hashlib
+import json
+import math
+import os
+import re
+from pathlib import Path
+
+
+# Subir al cambiar la estructura del artefacto.
+FORMATO_PUNTUADOR = 1
+
+
+def sha256_archivo(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def ruta_puntuador(bundle_path) -> Path:
+    # models/model_bundle.joblib -> models/model_scorer.json
+    bundle_path = Path(bundle_path)
+    return bundle_path.with_name(bundle_path.stem.replace("bundle", "scorer") + ".json")
+
+
+def _validar(vectorizer, clf):
+    # Solo lo que el puntuador reproduce tal cual: analizador de palabras por
+    # token_pattern, sin stop words, preprocesador ni tokenizador propios.
+    no_soportado = [
+        nombre
+        for nombre, ok in (
+            ("analyzer", vectorizer.analyzer == "word"),
+            ("tokenizer", vectorizer.tokenizer is None),
+            ("preprocessor", vectorizer.preprocessor is None),
+            ("stop_words", vectorizer.stop_words is None),
+            ("strip_accents", vectorizer.strip_accents is None),
+            ("binary", not vectorizer.binary),
+            ("norm", vectorizer.norm in ("l1", "l2", None)),
+            ("coef_", getattr(clf, "coef_", None) is not None),
+        )
+        if not ok
+    ]
+    if no_soportado:
+        raise ValueError(f"Configuracion no soportada por el puntuador lineal: {', '.join(no_soportado)}")
+
+
+def exportar_puntuador(vectorizer, clf, path, meta=None):
+    # Tabla n-grama -> [idf, peso clase 1, peso clase 2, ...] en el orden de
+    # columnas del vectorizer, mas los interceptos. No necesita sklearn para
+    # cargarse.
+    _validar(vectorizer, clf)
+    idf = vectorizer.idf_.tolist() if vectorizer.use_idf else None
+    coef = clf.coef_.tolist()
+    vocabulario = sorted(vectorizer.vocabulary_.items(), key=lambda item: item[1])
+    datos = {
+        "formato": FORMATO_PUNTUADOR,
+        "token_pattern": vectorizer.token_pattern,
+        "lowercase": bool(vectorizer.lowercase),
+        "ngram_range": list(vectorizer.ngram_range),
+        "sublinear_tf": bool(vectorizer.sublinear_tf),
+        "use_idf": bool(vectorizer.use_idf),
+        "norm": vectorizer.norm,
+        "clases": clf.classes_.tolist(),
+        "intercepts": clf.intercept_.tolist(),
+        "ngramas": {
+            ngrama: [idf[col] if idf is not None else 1.0] + [fila[col] for fila in coef]
+            for ngrama, col in vocabulario
+        },
+        "meta": meta or {},
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+    return path
+
+
+# Mismas operaciones y en el mismo orden que TfidfVectorizer.transform +
+# decision_function (indices de columna ordenados, log(tf) + 1, * idf,
+# normalizacion, producto contra coef_ y + intercept_): da las mismas
+# predicciones que sklearn. Para un texto corto son unas decenas de
+# operaciones contra el costo fijo de armar matrices dispersas.
+class PuntuadorLineal:
+    def __init__(self, datos):
+        if datos.get("formato") != FORMATO_PUNTUADOR:
+            raise ValueError(f"Formato de puntuador no soportado: {datos.get('formato')!r}")
+        self._patron = re.compile(datos["token_pattern"])
+        self._minusculas = datos["lowercase"]
+        self._min_n, self._max_n = datos["ngram_range"]
+        self._sublineal = datos["sublinear_tf"]
+        self._norma = datos["norm"]
+        self.clases = list(datos["clases"])
+        self._interceptos = list(datos["intercepts"])
+        self._tabla = {
+            ngrama: (col, fila[0], tuple(fila[1:])) for col, (ngrama, fila) in enumerate(datos["ngramas"].items())
+        }
+        self.meta = datos.get("meta") or {}
+
+    @classmethod
+    def cargar(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def __len__(self):
+        return len(self._tabla)
+
+    def _ngramas(self, texto: str):
+        tokens = self._patron.findall(texto.lower() if self._minusculas else texto)
+        if self._min_n == 1:
+            yield from tokens
+        for n in range(max(2, self._min_n), self._max_n + 1):
+            for i in range(len(tokens) - n + 1):
+                yield " ".join(tokens[i : i + n])
+
+    def decision(self, texto: str):
+        conteos = {}
+        for ngrama in self._ngramas(texto):
+            if ngrama in self._tabla:
+                conteos[ngrama] = conteos.get(ngrama, 0) + 1
+        valores = []
+        for ngrama, n in conteos.items():
+            col, idf, pesos = self._tabla[ngrama]
+            tf = math.log(n) + 1 if self._sublineal else float(n)
+            valores.append((col, tf * idf, pesos))
+        valores.sort(key=lambda v: v[0])
+
+        if self._norma == "l2":
+            norma = 0.0
+            for _, valor, _ in valores:
+                norma += valor * valor
+            norma = math.sqrt(norma)
+        elif self._norma == "l1":
+            norma = 0.0
+            for _, valor, _ in valores:
+                norma += abs(valor)
+        else:
+            norma = 1.0
+
+        puntajes = [0.0] * len(self._interceptos)
+        for _, valor, pesos in valores:
+            if norma:
+                valor = valor / norma
+            for k, peso in enumerate(pesos):
+                puntajes[k] += valor * peso
+        return [p + b for p, b in zip(puntajes, self._interceptos)]
+
+    def predecir(self, texto: str):
+        puntajes = self.decision(texto)
+        if len(puntajes) == 1:
+            # Binario: una sola columna de coef_, positiva = segunda clase.
+            return self.clases[1] if puntajes[0] > 0 else self.clases[0]
+        mejor = 0
+        for k in range(1, len(puntajes)):
+            if puntajes[k] > puntajes[mejor]:
+                mejor = k
+        return self.clases[mejor]
+
+    def predecir_lote(self, textos):
+        return [self.predecir(texto) for texto in textos]
@@ -0,0 +1,77 @@
+# src/reglas_combinacion.py
+from collections import Counter
+
+
+# Reglas de combinacion indexadas por sus dos sintomas mas raros (los que
+# aparecen en menos reglas). Una regla solo se evalua si ambos estan presentes,
+# asi que el costo por request depende de cuantos sintomas se detectaron y no
+# del total de reglas. Cada candidata se confirma con una prueba de mascara.
+class MotorReglas:
+    def __init__(self, reglas, sintoma_id):
+        self.reglas = []
+        self.omitidas = []
+        self._indice = {}
+        self._todas = []
+
+        validas = []
+        for pos, regla in enumerate(reglas):
+            regla_id = regla.get("id") or f"regla_{pos + 1}"
+            if not regla["sintomas"]:
+                self.omitidas.append(regla_id)
+                print(f"Advertencia: regla {regla_id} sin sintomas; no se aplicara.")
+                continue
+            faltantes = set(regla["sintomas"]) - sintoma_id.keys()
+            if faltantes:
+                self.omitidas.append(regla_id)
+                print(
+                    f"Advertencia: regla {regla_id} con sintomas fuera del catalogo "
+                    f"({sorted(faltantes)}); no se aplicara."
+                )
+                continue
+            ids = sorted(sintoma_id[s] for s in regla["sintomas"])
+            validas.append((pos, regla_id, ids, int(regla["nivel"])))
+
+        frecuencia = Counter(i for _, _, ids, _ in validas for i in ids)
+        for pos, regla_id, ids, nivel in validas:
+            mascara = 0
+            for i in ids:
+                mascara |= 1 << i
+            clave = tuple(sorted(sorted(ids, key=lambda i: (frecuencia[i], i))[:2]))
+            entrada = (mascara, nivel, pos, regla_id)
+            self._indice.setdefault(clave, []).append(entrada)
+            self._todas.append(entrada)
+            self.reglas.append({"id": regla_id, "mascara": mascara, "nivel": nivel})
+
+    def __len__(self):
+        return len(self.reglas)
+
+    def _candidatas(self, mascara):
+        ids = []
+        resto = mascara
+        while resto:
+            bajo = resto & -resto
+            resto ^= bajo
+            ids.append(bajo.bit_length() - 1)
+
+        # Con muchos sintomas y pocas reglas sale mas barato probarlas todas.
+        if len(ids) * (len(ids) + 1) // 2 >= len(self._todas):
+            yield from self._todas
+            return
+
+        indice = self._indice
+        for x, i in enumerate(ids):
+            yield from indice.get((i,), ())
+            for j in ids[x + 1 :]:
+                yield from indice.get((i, j), ())
+
+    def evaluar(self, mascara):
+        nivel = 0
+        activadas = []
+        for regla_mascara, regla_nivel, pos, regla_id in self._candidatas(mascara):
+            if mascara & regla_mascara == regla_mascara:
+                activadas.append((pos, regla_id))
+                if regla_nivel > nivel:
+                    nivel = regla_nivel
+        # Reportadas en el orden en que se definieron las reglas.
+        activadas.sort()
+        return nivel, [regla_id for _, regla_id in activadas]
@@ -3,6 +3,7 @@ import argparse
 import csv
 import hashlib
 import json
+import os
 from collections import Counter
 from datetime import datetime, timezone
 from pathlib import Path
@@ -16,6 +17,7 @@ from sklearn.model_selection import StratifiedKFold, train_test_split
 
 from catalogo_sintomas import CATALOGO_SINTOMAS
 from nlp_extractor import _normalizar
+from puntuador_lineal import PuntuadorLineal, exportar_puntuador, ruta_puntuador, sha256_archivo
 
 
 BASE_DIR = Path(__file__).resolve().parents[1]
@@ -190,6 +192,29 @@ def entrenar_final(textos, y, random_state=42):
     return vectorizer, clf
 
 
+def exportar_y_verificar_puntuador(vectorizer, clf, textos, scorer_path, model_path, meta):
+    # El API usa este artefacto en lugar de sklearn solo si coincide con el
+    # bundle (bundle_sha256) y da las mismas predicciones.
+    meta_scorer = {
+        "bundle_sha256": sha256_archivo(model_path),
+        "trained_at_utc": meta["trained_at_utc"],
+        "dataset_sha256": meta["dataset_sha256"],
+        "sklearn_version": meta["sklearn_version"],
+        "n_samples": meta["n_samples"],
+    }
+    exportar_puntuador(vectorizer, clf, scorer_path, meta=meta_scorer)
+    puntuador = PuntuadorLineal.cargar(scorer_path)
+    esperadas = [int(p) for p in clf.predict(vectorizer.transform(textos))]
+    obtenidas = puntuador.predecir_lote(textos)
+    distintas = sum(1 for a, b in zip(esperadas, obtenidas) if a != b)
+    if distintas:
+        scorer_path.unlink()
+        raise ValueError(
+            f"El puntuador lineal difiere de sklearn en {distintas}/{len(textos)} textos; no se exporta."
+        )
+    return {"path": str(scorer_path.resolve()), "ngramas": len(puntuador), "textos_verificados": len(textos)}
+
+
 def guardar_reporte_json(path, payload):
     path.parent.mkdir(parents=True, exist_ok=True)
     with path.open("w", encoding="utf-8", newline="\n") as f:
@@ -208,6 +233,12 @@ def main():
         default=str(DEFAULT_REPORT_PATH),
         help="Ruta para guardar reporte JSON de entrenamiento.",
     )
+    parser.add_argument(
+        "--scorer",
+        default=None,
+        help="Ruta del puntuador lineal sin sklearn para el API (por defecto junto al modelo, "
+        "model_bundle.joblib -> model_scorer.json; vacio para no exportarlo).",
+    )
     args = parser.parse_args()
 
     dataset_path = Path(args.dataset)
@@ -299,7 +330,22 @@ def main():
             "sklearn_version": sklearn_version,
         },
     }
-    joblib.dump(bundle, model_path)
+    # Escritura atomica: un API que vigila el archivo nunca lee un bundle a medias.
+    tmp_path = model_path.with_name(model_path.name + ".tmp")
+    joblib.dump(bundle, tmp_path)
+    os.replace(tmp_path, model_path)
+
+    puntuador_info = None
+    scorer_path = ruta_puntuador(model_path) if args.scorer is None else Path(args.scorer)
+    if args.scorer == "":
+        scorer_path = None
+    if scorer_path is not None:
+        try:
+            puntuador_info = exportar_y_verificar_puntuador(
+                vectorizer, clf, textos, scorer_path, model_path, bundle["meta"]
+            )
+        except ValueError as exc:
+            print(f"Advertencia: {exc}")
 
     reporte_payload = {
         "trained_at_utc": trained_at,
@@ -322,12 +368,18 @@ def main():
         },
         "cv": metricas_cv,
         "model_path": str(model_path.resolve()),
+        "scorer": puntuador_info,
         "catalog_size": len(CATALOGO_SINTOMAS),
         "sklearn_version": sklearn_version,
     }
     guardar_reporte_json(report_path, reporte_payload)
 
     print(f"Modelo guardado en: {model_path}")
+    if puntuador_info is not None:
+        print(
+            f"Puntuador lineal guardado en: {scorer_path} "
+            f"({puntuador_info['ngramas']} n-gramas, {puntuador_info['textos_verificados']} textos verificados)"
+        )
     print(f"Reporte JSON guardado en: {report_path}")
     print("Entrenamiento completado.")
 
@@ -4,7 +4,7 @@ from pathlib import Path
 from typing import Dict, List, Optional, Set, Tuple
 
 from api import TriageRequest, analizar
-from nlp_extractor import SintomaExtractor, _normalizar
+from nlp_extractor import MOTOR_POR_DEFECTO, MOTORES, SintomaExtractor, _normalizar
 
 
 def _resolve_default_cases_path() -> Path:
@@ -53,8 +53,10 @@ def evaluar(
     casos: List[Dict],
     strict: bool = False,
     max_fallos: int = 25,
+    motor: str = MOTOR_POR_DEFECTO,
+    procesos: int = 1,
 ) -> int:
-    extractor = SintomaExtractor()
+    extractor = SintomaExtractor(motor=motor)
 
     total = len(casos)
     if total == 0:
@@ -71,13 +73,15 @@ def evaluar(
     fallos_extractor = []
     fallos_urgencia = []
 
-    for caso in casos:
+    detectados_por_caso = extractor.extraer_lote(
+        (caso["texto"] for caso in casos), procesos=procesos
+    )
+
+    for caso, detectados in zip(casos, detectados_por_caso):
         texto = caso["texto"]
         esperados = caso["esperados"]
         urg_esperada = caso["urgencia_reglas"]
 
-        detectados = extractor.extraer(texto)
-
         expected_norm = _norm_set(esperados)
         detected_norm = _norm_set(detectados)
 
@@ -147,6 +151,7 @@ def evaluar(
         f"({tasa_sintoma:.2f}%)"
     )
     print(f"Modo extractor estricto: {'si' if strict else 'no'}")
+    print(f"Motor extractor: {extractor.motor}")
 
     if fallos_extractor:
         print("\n=== Fallos extractor (primeros) ===")
@@ -192,6 +197,18 @@ def main() -> int:
         default=25,
         help="Numero maximo de fallos a imprimir por bloque.",
     )
+    parser.add_argument(
+        "--motor",
+        choices=sorted(MOTORES),
+        default=MOTOR_POR_DEFECTO,
+        help="Motor de busqueda de variantes del extractor.",
+    )
+    parser.add_argument(
+        "--procesos",
+        type=int,
+        default=1,
+        help="Procesos para extraer los casos en lote (0 = todos los nucleos).",
+    )
     args = parser.parse_args()
 
     path = Path(args.cases)
@@ -200,7 +217,13 @@ def main() -> int:
         return 1
 
     casos = cargar_casos(path)
-    return evaluar(casos=casos, strict=args.strict, max_fallos=args.max_fallos)
+    return evaluar(
+        casos=casos,
+        strict=args.strict,
+        max_fallos=args.max_fallos,
+        motor=args.motor,
+        procesos=args.procesos or None,
+    )
 
 
 if __name__ == "__main__":
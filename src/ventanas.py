@@ -0,0 +1,134 @@
+# src/ventanas.py
+import time
+from collections import Counter
+from threading import Lock
+
+
+_CAMPOS = (
+    "observations_total",
+    "alarmas",
+    "alarmas_injustificadas",
+    "overrides",
+    "ml_evaluados",
+    "ml_desacuerdos",
+)
+_UNIDADES_S = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_ventanas(texto: str):
+    # "5m,1h,24h" -> [("5m", 300), ("1h", 3600), ("24h", 86400)]. Sin sufijo
+    # son segundos. El nombre es el que se configuro (asi sale en
+    # /observaciones y /metrics); si dos dan la misma duracion queda el primero.
+    ventanas = {}
+    for parte in texto.split(","):
+        parte = parte.strip().lower()
+        if not parte:
+            continue
+        factor = _UNIDADES_S.get(parte[-1])
+        valor = float(parte[:-1] if factor else parte) * (factor or 1)
+        if valor <= 0:
+            raise ValueError(f"Ventana invalida: {parte!r}")
+        ventanas.setdefault(int(valor), parte)
+    return [(nombre, segundos) for segundos, nombre in sorted(ventanas.items())]
+
+
+def nombre_ventana(segundos: int) -> str:
+    for sufijo, factor in (("d", 86400), ("h", 3600), ("m", 60)):
+        if segundos % factor == 0:
+            return f"{segundos // factor}{sufijo}"
+    return f"{segundos}s"
+
+
+# Agregados por ventana deslizante en memoria fija: cada ventana es un anillo
+# de `buckets` cubetas de ventana/buckets segundos. Registrar toca una cubeta
+# por ventana (O(1)); consultar suma las cubetas vigentes (O(buckets)). La
+# ventana efectiva esta redondeada a la resolucion de una cubeta.
+class _Anillo:
+    def __init__(self, nombre: str, segundos: int, buckets: int):
+        self.nombre = nombre
+        self.segundos = segundos
+        self.buckets = buckets
+        self.ancho_s = segundos / buckets
+        self._marcas = [-1] * buckets
+        self._cubetas = [self._cubeta_vacia() for _ in range(buckets)]
+
+    @staticmethod
+    def _cubeta_vacia():
+        cubeta = dict.fromkeys(_CAMPOS, 0)
+        cubeta["niveles"] = Counter()
+        return cubeta
+
+    def _cubeta(self, ahora: float):
+        n = int(ahora // self.ancho_s)
+        pos = n % self.buckets
+        cubeta = self._cubetas[pos]
+        if self._marcas[pos] != n:
+            # Cubeta de una vuelta anterior del anillo: se recicla.
+            self._marcas[pos] = n
+            for campo in _CAMPOS:
+                cubeta[campo] = 0
+            cubeta["niveles"].clear()
+        return cubeta
+
+    def registrar(self, ahora, nivel, alarma, injustificada, override, ml_evaluado, ml_desacuerdo, nueva=True):
+        cubeta = self._cubeta(ahora)
+        if nueva:
+            cubeta["observations_total"] += 1
+            cubeta["niveles"][nivel] += 1
+        cubeta["alarmas"] += alarma
+        cubeta["alarmas_injustificadas"] += injustificada
+        cubeta["overrides"] += override
+        cubeta["ml_evaluados"] += ml_evaluado
+        cubeta["ml_desacuerdos"] += ml_desacuerdo
+
+    def sumar(self, ahora: float):
+        desde = int(ahora // self.ancho_s) - self.buckets
+        total = dict.fromkeys(_CAMPOS, 0)
+        niveles = Counter()
+        for marca, cubeta in zip(self._marcas, self._cubetas):
+            if marca > desde:
+                for campo in _CAMPOS:
+                    total[campo] += cubeta[campo]
+                niveles.update(cubeta["niveles"])
+        total["urgency_distribution"] = dict(sorted(niveles.items()))
+        return total
+
+
+class VentanasDeslizantes:
+    def __init__(self, ventanas_s, buckets: int = 60):
+        # ventanas_s: pares (nombre, segundos) de parse_ventanas, o segundos
+        # sueltos (se nombran con nombre_ventana).
+        buckets = max(1, int(buckets))
+        pares = {}
+        for ventana in ventanas_s:
+            nombre, segundos = ventana if isinstance(ventana, tuple) else (nombre_ventana(int(ventana)), ventana)
+            pares.setdefault(int(segundos), nombre)
+        self._anillos = [_Anillo(nombre, segundos, buckets) for segundos, nombre in sorted(pares.items())]
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._anillos)
+
+    def registrar(
+        self, nivel_referencia: int, alarma: int, injustificada: int, override: int, urgencia_ml=None, nueva=True
+    ):
+        # nueva=False: completa una observacion ya contada (prediccion ML
+        # diferida); suma sus eventos sin contarla otra vez.
+        ml_evaluado = int(urgencia_ml is not None)
+        ml_desacuerdo = int(ml_evaluado and int(urgencia_ml) != int(nivel_referencia))
+        ahora = time.monotonic()
+        with self._lock:
+            for anillo in self._anillos:
+                anillo.registrar(
+                    ahora, int(nivel_referencia), alarma, injustificada, override, ml_evaluado, ml_desacuerdo, nueva
+                )
+
+    def resumen(self):
+        ahora = time.monotonic()
+        with self._lock:
+            return {
+                anillo.nombre: dict(
+                    anillo.sumar(ahora), ventana_s=anillo.segundos, resolucion_s=anillo.ancho_s
+                )
+                for anillo in self._anillos
+            }